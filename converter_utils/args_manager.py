@@ -62,7 +62,17 @@ class ArgsManager(object):
         
         parser.add_argument("--ignore_ifc_type",
                             action='store',
-                            help="Don't include specific ifc types",
+                            help="""Don't include specific ifc types (and their subtypes), with their children.
+                            --ignore_ifc_type [IfcSpace,IfcOpeningElement]""",
+                            default=[],
+                            required=False
+                            )
+
+        parser.add_argument("--include_ifc_type",
+                            action='store',
+                            help="""Tessellate only the elements of specific ifc types (and their subtypes), the spatial structure is kept,
+                            the other elements are kept without geometry (so the parts of e.g. a curtain wall are still found).
+                            --include_ifc_type [IfcWall,IfcSlab]""",
                             default=[],
                             required=False
                             )
@@ -78,16 +88,184 @@ class ArgsManager(object):
                             action='store_true',
                             help=
                             """
-                            use usd references to reuse meshes with same geometry
-                            !!should be validated by an expert in USD!!
-                            is the reusing of meshes working as expected?
-                            The doubt comes from file size, shouldn't be significantly smaller where reusing lots of meshes?
-                            in a test made with GLTF format, reusing the mesh buffer multiple times, decrease the size by a lot!
+                            write every unique mesh (same geometry, materials and texture) once
+                            under the /Prototypes class prim and make each occurrence
+                            an instanceable prim referencing it.
                             """,
                             default=False,
                             required=False
                             )
 
+        parser.add_argument('--pipeline',
+                            action='store_true',
+                            help="""overlap tessellation and USD authoring:
+                            a producer thread drains the geometry iterator in a bounded queue,
+                            the main thread authors the meshes in batches""",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument("--queue_size",
+                            action="store",
+                            help="size of the mesh queue (and max authoring batch) used by --pipeline",
+                            default="64",
+                            required=False)
+
+        parser.add_argument('--weld',
+                            action='store_true',
+                            help="""weld the mesh points closer than '--weld_tolerance' (with the same normal and uv),
+                            normals and uvs become per vertex""",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument("--weld_tolerance",
+                            action="store",
+                            help="distance under which the points are welded by --weld, 0 welds only equal points",
+                            default="0.00001",
+                            required=False)
+
+        parser.add_argument("--primvars_encoding",
+                            action="store",
+                            choices=["full", "indexed"],
+                            help="""'full' writes a normal and an uv per point (or per face corner),
+                            'indexed' writes every distinct value once with indices, a single value as constant""",
+                            default="full",
+                            required=False)
+
+        parser.add_argument('--omit_flat_normals',
+                            action='store_true',
+                            help="don't write the normals of meshes where the renderer computes the same ones (e.g. flat faces not sharing points)",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument("--usd_backend",
+                            action="store",
+                            choices=["stage", "sdf"],
+                            help="""'stage' authors through the Usd stage API,
+                            'sdf' writes prim and attribute specs in an in memory layer, saved once (not used by --incremental)""",
+                            default="stage",
+                            required=False)
+
+        parser.add_argument('--benchmark_backends',
+                            action='store_true',
+                            help="convert with both usd backends ('<output name>_stage' and '<output name>_sdf'), print their times and differences",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument('--storey_payloads',
+                            action='store_true',
+                            help="""write the content of every building storey in its own .usdc layer (in the '<output name>_payloads' folder),
+                            loaded as payload by the storey prim, which keeps the properties and the extentsHint.
+                            Only for the serial conversion""",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument('--merge_meshes',
+                            action='store_true',
+                            help="""merge the meshes of every building storey and material in one mesh (in world space, in the 'MergedMeshes' scope of the storey),
+                            the 'elementId' primvar of every face is an index of the 'IFC:elementGuids' array of the mesh.
+                            The element prims keep only the metadata. Only for the serial conversion""",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument("--lods",
+                            action="store",
+                            help="""number of levels of detail (at most 3), if greater than 1 the products are tessellated again
+                            with the tolerances multiplied by '--lod_factor' at every level, the meshes of each element
+                            are in the 'LOD0' (finest) to 'LOD<lods - 1>' variants of its 'LOD' variant set.
+                            The meshes are reused (see '--reuse_mesh_ref'). Only for the serial conversion""",
+                            default="1",
+                            required=False)
+
+        parser.add_argument("--lod_factor",
+                            action="store",
+                            help="factor of the angular and deflection tolerances between a level of detail and the next one",
+                            default="2.0",
+                            required=False)
+
+        parser.add_argument("--element_time_budget",
+                            action="store",
+                            help="""seconds allowed to tessellate a product, if greater than 0 every product is tessellated in a worker process,
+                            killed when the budget is exceeded (or when the geometry kernel crashes): the product is tried again without
+                            openings and boolean results, then with its 'Box' representation, then it is skipped.
+                            The slowest products are written in '<output name>.slow_elements.json'. Only for the serial conversion""",
+                            default="0",
+                            required=False)
+
+        parser.add_argument("--element_workers",
+                            action="store",
+                            help="""number of worker processes tessellating the products with '--element_time_budget'.
+                            Every worker opens its own copy of the IFC file (a worker replacing a killed one opens it again),
+                            so the memory used is about one model per worker on top of the converter's own copy""",
+                            default="1",
+                            required=False)
+
+        parser.add_argument("--jobs",
+                            action="store",
+                            help="""number of processes converting IFC files in parallel,
+                            if greater than 1 every IFC file is converted in its own .usdc layer
+                            (in the '<output name>_layers' folder) and the output file sublayers them""",
+                            default="1",
+                            required=False)
+
+        parser.add_argument("--shards",
+                            action="store",
+                            help="""number of shards (and processes) in which the products of each IFC file are split,
+                            if greater than 1 every shard is tessellated in its own .usdc layer
+                            (in the '<output name>_shards' folder) and the output file sublayers them.
+                            It takes precedence over '--jobs'""",
+                            default="1",
+                            required=False)
+
+        parser.add_argument("--shard_by",
+                            action="store",
+                            choices=["storey", "id"],
+                            help="split the products in shards by building storey or by entity id range",
+                            default="storey",
+                            required=False)
+
+        parser.add_argument('--verify_shards',
+                            action='store_true',
+                            help="convert also with the serial path ('<output name>_serial') and print the prim/attribute differences",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument("--geometry_cache",
+                            action="store",
+                            help="""folder of a local tessellation cache, products whose representation, placement,
+                            openings, materials and geometry settings did not change are read from it instead of tessellated""",
+                            default=None,
+                            required=False)
+
+        parser.add_argument('--shared_property_sets',
+                            action='store_true',
+                            help="""write every distinct property/quantity set once, as a prim under /PropertySets or /QuantitySets,
+                            elements target them with the IFC:propertySets and IFC:quantitySets relationships instead of holding a JSON copy""",
+                            default=False,
+                            required=False
+                            )
+
+        parser.add_argument("--metadata_db",
+                            action="store",
+                            help="""path of a SQLite database to write with elements (guid, ifc type, usd prim path),
+                            property sets, properties and quantities, indexed to query them without opening the stage""",
+                            default=None,
+                            required=False)
+
+        parser.add_argument('--incremental',
+                            action='store_true',
+                            help="""keep the previous conversion as base layer and a manifest of element fingerprints next to the output,
+                            the next runs re-convert only added, modified or deleted elements in an override layer""",
+                            default=False,
+                            required=False
+                            )
+
         args = parser.parse_args()
 
         config = vars(args)
@@ -114,28 +292,80 @@ class ArgsManager(object):
 
        
 
-        ignore_ifc_types = config["ignore_ifc_type"]
-
-        if (len(ignore_ifc_types) > 0):
-            ignore_ifc_types = ignore_ifc_types.replace("[", "").replace("]", "").split(",")
-            ignore_ifc_types = [file.strip() for file in ignore_ifc_types]
-            ignore_ifc_types = set(ignore_ifc_types)
+        ignore_ifc_types = self.get_ifc_types(config["ignore_ifc_type"])
+        include_ifc_types = self.get_ifc_types(config["include_ifc_type"])
 
 
         uvs = bool(config["uvs"])
         texture = bool(config["texture"])
         colliders = bool(config["colliders"])
         reuse_geometry = bool(config["reuse_mesh_ref"])
+        pipeline = bool(config["pipeline"])
+        queue_size = int(config["queue_size"])
+        weld = bool(config["weld"])
+        weld_tolerance = float(config["weld_tolerance"])
+        primvars_encoding = str(config["primvars_encoding"])
+        omit_flat_normals = bool(config["omit_flat_normals"])
+        usd_backend = str(config["usd_backend"])
+        benchmark_backends = bool(config["benchmark_backends"])
+        storey_payloads = bool(config["storey_payloads"])
+        merge_meshes = bool(config["merge_meshes"])
+        lods = min(max(int(config["lods"]), 1), 3)
+        lod_factor = float(config["lod_factor"])
+        element_time_budget = max(float(config["element_time_budget"]), 0.0)
+        element_workers = max(int(config["element_workers"]), 1)
+        jobs = int(config["jobs"])
+        shards = int(config["shards"])
+        shard_by = str(config["shard_by"])
+        verify_shards = bool(config["verify_shards"])
+        geometry_cache = config["geometry_cache"]
+        shared_property_sets = bool(config["shared_property_sets"])
+        incremental = bool(config["incremental"])
+        metadata_db = config["metadata_db"]
 
         
 
-        return (
-            input_ifc_files,
-            output_usd_file,
-            ignore_ifc_types,
-            angular_tolerance,
-            deflection_tolerance,
-            uvs,
-            texture,
-            colliders,
-            reuse_geometry)
+        # named values, a new argument does not shift the others
+        return {
+            "input_ifc_files": input_ifc_files,
+            "output_usd_file": output_usd_file,
+            "ignore_ifc_types": ignore_ifc_types,
+            "angular_tolerance": angular_tolerance,
+            "deflection_tolerance": deflection_tolerance,
+            "uvs": uvs,
+            "texture": texture,
+            "colliders": colliders,
+            "reuse_geometry": reuse_geometry,
+            "pipeline": pipeline,
+            "queue_size": queue_size,
+            "jobs": jobs,
+            "shards": shards,
+            "shard_by": shard_by,
+            "verify_shards": verify_shards,
+            "geometry_cache": geometry_cache,
+            "shared_property_sets": shared_property_sets,
+            "incremental": incremental,
+            "metadata_db": metadata_db,
+            "include_ifc_types": include_ifc_types,
+            "weld": weld,
+            "weld_tolerance": weld_tolerance,
+            "primvars_encoding": primvars_encoding,
+            "omit_flat_normals": omit_flat_normals,
+            "usd_backend": usd_backend,
+            "benchmark_backends": benchmark_backends,
+            "storey_payloads": storey_payloads,
+            "lods": lods,
+            "lod_factor": lod_factor,
+            "merge_meshes": merge_meshes,
+            "element_time_budget": element_time_budget,
+            "element_workers": element_workers
+        }
+
+    def get_ifc_types(self, ifc_types):
+        """
+        return the set of ifc types of a '[IfcType1,IfcType2]' argument
+        """
+        if (len(ifc_types) == 0):
+            return set()
+        ifc_types = ifc_types.replace("[", "").replace("]", "").split(",")
+        return set(ifc_type.strip() for ifc_type in ifc_types if len(ifc_type.strip()) > 0)
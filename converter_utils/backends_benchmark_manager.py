@@ -0,0 +1,57 @@
+from converter_utils.ifc2usd_manager import Ifc2UsdManager
+from converter_utils import usd_diff_helper
+
+import os
+import time
+import traceback
+
+
+class BackendsBenchmarkManager():
+    def __init__(self, usd_output_path, converter_args, backends=("stage", "sdf")):
+        """
+        converter_args are the Ifc2UsdManager keyword arguments, the usd backend is replaced by each one of the backends.
+        """
+        self.usd_output_path = usd_output_path
+        self.converter_args = converter_args
+        self.backends = backends
+
+    def get_backend_usd_output_path(self, usd_backend):
+        usd_output_name, usd_output_extension = os.path.splitext(self.usd_output_path)
+        return f"{usd_output_name}_{usd_backend}{usd_output_extension}"
+
+    def convert_ifc_files(self, ifc_file_paths, angular_tolerance, deflection_tolerance):
+        """
+        convert the same files with every usd backend (in '<output name>_<backend>'),
+        print the elapsed time of each one and the prim/attribute differences of their outputs.
+        """
+        elapsed_times = dict()
+        for usd_backend in self.backends:
+            usd_output_path = self.get_backend_usd_output_path(usd_backend)
+            print(f"Benchmark: {usd_backend} backend -> {usd_output_path}")
+
+            start_time = time.perf_counter()
+            ifc2usd_manager = Ifc2UsdManager(usd_output_path, **dict(self.converter_args, usd_backend=usd_backend))
+            for ifc_file_path in ifc_file_paths:
+                try:
+                    ifc2usd_manager.convert_ifc_to_usd(ifc_file_path, angular_tolerance, deflection_tolerance)
+                except Exception as error:
+                    print(f"Error -> {error}  --> input ifc file: {ifc_file_path}")
+                    traceback.print_exc()
+            elapsed_times[usd_backend] = time.perf_counter() - start_time
+
+        print("Benchmark of the usd backends")
+        for usd_backend, elapsed_time in elapsed_times.items():
+            print(f"    {usd_backend}: {elapsed_time:0.4f} seconds")
+
+        reference_backend = self.backends[0]
+        for usd_backend in self.backends[1:]:
+            differences = usd_diff_helper.diff_usd_stages(
+                self.get_backend_usd_output_path(reference_backend),
+                self.get_backend_usd_output_path(usd_backend)
+            )
+            if len(differences) == 0:
+                print(f"{usd_backend} output identical to {reference_backend} output")
+            else:
+                print(f"{usd_backend} output differs from {reference_backend} output ({len(differences)} differences):")
+                for difference in differences[:50]:
+                    print(f"    {difference}")
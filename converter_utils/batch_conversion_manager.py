@@ -0,0 +1,131 @@
+from converter_utils.ifc2usd_manager import Ifc2UsdManager
+from converter_utils.usd_manager import UsdManager
+
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+
+def convert_ifc_to_usd_layer(ifc_file_path, usd_layer_path, converter_args, angular_tolerance, deflection_tolerance):
+    """
+    worker process entry point, convert a single IFC file in its own usd layer.\n
+    return (ifc_file_path, usd_layer_path, elapsed_time, error)
+    """
+    start_time = time.perf_counter()
+    try:
+        ifc2usd_manager = Ifc2UsdManager(usd_layer_path, **converter_args)
+        ifc2usd_manager.convert_ifc_to_usd(ifc_file_path, angular_tolerance, deflection_tolerance)
+        return (ifc_file_path, usd_layer_path, time.perf_counter() - start_time, None)
+    except Exception:
+        error = traceback.format_exc()
+        # no partial layers left next to the converted ones
+        if os.path.exists(usd_layer_path):
+            os.remove(usd_layer_path)
+        return (ifc_file_path, usd_layer_path, time.perf_counter() - start_time, error)
+
+
+class BatchConversionManager():
+    def __init__(self, usd_output_path, jobs, converter_args):
+        """
+        converter_args are the Ifc2UsdManager keyword arguments (except the usd output path).
+        """
+        self.usd_output_path = usd_output_path
+        self.jobs = jobs
+        self.converter_args = converter_args
+
+        usd_output_directory = os.path.dirname(os.path.abspath(usd_output_path))
+        usd_output_name = os.path.basename(usd_output_path).split('.')[0]
+        self.layers_directory = os.path.join(usd_output_directory, f"{usd_output_name}_layers")
+
+    def convert_ifc_files(self, ifc_file_paths, angular_tolerance, deflection_tolerance):
+        """
+        convert every IFC file in its own .usdc layer using a pool of processes,
+        then write the output stage with all the converted layers as sublayers.\n
+        return the list of (ifc_file_path, error) of the failed conversions.
+        """
+        os.makedirs(self.layers_directory, exist_ok=True)
+        ifc_files_and_layers = self.get_ifc_files_and_layers_paths(ifc_file_paths)
+
+        # largest files first, so the last running conversions are the short ones
+        ifc_files_by_size = sorted(ifc_files_and_layers.keys(), key=self.get_file_size, reverse=True)
+
+        results = self.run_conversions(ifc_files_by_size, ifc_files_and_layers, angular_tolerance, deflection_tolerance, self.jobs)
+
+        # a crashed worker breaks the whole pool, the files it was running are retried one at a time
+        ifc_files_to_retry = [ifc_file_path for ifc_file_path, result in results.items() if isinstance(result[3], BrokenProcessPool)]
+        for ifc_file_path in ifc_files_to_retry:
+            print(f"Retrying in an isolated process --> input ifc file: {ifc_file_path}")
+            results.update(self.run_conversions([ifc_file_path], ifc_files_and_layers, angular_tolerance, deflection_tolerance, 1))
+
+        usd_manager = UsdManager(self.usd_output_path)
+        usd_output_directory = os.path.dirname(os.path.abspath(self.usd_output_path))
+        failures = []
+
+        # sublayers keep the input order, whatever the completion order was
+        for ifc_file_path in ifc_file_paths:
+            ifc_file_path, usd_layer_path, elapsed_time, error = results[ifc_file_path]
+            if error is not None:
+                print(f"Error -> {error}  --> input ifc file: {ifc_file_path}")
+                failures.append((ifc_file_path, error))
+                continue
+
+            print(f"""{os.path.basename(ifc_file_path)} Conversion
+              elapsed time: {elapsed_time:0.4f} seconds""")
+            usd_manager.add_sublayer(os.path.relpath(usd_layer_path, usd_output_directory).replace("\\", "/"))
+
+        usd_manager.save_stage()
+
+        return failures
+
+    def run_conversions(self, ifc_file_paths, ifc_files_and_layers, angular_tolerance, deflection_tolerance, jobs):
+        results = dict()
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures_and_ifc_files = {
+                executor.submit(
+                    convert_ifc_to_usd_layer,
+                    ifc_file_path,
+                    ifc_files_and_layers[ifc_file_path],
+                    self.converter_args,
+                    angular_tolerance,
+                    deflection_tolerance
+                ): ifc_file_path
+                for ifc_file_path in ifc_file_paths
+            }
+
+            for future in as_completed(futures_and_ifc_files):
+                ifc_file_path = futures_and_ifc_files[future]
+                try:
+                    results[ifc_file_path] = future.result()
+                except BrokenProcessPool as error:
+                    results[ifc_file_path] = (ifc_file_path, ifc_files_and_layers[ifc_file_path], 0.0, error)
+
+        return results
+
+    def get_ifc_files_and_layers_paths(self, ifc_file_paths):
+        """
+        return a dict ifc file path -> usd layer path, with a unique layer name for each file.
+        """
+        ifc_files_and_layers = dict()
+        layers_names = set()
+
+        for ifc_file_path in ifc_file_paths:
+            layer_name = os.path.basename(ifc_file_path).split('.')[0]
+            unique_layer_name = layer_name
+            counter = 1
+            while unique_layer_name in layers_names:
+                unique_layer_name = f"{layer_name}_{counter}"
+                counter += 1
+
+            layers_names.add(unique_layer_name)
+            ifc_files_and_layers[ifc_file_path] = os.path.join(self.layers_directory, f"{unique_layer_name}.usdc")
+
+        return ifc_files_and_layers
+
+    def get_file_size(self, file_path):
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return 0
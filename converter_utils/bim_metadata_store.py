@@ -0,0 +1,180 @@
+import os
+import shutil
+import sqlite3
+
+
+class BimMetadataStore():
+    """
+    SQLite sidecar of the converted elements, to query properties and quantities without opening the stage.\n
+    Tables: elements (with the usd prim path), property_sets, properties, quantity_sets, quantities,
+    and the element_property_sets / element_quantity_sets links. Every set is stored once, linked by its elements.\n
+    The views element_properties and element_quantities join them, e.g.\n
+    SELECT guid, prim_path FROM element_properties WHERE ifc_type = 'IfcWall' AND property = 'FireRating' AND value = 'REI60'
+    """
+    # rows are inserted in batches
+    FLUSH_ROWS_COUNT = 10000
+
+    def __init__(self, db_path, base_db_path=None):
+        """
+        the database at db_path is created again, as a copy of base_db_path if given.
+        """
+        self.db_path = db_path
+        if os.path.isfile(db_path):
+            os.remove(db_path)
+        if base_db_path is not None:
+            shutil.copyfile(base_db_path, db_path)
+
+        self.connection = sqlite3.connect(db_path)
+        self.create_tables()
+
+        # (ifc file path, entity id) -> set id
+        self.property_sets_ids = dict()
+        self.quantity_sets_ids = dict()
+
+        self.next_element_id = self.get_next_id("elements")
+        self.next_property_set_id = self.get_next_id("property_sets")
+        self.next_quantity_set_id = self.get_next_id("quantity_sets")
+
+        self.pending_rows = dict()
+        self.pending_rows_count = 0
+        self.has_removed_elements = False
+
+    def create_tables(self):
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS elements (id INTEGER PRIMARY KEY, guid TEXT, ifc_type TEXT, name TEXT, prim_path TEXT, ifc_file TEXT);
+            CREATE TABLE IF NOT EXISTS property_sets (id INTEGER PRIMARY KEY, guid TEXT, name TEXT);
+            CREATE TABLE IF NOT EXISTS properties (property_set_id INTEGER, name TEXT, type TEXT, unit TEXT, value TEXT, numeric_value REAL);
+            CREATE TABLE IF NOT EXISTS quantity_sets (id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE IF NOT EXISTS quantities (quantity_set_id INTEGER, name TEXT, type TEXT, unit TEXT, value TEXT, numeric_value REAL);
+            CREATE TABLE IF NOT EXISTS element_property_sets (element_id INTEGER, property_set_id INTEGER);
+            CREATE TABLE IF NOT EXISTS element_quantity_sets (element_id INTEGER, quantity_set_id INTEGER);
+
+            CREATE INDEX IF NOT EXISTS elements_guid ON elements (guid);
+            CREATE INDEX IF NOT EXISTS elements_ifc_type ON elements (ifc_type);
+            CREATE INDEX IF NOT EXISTS properties_name ON properties (name);
+            CREATE INDEX IF NOT EXISTS properties_property_set_id ON properties (property_set_id);
+            CREATE INDEX IF NOT EXISTS quantities_name ON quantities (name);
+            CREATE INDEX IF NOT EXISTS quantities_quantity_set_id ON quantities (quantity_set_id);
+            CREATE INDEX IF NOT EXISTS element_property_sets_element_id ON element_property_sets (element_id);
+            CREATE INDEX IF NOT EXISTS element_property_sets_property_set_id ON element_property_sets (property_set_id);
+            CREATE INDEX IF NOT EXISTS element_quantity_sets_element_id ON element_quantity_sets (element_id);
+            CREATE INDEX IF NOT EXISTS element_quantity_sets_quantity_set_id ON element_quantity_sets (quantity_set_id);
+
+            CREATE VIEW IF NOT EXISTS element_properties AS
+                SELECT elements.guid, elements.ifc_type, elements.name AS element_name, elements.prim_path,
+                       property_sets.name AS property_set, properties.name AS property,
+                       properties.value, properties.numeric_value, properties.unit
+                FROM elements
+                JOIN element_property_sets ON element_property_sets.element_id = elements.id
+                JOIN property_sets ON property_sets.id = element_property_sets.property_set_id
+                JOIN properties ON properties.property_set_id = property_sets.id;
+
+            CREATE VIEW IF NOT EXISTS element_quantities AS
+                SELECT elements.guid, elements.ifc_type, elements.name AS element_name, elements.prim_path,
+                       quantity_sets.name AS quantity_set, quantities.name AS quantity,
+                       quantities.value, quantities.numeric_value, quantities.unit
+                FROM elements
+                JOIN element_quantity_sets ON element_quantity_sets.element_id = elements.id
+                JOIN quantity_sets ON quantity_sets.id = element_quantity_sets.quantity_set_id
+                JOIN quantities ON quantities.quantity_set_id = quantity_sets.id;
+        """)
+
+    def get_next_id(self, table):
+        return self.connection.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+
+    def get_numeric_value(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def add_rows(self, table, rows):
+        self.pending_rows.setdefault(table, []).extend(rows)
+        self.pending_rows_count += len(rows)
+        if self.pending_rows_count >= self.FLUSH_ROWS_COUNT:
+            self.flush()
+
+    def add_property_set(self, ifc_file_path, entity_id, property_set):
+        """
+        store a PropertySet, once per entity of an IFC file
+        """
+        key = (ifc_file_path, entity_id)
+        if key in self.property_sets_ids:
+            return
+
+        property_set_id = self.next_property_set_id
+        self.next_property_set_id += 1
+        self.property_sets_ids[key] = property_set_id
+
+        self.add_rows("property_sets", [(property_set_id, property_set.GUID, property_set.Name)])
+        self.add_rows("properties", [
+            (property_set_id, ifc_property.Name, ifc_property.Type, ifc_property.Unit, ifc_property.Value, self.get_numeric_value(ifc_property.Value))
+            for ifc_property in property_set.Properties
+        ])
+
+    def add_quantity_set(self, ifc_file_path, entity_id, quantity_set):
+        """
+        store a QuantitySet, once per entity of an IFC file
+        """
+        key = (ifc_file_path, entity_id)
+        if key in self.quantity_sets_ids:
+            return
+
+        quantity_set_id = self.next_quantity_set_id
+        self.next_quantity_set_id += 1
+        self.quantity_sets_ids[key] = quantity_set_id
+
+        self.add_rows("quantity_sets", [(quantity_set_id, quantity_set.Name)])
+        self.add_rows("quantities", [
+            (quantity_set_id, quantity.Name, quantity.Type, quantity.Unit, quantity.Value, self.get_numeric_value(quantity.Value))
+            for quantity in quantity_set.Properties
+        ])
+
+    def add_element(self, ifc_file_path, guid, ifc_type, name, prim_path, property_sets_entity_ids, quantity_sets_entity_ids):
+        """
+        store an element and its links to the sets (already added) of the given entity ids
+        """
+        element_id = self.next_element_id
+        self.next_element_id += 1
+
+        self.add_rows("elements", [(element_id, guid, ifc_type, name, prim_path, os.path.basename(ifc_file_path))])
+        self.add_rows("element_property_sets", [
+            (element_id, self.property_sets_ids[(ifc_file_path, entity_id)]) for entity_id in property_sets_entity_ids
+        ])
+        self.add_rows("element_quantity_sets", [
+            (element_id, self.quantity_sets_ids[(ifc_file_path, entity_id)]) for entity_id in quantity_sets_entity_ids
+        ])
+
+    def remove_elements(self, guids):
+        """
+        remove the elements with the given guids and their links, sets no more linked are removed on commit
+        """
+        self.flush()
+        guids = [(guid,) for guid in guids]
+        self.connection.executemany("DELETE FROM element_property_sets WHERE element_id IN (SELECT id FROM elements WHERE guid = ?)", guids)
+        self.connection.executemany("DELETE FROM element_quantity_sets WHERE element_id IN (SELECT id FROM elements WHERE guid = ?)", guids)
+        self.connection.executemany("DELETE FROM elements WHERE guid = ?", guids)
+        self.has_removed_elements = True
+
+    def flush(self):
+        for table, rows in self.pending_rows.items():
+            if len(rows) == 0:
+                continue
+            placeholders = ", ".join("?" * len(rows[0]))
+            self.connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+        self.pending_rows = dict()
+        self.pending_rows_count = 0
+
+    def commit(self):
+        self.flush()
+
+        if self.has_removed_elements:
+            self.connection.executescript("""
+                DELETE FROM property_sets WHERE id NOT IN (SELECT property_set_id FROM element_property_sets);
+                DELETE FROM properties WHERE property_set_id NOT IN (SELECT id FROM property_sets);
+                DELETE FROM quantity_sets WHERE id NOT IN (SELECT quantity_set_id FROM element_quantity_sets);
+                DELETE FROM quantities WHERE quantity_set_id NOT IN (SELECT id FROM quantity_sets);
+            """)
+            self.has_removed_elements = False
+
+        self.connection.commit()
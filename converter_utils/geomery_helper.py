@@ -1,45 +1,92 @@
 import numpy as np
 
 
-def weld_mesh(mesh_vertices, mesh_faces):
+def weld_mesh(mesh_vertices, mesh_faces, epsilon=0.0, mesh_normals=None, mesh_uvs=None):
     """
-    Given mesh vertices and faces return mesh vertices and faces welded
+    Given flat mesh vertices and faces return (vertices, faces, normals, uvs) welded:
+    vertices closer than epsilon (quantized to a grid of epsilon, exact match if 0) become one.
+
+    Per vertex normals and uvs are kept, vertices with the same position but different normal or uv are not welded.
+    Normals and uvs not given per vertex (e.g. face varying) are returned as they are.
     """
-    uniqueVertices_NewIndices = {}
-    oldIndices_Vertices = {}
-    verticesRemoved = 0
-    newIndex = 0
-    oldIndex = 0
+    vertices = np.asarray(mesh_vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(mesh_faces, dtype=np.int64)
+    vertices_count = len(vertices)
+
+    normals = None if mesh_normals is None else np.asarray(mesh_normals, dtype=np.float64).reshape(-1, 3)
+    uvs = None if mesh_uvs is None else np.asarray(mesh_uvs, dtype=np.float64).reshape(-1, 2)
+    is_vertex_normals = normals is not None and len(normals) == vertices_count
+    is_vertex_uvs = uvs is not None and len(uvs) == vertices_count
+
+    if vertices_count == 0:
+        return (vertices.reshape(-1), faces, mesh_normals, mesh_uvs)
+
+    # the welding key of every vertex: position, normal and uv
+    keys = [vertices]
+    if is_vertex_normals:
+        keys.append(normals)
+    if is_vertex_uvs:
+        keys.append(uvs)
+    keys = np.hstack(keys)
+    if epsilon > 0:
+        keys = np.round(keys / epsilon).astype(np.int64)
 
-    meshVertices = []
+    _, first_indices, welded_indices = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    welded_indices = welded_indices.reshape(-1)
 
-    for i in range(0, len(mesh_vertices), 3):
-        x = mesh_vertices[i]
-        y = mesh_vertices[i + 1]
-        z = mesh_vertices[i + 2]
+    # welded vertices in order of first occurrence, each one is its first original vertex
+    welded_order = np.argsort(first_indices, kind="stable")
+    welded_remap = np.empty(len(welded_order), dtype=np.int64)
+    welded_remap[welded_order] = np.arange(len(welded_order))
+    kept_indices = first_indices[welded_order]
 
-        vert = (x, y, z)
-        if vert not in uniqueVertices_NewIndices:
-            uniqueVertices_NewIndices[vert] = newIndex
-            meshVertices.extend([float(x), float(y), float(z)])
-            newIndex += 1
+    welded_faces = welded_remap[welded_indices][faces]
+    welded_normals = normals[kept_indices].reshape(-1) if is_vertex_normals else mesh_normals
+    welded_uvs = uvs[kept_indices].reshape(-1) if is_vertex_uvs else mesh_uvs
 
-        oldIndices_Vertices[oldIndex] = vert
-        oldIndex += 1
+    return (vertices[kept_indices].reshape(-1), welded_faces, welded_normals, welded_uvs)
 
-    verticesRemoved += oldIndex - newIndex
-    faces = mesh_faces
-    facesSize = len(faces)
 
-    meshIndices = []
+def get_extent(mesh_vertices):
+    """
+    Given flat mesh vertices return their axis aligned bounding box as a (2, 3) array [min, max]
+    """
+    vertices = np.asarray(mesh_vertices, dtype=np.float64).reshape(-1, 3)
+    if len(vertices) == 0:
+        return None
+    return np.stack((vertices.min(axis=0), vertices.max(axis=0)))
 
-    for i in range(facesSize):
-        index0 = mesh_faces[i]
-        vert = oldIndices_Vertices[index0]
-        newIndex0 = uniqueVertices_NewIndices[vert]
-        meshIndices.append(newIndex0)
 
-    return (meshVertices, meshIndices)
+def get_transformed_extent(extent, matrix_4x4):
+    """
+    Given an extent [min, max] and a flat row major 4x4 matrix (translation in the last row, as in USD)
+    return the axis aligned bounding box of the transformed box
+    """
+    # the 8 corners of the box, in homogeneous coordinates
+    corners = np.ones((8, 4))
+    corners[:, :3] = extent[np.indices((2, 2, 2)).reshape(3, -1).T, [0, 1, 2]]
+    corners = corners @ np.asarray(matrix_4x4, dtype=np.float64).reshape(4, 4)
+    return np.stack((corners[:, :3].min(axis=0), corners[:, :3].max(axis=0)))
+
+
+def get_transformed_points(mesh_vertices, matrix_4x4):
+    """
+    Given a flat array of vertices and a flat row major 4x4 matrix (translation in the last row, as in USD)
+    return the (n, 3) array of the transformed vertices
+    """
+    matrix_4x4 = np.asarray(matrix_4x4, dtype=np.float64).reshape(4, 4)
+    return np.asarray(mesh_vertices, dtype=np.float64).reshape(-1, 3) @ matrix_4x4[:3, :3] + matrix_4x4[3, :3]
+
+
+def get_transformed_normals(mesh_normals, matrix_4x4):
+    """
+    Given a flat array of normals and a flat row major 4x4 matrix
+    return the (n, 3) array of the normals transformed by the inverse transpose, normalized
+    """
+    matrix_3x3 = np.asarray(matrix_4x4, dtype=np.float64).reshape(4, 4)[:3, :3]
+    normals = np.asarray(mesh_normals, dtype=np.float64).reshape(-1, 3) @ np.linalg.inv(matrix_3x3).T
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
 
 
 def switch_to_clockwise_order(vertices):
@@ -90,19 +137,187 @@ def is_anti_clockwise2(triangle):
 
 
 def get_normal(triangle):
-    vertex1 = np.array([triangle[0][0], triangle[0][1], triangle[0][2]])
-    vertex2 = np.array([triangle[1][0], triangle[1][1], triangle[1][2]])
-    vertex3 = np.array([triangle[2][0], triangle[2][1], triangle[2][2]])
+    return get_faces_normals(np.asarray(triangle, dtype=np.float64).reshape(-1), [0, 1, 2])[0]
+
+
+def get_faces_normals(mesh_vertices, mesh_faces):
+    """
+    Given flat mesh vertices and triangle faces return the normalized normal of every face (zero for degenerate faces)
+    """
+    vertices = np.asarray(mesh_vertices, dtype=np.float64).reshape(-1, 3)
+    triangles = vertices[np.asarray(mesh_faces, dtype=np.int64).reshape(-1, 3)]
+
+    # cross product of two vectors along the edges of the triangles
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+
+def get_vertices_normals(mesh_vertices, mesh_faces):
+    """
+    Given flat mesh vertices and triangle faces return the smooth normal of every vertex,
+    the normalized sum of the (area weighted) normals of its faces, as renderers compute them
+    """
+    vertices = np.asarray(mesh_vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(mesh_faces, dtype=np.int64).reshape(-1, 3)
+    triangles = vertices[faces]
+    faces_normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+
+    vertices_normals = np.zeros_like(vertices)
+    for corner in range(3):
+        np.add.at(vertices_normals, faces[:, corner], faces_normals)
+
+    lengths = np.linalg.norm(vertices_normals, axis=1, keepdims=True)
+    return np.divide(vertices_normals, lengths, out=np.zeros_like(vertices_normals), where=lengths > 0)
+
+
+def are_normals_computable(mesh_vertices, mesh_faces, mesh_normals, cos_tolerance=0.9999):
+    """
+    Given flat mesh vertices, triangle faces and normals (per vertex or per face corner)
+    return True if the smooth normals computed from the faces are the same (e.g. flat geometry without shared vertices)
+    """
+    faces = np.asarray(mesh_faces, dtype=np.int64)
+    normals = np.asarray(mesh_normals, dtype=np.float64).reshape(-1, 3)
+    if len(faces) == 0:
+        return False
+    if len(normals) != len(faces):
+        if len(normals) * 3 != len(mesh_vertices):
+            return False
+        normals = normals[faces]
+
+    computed_normals = get_vertices_normals(mesh_vertices, faces)[faces]
+    return bool(np.all(np.sum(computed_normals * normals, axis=1) >= cos_tolerance))
+
+
+def get_primvar_encoding(values, mesh_faces, points_count, components, is_face_varying, indexed):
+    """
+    Given flat primvar values (per point, or per face corner if is_face_varying) return (values, indices, interpolation).
+
+    If indexed, face varying values equal on every corner of a point become per point,
+    equal values are written once with indices (if smaller) and a single value is constant.
+    """
+    values = np.asarray(values, dtype=np.float32).reshape(-1, components)
+    faces = np.asarray(mesh_faces, dtype=np.int64)
+    interpolation = "faceVarying" if is_face_varying else "vertex"
+    if indexed is False or len(values) == 0:
+        return (values.reshape(-1), None, interpolation)
+
+    if is_face_varying and len(values) == len(faces):
+        vertices_values = np.zeros((points_count, components), dtype=np.float32)
+        vertices_values[faces] = values
+        if np.array_equal(vertices_values[faces], values):
+            values = vertices_values
+            interpolation = "vertex"
+
+    unique_values, indices = np.unique(values, axis=0, return_inverse=True)
+    if len(unique_values) == 1:
+        return (unique_values.reshape(-1), None, "constant")
+    if unique_values.size + len(values) < values.size:
+        return (unique_values.reshape(-1), indices.reshape(-1), interpolation)
+    return (values.reshape(-1), None, interpolation)
+
+
+def get_nearest_vertices_indices(mesh_vertices, coordinates, tolerance):
+    """
+    Given flat mesh vertices and a list of (x, y, z) coordinates return, for every coordinate,
+    the lowest index of the vertices closer than tolerance (-1 if there is none).\n
+    The vertices are hashed in a grid of cells as big as the tolerance,
+    so every coordinate is compared only with the vertices of its 27 neighbour cells.
+    """
+    vertices = np.asarray(mesh_vertices, dtype=np.float64).reshape(-1, 3)
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 3)
+    nearest_indices = np.full(len(coordinates), -1, dtype=np.int64)
+    if len(vertices) == 0 or len(coordinates) == 0:
+        return nearest_indices
+
+    vertices_cells = np.floor(vertices / tolerance).astype(np.int64)
+    coordinates_cells = np.floor(coordinates / tolerance).astype(np.int64)
 
-    # Calculate two vectors along the edges of the triangle
-    vector1 = vertex2 - vertex1
-    vector2 = vertex3 - vertex1
+    offsets = np.array([(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)], dtype=np.int64)
+    # (coordinate, offset) -> neighbour cell
+    neighbour_cells = (coordinates_cells[:, None, :] + offsets[None, :, :]).reshape(-1, 3)
+
+    vertices_keys, neighbour_keys = get_cells_keys(vertices_cells, neighbour_cells)
+
+    # vertices sorted by cell (and by index in a cell), every neighbour cell is a range of them
+    vertices_order = np.argsort(vertices_keys, kind="stable")
+    sorted_vertices_keys = vertices_keys[vertices_order]
+    cells_starts = np.searchsorted(sorted_vertices_keys, neighbour_keys, side="left")
+    cells_counts = np.searchsorted(sorted_vertices_keys, neighbour_keys, side="right") - cells_starts
+
+    # every (coordinate, vertex of a neighbour cell) pair
+    pairs_count = int(cells_counts.sum())
+    if pairs_count == 0:
+        return nearest_indices
+    pairs_coordinates = np.repeat(np.arange(len(neighbour_keys)) // len(offsets), cells_counts)
+    pairs_first = np.repeat(np.cumsum(cells_counts) - cells_counts, cells_counts)
+    pairs_positions = np.repeat(cells_starts, cells_counts) + np.arange(pairs_count) - pairs_first
+    pairs_vertices = vertices_order[pairs_positions]
+
+    distances = np.sum((vertices[pairs_vertices] - coordinates[pairs_coordinates]) ** 2, axis=1)
+    is_near = distances < tolerance * tolerance
+
+    lowest_indices = np.full(len(coordinates), len(vertices), dtype=np.int64)
+    np.minimum.at(lowest_indices, pairs_coordinates[is_near], pairs_vertices[is_near])
+    found = lowest_indices < len(vertices)
+    nearest_indices[found] = lowest_indices[found]
+    return nearest_indices
+
+
+def get_cells_keys(vertices_cells, neighbour_cells):
+    """
+    return an integer key for every (x, y, z) cell of the vertices and of the neighbours, the same for the same cell
+    """
+    cells_min = np.minimum(vertices_cells.min(axis=0), neighbour_cells.min(axis=0))
+    cells_sizes = np.maximum(vertices_cells.max(axis=0), neighbour_cells.max(axis=0)) - cells_min + 1
+
+    if np.prod(cells_sizes.astype(np.float64)) < 2 ** 62:
+        vertices_cells = vertices_cells - cells_min
+        neighbour_cells = neighbour_cells - cells_min
+        return (
+            (vertices_cells[:, 0] * cells_sizes[1] + vertices_cells[:, 1]) * cells_sizes[2] + vertices_cells[:, 2],
+            (neighbour_cells[:, 0] * cells_sizes[1] + neighbour_cells[:, 1]) * cells_sizes[2] + neighbour_cells[:, 2]
+        )
+
+    # too many cells to number them all, only the used ones are
+    _, cells_ids = np.unique(np.concatenate((vertices_cells, neighbour_cells)), axis=0, return_inverse=True)
+    cells_ids = cells_ids.reshape(-1)
+    return (cells_ids[:len(vertices_cells)], cells_ids[len(vertices_cells):])
+
+
+def get_containing_polygons_indices(mesh_faces, polygons):
+    """
+    Given flat triangle faces and a list of polygons (lists of vertex indices) return, for every triangle,
+    the index of the first polygon containing its three vertices (-1 if there is none).
+    """
+    triangles = np.asarray(mesh_faces, dtype=np.int64).reshape(-1, 3)
 
-    # Calculate the normal vector using the cross product of vector1 and vector2
-    normal = np.cross(vector1, vector2)
+    # sorted vertices of a triangle -> first polygon equal to it, valid when all the polygons are triangles
+    are_triangles = all(len(polygon) == 3 for polygon in polygons)
+    triangles_and_polygons = dict()
+    # vertex -> polygons containing it, in order
+    vertices_and_polygons = dict()
+    for polygon_index, polygon in enumerate(polygons):
+        if are_triangles:
+            triangles_and_polygons.setdefault(tuple(sorted(polygon)), polygon_index)
+        for vertex in set(polygon):
+            vertices_and_polygons.setdefault(vertex, []).append(polygon_index)
 
-    # Normalize the normal vector (optional but recommended)
-    normal /= np.linalg.norm(normal)
+    polygons_sets = None
+    polygons_indices = []
+    for triangle in np.sort(triangles, axis=1).tolist():
+        if are_triangles and triangle[0] != triangle[1] and triangle[1] != triangle[2]:
+            polygons_indices.append(triangles_and_polygons.get(tuple(triangle), -1))
+            continue
 
-    return normal
+        if polygons_sets is None:
+            polygons_sets = [set(polygon) for polygon in polygons]
+        polygon_index = next(
+            (polygon_index for polygon_index in vertices_and_polygons.get(triangle[0], [])
+             if polygons_sets[polygon_index].issuperset(triangle)),
+            -1
+        )
+        polygons_indices.append(polygon_index)
 
+    return np.asarray(polygons_indices, dtype=np.int64)
@@ -0,0 +1,115 @@
+import os
+import json
+import uuid
+import shutil
+
+import numpy as np
+
+from converter_utils import material_info_class
+from converter_utils import texture_info_class
+
+
+class GeometryCache():
+    """
+    On disk cache of tessellated meshes.\n
+    Every entry is a folder with the mesh buffers saved as .npy files (loaded memory-mapped)
+    and a json file with materials, matrix, ifc type and texture info.
+    """
+    def __init__(self, cache_directory):
+        self.cache_directory = cache_directory
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_entry_directory(self, key):
+        return os.path.join(self.cache_directory, key[:2], key)
+
+    def contains(self, key):
+        is_cached = os.path.isfile(os.path.join(self.get_entry_directory(key), "info.json"))
+        if is_cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return is_cached
+
+    def get(self, key, guid):
+        """
+        return the mesh info stored with the given key, for the product with the given guid.
+        """
+        entry_directory = self.get_entry_directory(key)
+
+        with open(os.path.join(entry_directory, "info.json"), "r") as info_file:
+            info = json.load(info_file)
+
+        buffers = dict()
+        for buffer_name in ("faces", "verts", "materials_ids", "uvs", "normals"):
+            buffer_path = os.path.join(entry_directory, f"{buffer_name}.npy")
+            buffers[buffer_name] = np.load(buffer_path, mmap_mode="r") if os.path.isfile(buffer_path) else None
+
+        materials = [
+            material_info_class.Material_Info(material["name"], tuple(material["diffuse"]), material["has_transparency"], material["transparency"])
+            for material in info["materials"]
+        ]
+
+        ifc_texture_info = {}
+        if info["texture"] is not None:
+            texture = info["texture"]
+            ifc_texture_info = texture_info_class.Texture_Info(texture["url"], texture["mode"], texture["repeat_S"], texture["repeat_T"], None)
+
+        return (
+            guid,
+            info["ifc_type"],
+            buffers["faces"],
+            buffers["verts"],
+            info["matrix"],
+            materials,
+            buffers["materials_ids"],
+            buffers["uvs"],
+            buffers["normals"],
+            ifc_texture_info
+        )
+
+    def put(self, key, ifc_mesh_info):
+        """
+        store the mesh info with the given key,
+        written in a temporary folder and then renamed, so concurrent processes never read partial entries.
+        """
+        guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info = ifc_mesh_info
+
+        entry_directory = self.get_entry_directory(key)
+        temporary_directory = f"{entry_directory}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(temporary_directory)
+
+        buffers = {"faces": faces, "verts": verts, "materials_ids": materials_ids, "uvs": uvs, "normals": normals}
+        for buffer_name, buffer in buffers.items():
+            if buffer is not None:
+                np.save(os.path.join(temporary_directory, f"{buffer_name}.npy"), np.asarray(buffer))
+
+        texture = None
+        if ifc_texture_info:
+            # the texture transform is an IFC entity, not stored (not used by the usd writer)
+            texture = {
+                "url": ifc_texture_info.texture_url,
+                "mode": ifc_texture_info.texture_mode,
+                "repeat_S": ifc_texture_info.texture_repeat_S,
+                "repeat_T": ifc_texture_info.texture_repeat_T,
+            }
+
+        info = {
+            "ifc_type": ifc_type,
+            "matrix": list(matrix),
+            "materials": [material.__dict__ for material in materials],
+            "texture": texture,
+        }
+        with open(os.path.join(temporary_directory, "info.json"), "w") as info_file:
+            json.dump(info, info_file)
+
+        if os.path.isdir(entry_directory):
+            # e.g. a duplicate guid with a better geometry, the newest entry wins
+            shutil.rmtree(entry_directory, ignore_errors=True)
+        try:
+            os.replace(temporary_directory, entry_directory)
+        except OSError:
+            # already written by another process
+            shutil.rmtree(temporary_directory, ignore_errors=True)
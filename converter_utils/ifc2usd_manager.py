@@ -1,205 +1,975 @@
 from converter_utils.ifc_manager import IfcManager
-from converter_utils.quantity_sets_class import QuantitySets
 from converter_utils.usd_manager import UsdManager
+from converter_utils.sdf_usd_manager import SdfUsdManager
+from converter_utils.bim_metadata_store import BimMetadataStore
+from converter_utils.storey_payloads_manager import StoreyPayloadsManager
+from converter_utils.lod_variants_manager import LodVariantsManager
+from converter_utils.merged_meshes_manager import MergedMeshesManager
+from converter_utils.isolated_geometry_manager import IsolatedGeometryManager
+from converter_utils import geomery_helper
+
+from pxr import Usd, Sdf, UsdGeom
 
 import os
 import traceback
 import shutil
 import json
+import hashlib
+import queue
+import threading
+import time
+
+import numpy as np
 
-from converter_utils.property_sets_class import PropertySet, PropertySets
+from converter_utils.property_sets_class import PropertySet, join_json_array
 from converter_utils.object_type_class import ObjectInfo
 
 from converter_utils.timer import Timer
 
 
+# products (the slowest first) listed per IFC file in the slow elements report, besides the ones given up
+SLOW_ELEMENTS_REPORT_SIZE = 100
+
+
 class Ifc2UsdManager():
-    def __init__(self, usd_output_path, generate_uvs, ignore_ifc_types, take_texture_from_ifc, generate_colliders, reuse_geometry):
+    def __init__(self, usd_output_path, generate_uvs, ignore_ifc_types, take_texture_from_ifc, generate_colliders, reuse_geometry, pipeline_geometry=False, pipeline_queue_size=64, geometry_cache_path=None, shared_property_sets=False, include_ifc_types=None, weld=False, weld_tolerance=0.0, primvars_encoding="full", omit_flat_normals=False, usd_backend="stage", incremental=False, metadata_db_path=None, storey_payloads=False, lods=1, lod_factor=2.0, merge_meshes=False, element_time_budget=0.0, element_workers=1):
         self.ifc_manager = None
-        self.usd_manager = UsdManager(usd_output_path)
         self.ifc_types_and_counters = dict()
 
+        # incremental conversion: the output composes a delta layer over a base layer,
+        # the manifest stores the prim path and fingerprint of every element of the base layer
+        self.incremental = incremental
+        self.is_delta_conversion = False
+        self.manifest_path = None
+        self.manifest = {"files": dict()}
+        self.previous_elements = dict()
+        self.current_elements = dict()
+        self.added_guids = set()
+        self.modified_guids = set()
+        self.settings_signature = ""
+
+        # "stage" authors through the Usd stage API, "sdf" writes the specs in a layer saved once
+        self.usd_backend = usd_backend
+        if self.incremental:
+            if usd_backend == "sdf":
+                print("Incremental conversion: the sdf backend does not compose the base layer, the stage backend is used")
+                self.usd_backend = "stage"
+            self.usd_manager = self.create_incremental_usd_manager(usd_output_path)
+        elif usd_backend == "sdf":
+            self.usd_manager = SdfUsdManager(usd_output_path)
+        else:
+            self.usd_manager = UsdManager(usd_output_path)
+
+        # the content of every building storey in its own layer, loaded as payload
+        self.storey_payloads_manager = None
+        if storey_payloads:
+            if self.incremental:
+                print("Incremental conversion: storey payloads are not written in the delta layer, they are ignored")
+            else:
+                self.storey_payloads_manager = StoreyPayloadsManager(usd_output_path)
+
+        # the element meshes merged per building storey and material, the element prims keep only the metadata
+        self.merged_meshes_manager = None
+        # paths of the prims grouping the merged meshes
+        self.merged_meshes_groups_paths = set()
+        if merge_meshes:
+            if self.incremental:
+                print("Incremental conversion: meshes are not merged, the delta layer replaces the meshes of single elements")
+            else:
+                self.merged_meshes_manager = MergedMeshesManager()
+                if reuse_geometry:
+                    print("Merged meshes: meshes are not reused")
+                    reuse_geometry = False
+                if lods > 1:
+                    print("Merged meshes: LOD variants are ignored")
+                    lods = 1
+
+        # coarser tessellations of every mesh, in a LOD variant set of the element prim
+        self.lod_variants_manager = None
+        self.lod_factor = lod_factor
+        # guid -> prototypes paths of the element mesh, one per LOD
+        self.meshes_lods_prototypes_paths = dict()
+        if lods > 1:
+            if self.incremental:
+                print("Incremental conversion: LOD variants are not written in the delta layer, they are ignored")
+            else:
+                self.lod_variants_manager = LodVariantsManager(lods)
+                if reuse_geometry is False:
+                    print("LOD variants reference the mesh prototypes, meshes are reused")
+                    reuse_geometry = True
+
+        # every product tessellated in a worker process, given up (with a fallback geometry) after element_time_budget seconds
+        self.isolated_geometry_manager = None
+        # IFC file name -> timings of the slowest products, written next to the usd output
+        self.slow_elements_report = {"files": dict()}
+        if element_time_budget > 0:
+            self.isolated_geometry_manager = IsolatedGeometryManager(element_time_budget, element_workers)
+
+        # optional SQLite sidecar of elements, property and quantity sets
+        self.metadata_db_path = metadata_db_path
+        self.metadata_store = None
+        if metadata_db_path is not None:
+            self.metadata_store = self.create_metadata_store(metadata_db_path)
+
         self.usd_namespace_delimiter = ":"
         self.base_namespace = "IFC"
         self.property_sets_namespace = f"{self.base_namespace}{self.usd_namespace_delimiter}property_sets"
         self.quantity_sets_namespace = f"{self.base_namespace}{self.usd_namespace_delimiter}quantity_sets"
         self.usd_output_path = usd_output_path
-        # Dict initialized for reuse geometry
-        self.verts_and_relative_usd_mesh_path = dict()
+        # Dict initialized for reuse geometry, mesh content hash -> prototype prim path
+        self.mesh_hashes_and_prototype_paths = dict()
 
         self.generate_uvs = generate_uvs
         self.generate_colliders = generate_colliders
         self.reuse_geometry = reuse_geometry
         self.take_texture_from_ifc = take_texture_from_ifc
+        self.pipeline_geometry = pipeline_geometry
+        self.pipeline_queue_size = pipeline_queue_size
+        self.geometry_cache_path = geometry_cache_path
+        self.mesh_reused_counter = 0
+        # optional welding of the mesh points, [points before, points after]
+        self.weld = weld
+        self.weld_tolerance = weld_tolerance
+        self.welded_points_counts = [0, 0]
+        # "full" or "indexed" (deduplicated values) normals and uvs, normals left to the renderer if it computes the same
+        self.primvars_encoding = primvars_encoding
+        self.omit_flat_normals = omit_flat_normals
+        self.omitted_normals_counter = 0
+        # guid -> bounds [min, max] of the element meshes, rolled up in the extentsHint of storeys and buildings
+        self.elements_extents = dict()
+        # texture files already copied next to the usd output
+        self.emitted_textures = set()
+
+        # property sets, quantity sets and types parsed in the current IFC file, by entity id
+        self.shared_property_sets = shared_property_sets
+        self.clear_property_sets()
+        # set JSON -> prim path, when the sets are shared prims
+        self.shared_sets_prim_paths = dict()
+
+        self.ifc_types_to_ignore = set(ignore_ifc_types or [])
+        self.ifc_types_to_include = set(include_ifc_types or [])
+
+
+
+    def create_incremental_usd_manager(self, usd_output_path):
+        """
+        the output stage sublayers '<output name>_delta.usdc' over '<output name>_base.usdc'.\n
+        Without a previous conversion (manifest and base layer) everything is written in the base layer,
+        otherwise the base layer is kept and only the changes are written in the delta layer.
+        """
+        usd_output_directory = os.path.dirname(os.path.abspath(usd_output_path))
+        usd_output_name = os.path.basename(usd_output_path).split('.')[0]
+        base_layer_path = os.path.join(usd_output_directory, f"{usd_output_name}_base.usdc")
+        delta_layer_path = os.path.join(usd_output_directory, f"{usd_output_name}_delta.usdc")
+        self.manifest_path = os.path.join(usd_output_directory, f"{usd_output_name}.manifest.json")
+
+        if os.path.isfile(self.manifest_path) and os.path.isfile(base_layer_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as manifest_file:
+                self.manifest = json.load(manifest_file)
+            self.is_delta_conversion = True
+            edit_layer_path = delta_layer_path
+            print(f"Incremental conversion: changes from {os.path.basename(base_layer_path)} written in {os.path.basename(delta_layer_path)}")
+        else:
+            # the output composes the delta layer even if still empty
+            Sdf.Layer.CreateNew(delta_layer_path).Save()
+            edit_layer_path = base_layer_path
+            print(f"Incremental conversion: no previous conversion, full conversion written in {os.path.basename(base_layer_path)}")
+
+        sublayers_paths = [os.path.basename(delta_layer_path), os.path.basename(base_layer_path)]
+        return UsdManager(usd_output_path, sublayers_paths, edit_layer_path)
+
+    def get_metadata_base_db_path(self, metadata_db_path):
+        metadata_db_root, metadata_db_extension = os.path.splitext(metadata_db_path)
+        return f"{metadata_db_root}_base{metadata_db_extension}"
+
+    def create_metadata_store(self, metadata_db_path):
+        """
+        the metadata database is written from scratch, but in a delta conversion it starts
+        from the copy saved with the base layer, and only the changed elements are replaced.
+        """
+        if self.is_delta_conversion:
+            metadata_base_db_path = self.get_metadata_base_db_path(metadata_db_path)
+            if os.path.isfile(metadata_base_db_path):
+                return BimMetadataStore(metadata_db_path, metadata_base_db_path)
+            print(f"Metadata db: {os.path.basename(metadata_base_db_path)} not found, only the changed elements are written")
+        return BimMetadataStore(metadata_db_path)
 
-        self.ifc_types_to_ignore = ignore_ifc_types
-        
+    def convert_ifc_to_usd(self, ifc_file_path, angular_tolerance, deflection_tolerance):
+        self.convert_ifc_hierarchy_to_usd(ifc_file_path, angular_tolerance, deflection_tolerance)
 
+        # in a delta conversion only added and modified products are tessellated
+        products_ids_to_include = None
+        if self.is_delta_conversion:
+            products_ids_to_include = self.get_changed_products_ids()
+        elif self.ifc_manager.filter_ifc_types:
+            # children of ignored elements (e.g. openings of ignored walls) are not in the hierarchy either,
+            # elements not in the types to include are filtered out by the geometry iterator
+            products_ids_to_include = self.get_hierarchy_products_ids()
 
+        mesh_reused_counter = 0
+        ifc_geometry_iterator = self.ifc_manager.prepare_geometry_iterator(products_ids_to_include)
 
-    def convert_ifc_to_usd(self, ifc_file_path, angular_tolerance, deflection_tolerance):
+        if self.merged_meshes_manager is not None:
+            self.merged_meshes_groups_paths = self.get_merged_meshes_groups_paths()
+
+        conversion_timer = Timer("Geometry")
+        conversion_timer.start()
+        self.create_ifc_geometry_in_usd(mesh_reused_counter, ifc_geometry_iterator)
+        conversion_timer.stop()
+
+        if self.isolated_geometry_manager is not None:
+            self.write_slow_elements_report()
+
+        if self.merged_meshes_manager is not None:
+            self.create_merged_meshes()
+
+        if self.lod_variants_manager is not None:
+            self.create_lod_variants(products_ids_to_include, angular_tolerance, deflection_tolerance)
+
+        if self.incremental:
+            self.complete_incremental_conversion()
+
+        self.create_extents_hints()
+
+        if self.storey_payloads_manager is not None:
+            self.create_storey_payloads()
+
+        self.usd_manager.save_stage()
+
+    def write_slow_elements_report(self):
+        """
+        print the slowest products of the IFC file and write them (with the products given up) in the slow elements report
+        """
+        self.isolated_geometry_manager.print_products_timings()
+
+        usd_output_directory = os.path.dirname(self.usd_output_path)
+        usd_output_name = os.path.basename(self.usd_output_path).split('.')[0]
+        slow_elements_report_path = os.path.join(usd_output_directory, f"{usd_output_name}.slow_elements.json")
+
+        self.slow_elements_report["files"][self.ifc_manager.ifc_file_name] = self.isolated_geometry_manager.get_slow_products_report(SLOW_ELEMENTS_REPORT_SIZE)
+        with open(slow_elements_report_path, "w", encoding="utf-8") as report_file:
+            json.dump(self.slow_elements_report, report_file, indent=2)
+        print(f"Slow elements report written: {slow_elements_report_path}")
+
+    def convert_ifc_hierarchy_to_usd(self, ifc_file_path, angular_tolerance, deflection_tolerance):
+        """
+        open the IFC file and create its hierarchy (with properties) in the stage, without geometry.
+        """
         self.usd_manager.clear_prims_reference()
+        self.elements_extents = dict()
+        self.meshes_lods_prototypes_paths = dict()
         #print("ciao " + self.generate_uvs)
-        self.ifc_manager = IfcManager(ifc_file_path, self.ifc_types_to_ignore, angular_tolerance, deflection_tolerance, self.generate_uvs, self.take_texture_from_ifc)
+        self.ifc_manager = IfcManager(ifc_file_path, self.ifc_types_to_ignore, angular_tolerance, deflection_tolerance, self.generate_uvs, self.take_texture_from_ifc, self.geometry_cache_path, self.ifc_types_to_include)
+        self.clear_property_sets()
+
+        if self.incremental:
+            self.previous_elements = self.manifest["files"].get(self.ifc_manager.ifc_file_name, dict())
+            self.current_elements = dict()
+            self.added_guids = set()
+            self.modified_guids = set()
+            # a change of settings changes all the fingerprints, every element is converted again
+            self.settings_signature = f"{angular_tolerance}|{deflection_tolerance}|{self.generate_uvs}|{self.take_texture_from_ifc}|{self.generate_colliders}|{self.reuse_geometry}|{self.shared_property_sets}|{sorted(self.ifc_types_to_ignore)}|{sorted(self.ifc_types_to_include)}|{self.weld}|{self.weld_tolerance}|{self.primvars_encoding}|{self.omit_flat_normals}"
         
         filename_without_extension = os.path.basename(ifc_file_path).split('.')[0]
 
         model_prim = self.usd_manager.define_container_prim(
             filename_without_extension
         )
-        mesh_reused_counter = 0
-        ifc_geometry_iterator = self.ifc_manager.geometry_iterator
 
         conversion_timer = Timer("Hierarchy")
         conversion_timer.start()
-        self.create_ifc_hierarchy_in_usd(model_prim, self.usd_manager.stage)
+        with self.usd_manager.authoring_block():
+            self.create_ifc_hierarchy_in_usd(model_prim, self.usd_manager.stage)
         conversion_timer.stop()
 
-        conversion_timer = Timer("Geometry")
+        if self.metadata_store is not None and self.is_delta_conversion is False:
+            self.metadata_store.commit()
+
+    def convert_ifc_shard_to_usd(self, ifc_file_path, angular_tolerance, deflection_tolerance, products_ids, guids_and_prim_paths):
+        """
+        create only the geometry of the given products (a shard of the IFC file),
+        over the hierarchy prims created in another layer.\n
+        guids_and_prim_paths maps the guid of each product to its hierarchy prim path.
+        """
+        self.usd_manager.clear_prims_reference()
+        self.ifc_manager = IfcManager(ifc_file_path, self.ifc_types_to_ignore, angular_tolerance, deflection_tolerance, self.generate_uvs, self.take_texture_from_ifc, self.geometry_cache_path, self.ifc_types_to_include)
+        ifc_geometry_iterator = self.ifc_manager.prepare_geometry_iterator(products_ids)
+
+        for guid, prim_path in guids_and_prim_paths.items():
+            self.usd_manager.override_prim(guid, prim_path)
+
+        conversion_timer = Timer(f"Geometry ({len(products_ids)} products)")
         conversion_timer.start()
-        self.create_ifc_geometry_in_usd(mesh_reused_counter, ifc_geometry_iterator)
+        self.create_ifc_geometry_in_usd(0, ifc_geometry_iterator)
         conversion_timer.stop()
 
         self.usd_manager.save_stage()
 
-    def create_ifc_geometry_in_usd(self, mesh_reused_counter, ifc_geometry_iterator):
-        if ifc_geometry_iterator.initialize():
-            try:
-                while True:
-                    ifc_mesh_info = self.ifc_manager.get_ifc_mesh_info()
-                    
-
-                    if (ifc_mesh_info is None):
-                        if not ifc_geometry_iterator.next():
-                            break
-                        continue
+    def get_changed_products_ids(self):
+        """
+        return the ids of the added and modified elements which have a representation.
+        """
+        products_ids = []
+        for guid in self.added_guids | self.modified_guids:
+            ifc_element = self.ifc_manager.ifc_file.by_guid(guid)
+            if getattr(ifc_element, "Representation", None) is not None:
+                products_ids.append(ifc_element.id())
+        return products_ids
+
+    def get_hierarchy_products_ids(self):
+        """
+        return the ids of the elements created in the hierarchy which have a representation.
+        """
+        products_ids = []
+        for guid in self.usd_manager.guids_prims_dict:
+            ifc_element = self.ifc_manager.ifc_file.by_guid(guid)
+            if getattr(ifc_element, "Representation", None) is not None:
+                products_ids.append(ifc_element.id())
+        return products_ids
+
+    def add_element_extent(self, guid, verts, matrix):
+        """
+        add the bounds of a mesh (placed by the matrix) to the bounds of its element
+        """
+        extent = geomery_helper.get_extent(verts)
+        if extent is None:
+            return
+        extent = geomery_helper.get_transformed_extent(extent, matrix)
+
+        element_extent = self.elements_extents.get(guid)
+        if element_extent is not None:
+            extent = np.stack((np.minimum(element_extent[0], extent[0]), np.maximum(element_extent[1], extent[1])))
+        self.elements_extents[guid] = extent
+
+    def create_extents_hints(self):
+        """
+        set the extentsHint of the building and storey prims of the current IFC file,
+        the union of the bounds of the element meshes they contain (the hierarchy prims are not transformed).\n
+        In a delta conversion the unchanged meshes are only in the base layer, the bounds are computed
+        on the composed stage from the extent of the meshes.
+        """
+        guids_prims_dict = self.usd_manager.guids_prims_dict
+        prims = [
+            guids_prims_dict[ifc_element.GlobalId]
+            for ifc_type in ("IfcBuilding", "IfcBuildingStorey")
+            for ifc_element in self.ifc_manager.ifc_file.by_type(ifc_type)
+            if ifc_element.GlobalId in guids_prims_dict
+        ]
+        if len(prims) == 0:
+            return
+
+        if self.is_delta_conversion:
+            bbox_cache = UsdGeom.BBoxCache(Usd.TimeCode.Default(), [UsdGeom.Tokens.default_, UsdGeom.Tokens.render], useExtentsHint=False)
+            for prim in prims:
+                extents_hint = bbox_cache.ComputeUntransformedBound(prim).ComputeAlignedRange()
+                if extents_hint.IsEmpty() is False:
+                    self.usd_manager.set_extents_hint(prim, [extents_hint.GetMin(), extents_hint.GetMax()])
+            return
+
+        prims_indices = {prim.GetPath(): prim_index for prim_index, prim in enumerate(prims)}
+        extents_prims_indices = []
+        extents = []
+        for guid, extent in self.elements_extents.items():
+            element_prim = guids_prims_dict.get(guid)
+            if element_prim is None:
+                continue
+            for prim_path in element_prim.GetPath().GetPrefixes():
+                prim_index = prims_indices.get(prim_path)
+                if prim_index is not None:
+                    extents_prims_indices.append(prim_index)
+                    extents.append(extent)
+        if len(extents) == 0:
+            return
+
+        extents = np.asarray(extents)
+        extents_hints = np.stack((np.full((len(prims), 3), np.inf), np.full((len(prims), 3), -np.inf)), axis=1)
+        np.minimum.at(extents_hints[:, 0], extents_prims_indices, extents[:, 0])
+        np.maximum.at(extents_hints[:, 1], extents_prims_indices, extents[:, 1])
+
+        for prim, extents_hint in zip(prims, extents_hints):
+            if np.isfinite(extents_hint).all():
+                self.usd_manager.set_extents_hint(prim, extents_hint)
+
+    def create_storey_payloads(self):
+        """
+        move the content of the building storeys of the current IFC file in payload layers,
+        then remove the prototypes referenced only by that content.
+        """
+        guids_prims_dict = self.usd_manager.guids_prims_dict
+        storeys_paths = sorted(
+            str(guids_prims_dict[ifc_storey.GlobalId].GetPath()) for ifc_storey in self.ifc_manager.ifc_file.by_type("IfcBuildingStorey")
+            if ifc_storey.GlobalId in guids_prims_dict
+        )
+        # storeys inside another storey are moved with it
+        storeys_paths = [
+            storey_path for storey_path in storeys_paths
+            if not any(Sdf.Path(storey_path).HasPrefix(Sdf.Path(other_storey_path)) for other_storey_path in storeys_paths if other_storey_path != storey_path)
+        ]
+        if len(storeys_paths) == 0:
+            return
+
+        layer = self.usd_manager.get_authoring_layer()
+        payloads_name = self.ifc_manager.ifc_file_name.split('.')[0]
+        self.storey_payloads_manager.create_storey_payloads(layer, storeys_paths, payloads_name)
+
+        prototypes_path = self.usd_manager.get_safe_prim_name("Prototypes")
+        if self.storey_payloads_manager.remove_unreferenced_prims(layer, prototypes_path):
+            self.usd_manager.prototypes_container_prim = None
+        self.mesh_hashes_and_prototype_paths = {
+            mesh_hash: prototype_path for mesh_hash, prototype_path in self.mesh_hashes_and_prototype_paths.items()
+            if layer.GetPrimAtPath(prototype_path) is not None
+        }
+
+    def get_merged_meshes_groups_paths(self):
+        """
+        return the paths of the building storey prims of the current IFC file
+        """
+        guids_prims_dict = self.usd_manager.guids_prims_dict
+        return set(
+            guids_prims_dict[ifc_storey.GlobalId].GetPath() for ifc_storey in self.ifc_manager.ifc_file.by_type("IfcBuildingStorey")
+            if ifc_storey.GlobalId in guids_prims_dict
+        )
 
-                    guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info = ifc_mesh_info
+    def get_merged_meshes_group_path(self, element_path):
+        """
+        return the path of the nearest building storey containing the element,
+        the IFC file container prim for elements outside the storeys.
+        """
+        element_path = Sdf.Path(element_path)
+        prims_paths = element_path.GetPrefixes()
+        for prim_path in reversed(prims_paths):
+            if prim_path in self.merged_meshes_groups_paths:
+                return prim_path
+        return prims_paths[min(1, len(prims_paths) - 1)]
+
+    def add_merged_ifc_meshes(self, ifc_meshes_info):
+        for ifc_mesh_info in ifc_meshes_info:
+            guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info = ifc_mesh_info
+
+            group_path = self.get_merged_meshes_group_path(self.usd_manager.find_mesh_parent_prim_path(guid))
+            # meshes without materials are merged without binding
+            materials_and_faces_indices = self.get_mesh_materials(ifc_type, materials, materials_ids, ifc_texture_info) or [(None, None)]
+            self.merged_meshes_manager.add_mesh(
+                group_path, guid, faces, verts, matrix, normals, uvs if self.generate_uvs else None, bool(ifc_texture_info), materials_and_faces_indices
+            )
 
-                    matrix = self.fix_matrix(matrix)
+    def create_merged_meshes(self):
+        """
+        write a mesh for every building storey and material, in the 'MergedMeshes' scope of the storey prim,
+        with the element of every face in the 'elementId' primvar (an index of the IFC:elementGuids array).
+        """
+        merged_meshes_count = 0
+        for group_path, mesh_index, merged_mesh in self.merged_meshes_manager.get_merged_meshes():
+            points, faces, normals, uvs, elements_ids = merged_mesh.get_buffers()
+
+            usd_mesh = self.usd_manager.create_usd_merged_mesh(str(group_path), f"Mesh_{mesh_index}")
+            with Sdf.ChangeBlock():
+                self.set_usd_mesh(usd_mesh, faces, points, None, uvs, normals, uvs_face_varying=merged_mesh.uvs_face_varying)
+                self.usd_manager.generate_mesh_elements_ids(usd_mesh, elements_ids, merged_mesh.elements_guids, self.base_namespace)
+
+            if merged_mesh.material is not None:
+                material_name, material_color, material_transparency, texture_info = merged_mesh.material
+                if self.take_texture_from_ifc:
+                    self.emit_texture(texture_info)
+                self.usd_manager.assign_mesh_material(usd_mesh, material_name, material_color, material_transparency, texture_info)
+            merged_meshes_count += 1
+
+        print(f"Merged meshes: {self.merged_meshes_manager.meshes_count} element meshes merged in {merged_meshes_count} meshes")
+        self.merged_meshes_manager.clear_meshes()
+
+    def create_lod_variants(self, products_ids_to_include, angular_tolerance, deflection_tolerance):
+        """
+        tessellate the products again for every coarser LOD (tolerances multiplied by the LOD factor at every level),
+        the meshes are deduplicated with the prototypes, then the element meshes are moved in LOD variants.\n
+        An element without a mesh at some LOD shows the one of the previous LOD.
+        """
+        for lod in range(1, self.lod_variants_manager.lods_count):
+            lod_scale = self.lod_factor ** lod
+            self.ifc_manager.set_geometry_tolerances(angular_tolerance * lod_scale, deflection_tolerance * lod_scale)
+            ifc_geometry_iterator = self.ifc_manager.prepare_geometry_iterator(products_ids_to_include)
+
+            conversion_timer = Timer(f"Geometry LOD{lod}")
+            conversion_timer.start()
+            self.create_ifc_lod_geometry_in_usd(lod, ifc_geometry_iterator)
+            for prototypes_paths in self.meshes_lods_prototypes_paths.values():
+                if len(prototypes_paths) == lod:
+                    prototypes_paths.append(prototypes_paths[-1])
+            conversion_timer.stop()
+
+        self.print_reused_meshes()
+
+        guids_prims_dict = self.usd_manager.guids_prims_dict
+        meshes_paths_and_prototypes_paths = {
+            guids_prims_dict[guid].GetPath().AppendChild("Mesh_"): prototypes_paths
+            for guid, prototypes_paths in self.meshes_lods_prototypes_paths.items()
+            if guid in guids_prims_dict
+        }
+        self.lod_variants_manager.create_lod_variants(self.usd_manager.get_authoring_layer(), meshes_paths_and_prototypes_paths)
+
+    def create_ifc_lod_geometry_in_usd(self, lod, ifc_geometry_iterator):
+        try:
+            for ifc_mesh_info in self.ifc_manager.get_cached_ifc_mesh_infos():
+                self.author_ifc_lod_mesh(ifc_mesh_info, lod)
+        except Exception as e:
+            traceback.print_exc()
+            print(e)
+
+        try:
+            for ifc_mesh_info in self.get_iterated_ifc_mesh_infos(ifc_geometry_iterator):
+                self.author_ifc_lod_mesh(ifc_mesh_info, lod)
+        except Exception as e:
+            traceback.print_exc()
+            print(e)
+
+    def author_ifc_lod_mesh(self, ifc_mesh_info, lod):
+        """
+        add the prototype of a coarser mesh to the LOD prototypes of its element,
+        the placement is the one of the finest mesh.
+        """
+        guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info = ifc_mesh_info
+
+        prototypes_paths = self.meshes_lods_prototypes_paths.get(guid)
+        if prototypes_paths is None:
+            # no mesh at the finest LOD
+            return
+
+        mesh_hash = self.get_mesh_hash(ifc_type, faces, verts, materials, materials_ids, uvs, normals, ifc_texture_info)
+        prototype_mesh, prototype_path = self.get_prototype_mesh(mesh_hash)
+        if prototype_mesh is not None:
+            with Sdf.ChangeBlock():
+                self.set_usd_mesh(prototype_mesh, faces, verts, None, uvs, normals, uvs_face_varying=bool(ifc_texture_info))
+            self.manage_mesh_material(ifc_type, materials, materials_ids, prototype_mesh, ifc_texture_info)
+
+        # a duplicate guid replaces the mesh of the same LOD
+        prototypes_paths[lod:] = [prototype_path]
+
+    def complete_incremental_conversion(self):
+        """
+        in a delta conversion deleted elements are deactivated, and what the base layer says about
+        the meshes of modified elements is hidden if not written again.\n
+        In a base conversion the manifest is written.
+        """
+        if self.is_delta_conversion is False:
+            self.manifest["files"][self.ifc_manager.ifc_file_name] = self.current_elements
+            with open(self.manifest_path, "w", encoding="utf-8") as manifest_file:
+                json.dump(self.manifest, manifest_file)
+            print(f"Incremental conversion: manifest of {len(self.current_elements)} elements written")
+
+            if self.metadata_store is not None:
+                # the delta conversions start from this copy
+                shutil.copyfile(self.metadata_db_path, self.get_metadata_base_db_path(self.metadata_db_path))
+            return
+
+        deleted_count = 0
+        for guid, previous_element in self.previous_elements.items():
+            current_element = self.current_elements.get(guid)
+            # an element moved under another parent is deleted from the old path
+            if current_element is None or current_element["path"] != previous_element["path"]:
+                self.usd_manager.deactivate_prim(previous_element["path"])
+                deleted_count += 1
+
+        for guid in self.modified_guids:
+            self.usd_manager.block_opinions_not_in_edit_layer(self.current_elements[guid]["path"] + "/Mesh_")
+
+        if self.metadata_store is not None:
+            deleted_guids = [guid for guid in self.previous_elements if guid not in self.current_elements]
+            self.metadata_store.remove_elements(deleted_guids)
+            self.metadata_store.commit()
+
+        unchanged_count = len(self.current_elements) - len(self.added_guids) - len(self.modified_guids)
+        print(f"Incremental conversion: {len(self.added_guids)} added, {len(self.modified_guids)} modified, {deleted_count} deleted, {unchanged_count} unchanged elements")
 
-                    # TODO: just for completness, create an argument flag to determine if reuse mesh references or not?
+    def create_ifc_geometry_in_usd(self, mesh_reused_counter, ifc_geometry_iterator):
+        self.mesh_reused_counter = mesh_reused_counter
+
+        if self.pipeline_geometry:
+            self.create_ifc_geometry_in_usd_pipelined(ifc_geometry_iterator)
+            return
+
+        try:
+            for ifc_mesh_info in self.ifc_manager.get_cached_ifc_mesh_infos():
+                self.author_ifc_meshes([ifc_mesh_info])
+        except Exception as e:
+            traceback.print_exc()
+            print(e)
+
+        try:
+            for ifc_mesh_info in self.get_iterated_ifc_mesh_infos(ifc_geometry_iterator):
+                self.author_ifc_meshes([ifc_mesh_info])
+        except Exception as e:
+            traceback.print_exc()
+            print(e)
+
+        self.print_reused_meshes()
+
+    def get_iterated_ifc_mesh_infos(self, ifc_geometry_iterator):
+        """
+        yield the mesh infos of the geometry iterator,
+        or of the isolated worker processes when there is an element time budget.
+        """
+        if self.isolated_geometry_manager is not None:
+            yield from self.isolated_geometry_manager.get_ifc_mesh_infos(self.ifc_manager)
+            return
+
+        if ifc_geometry_iterator is not None and ifc_geometry_iterator.initialize():
+            while True:
+                ifc_mesh_info = self.ifc_manager.get_ifc_mesh_info()
+
+                if (ifc_mesh_info is not None):
+                    yield ifc_mesh_info
+
+                if not ifc_geometry_iterator.next():
+                    break
+
+    def print_reused_meshes(self):
+        if (self.reuse_geometry):
+            print(f"Unique meshes: {len(self.mesh_hashes_and_prototype_paths)}, reused meshes: {self.mesh_reused_counter}")
+        if (self.weld):
+            print(f"Welded points: {self.welded_points_counts[0]} -> {self.welded_points_counts[1]}")
+        if (self.omit_flat_normals):
+            print(f"Meshes without normals (computed by the renderer): {self.omitted_normals_counter}")
+        self.usd_manager.print_materials()
+
+    def create_ifc_geometry_in_usd_pipelined(self, ifc_geometry_iterator):
+        """
+        a producer thread drains the geometry iterator in a bounded queue of mesh infos,
+        while this thread authors the stage in batches.\n
+        At the end the queue depth and the time each side stalled are reported.
+        """
+        ifc_meshes_queue = queue.Queue(maxsize=self.pipeline_queue_size)
+        end_of_meshes = None
+        producer_stats = {"stall_time": 0.0, "meshes": 0}
+
+        def produce_ifc_meshes():
+            try:
+                for ifc_mesh_info in self.ifc_manager.get_cached_ifc_mesh_infos():
+                    stall_start = time.perf_counter()
+                    ifc_meshes_queue.put(ifc_mesh_info)
+                    producer_stats["stall_time"] += time.perf_counter() - stall_start
+                    producer_stats["meshes"] += 1
+
+                for ifc_mesh_info in self.get_iterated_ifc_mesh_infos(ifc_geometry_iterator):
+                    stall_start = time.perf_counter()
+                    ifc_meshes_queue.put(ifc_mesh_info)
+                    producer_stats["stall_time"] += time.perf_counter() - stall_start
+                    producer_stats["meshes"] += 1
+            except Exception as e:
+                traceback.print_exc()
+                print(e)
+            finally:
+                ifc_meshes_queue.put(end_of_meshes)
+
+        producer = threading.Thread(target=produce_ifc_meshes, name="ifc_geometry_producer", daemon=True)
+        producer.start()
+
+        consumer_stall_time = 0.0
+        queue_depths = []
+        batches_count = 0
+        is_producer_done = False
+
+        while not is_producer_done:
+            queue_depths.append(ifc_meshes_queue.qsize())
+
+            stall_start = time.perf_counter()
+            ifc_mesh_info = ifc_meshes_queue.get()
+            consumer_stall_time += time.perf_counter() - stall_start
+
+            if ifc_mesh_info is end_of_meshes:
+                break
+
+            # take what is already available, without waiting, and author it as one batch
+            ifc_meshes_info = [ifc_mesh_info]
+            while len(ifc_meshes_info) < self.pipeline_queue_size:
+                try:
+                    ifc_mesh_info = ifc_meshes_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if ifc_mesh_info is end_of_meshes:
+                    is_producer_done = True
+                    break
+                ifc_meshes_info.append(ifc_mesh_info)
 
-                    if (self.reuse_geometry):
-                        is_same_mesh_used = self.verts_and_relative_usd_mesh_path.get(verts) is not None
-                        if (is_same_mesh_used):
-                            mesh_to_reuse = self.verts_and_relative_usd_mesh_path[verts]
-                            usd_mesh = self.usd_manager.reuse_usd_mesh(guid, mesh_to_reuse)
-                            self.set_usd_mesh(usd_mesh, faces, verts, matrix, uvs, normals)
+            try:
+                self.author_ifc_meshes(ifc_meshes_info)
+            except Exception as e:
+                traceback.print_exc()
+                print(e)
+            batches_count += 1
+
+        producer.join()
+
+        average_queue_depth = sum(queue_depths) / len(queue_depths) if len(queue_depths) > 0 else 0
+        max_queue_depth = max(queue_depths) if len(queue_depths) > 0 else 0
+        print(f"""Geometry pipeline
+              meshes: {producer_stats["meshes"]}, authoring batches: {batches_count}
+              queue depth: average {average_queue_depth:0.1f}, max {max_queue_depth} (size {self.pipeline_queue_size})
+              tessellation stalled on full queue: {producer_stats["stall_time"]:0.4f} seconds
+              authoring stalled on empty queue: {consumer_stall_time:0.4f} seconds""")
+
+        self.print_reused_meshes()
+
+    def author_ifc_meshes(self, ifc_meshes_info):
+        """
+        author a batch of ifc meshes in the stage:\n
+        prims are defined first, then all the mesh data is written in a single Sdf.ChangeBlock
+        (prims can not be defined inside a change block), then materials are assigned.
+        """
+        for ifc_mesh_info in ifc_meshes_info:
+            # the matrix of the mesh info is fixed in place
+            self.fix_matrix(ifc_mesh_info[4])
+            self.add_element_extent(ifc_mesh_info[0], ifc_mesh_info[3], ifc_mesh_info[4])
+
+        if self.merged_meshes_manager is not None:
+            self.add_merged_ifc_meshes(ifc_meshes_info)
+            return
+
+        usd_meshes = [self.define_ifc_mesh_prims(ifc_mesh_info) for ifc_mesh_info in ifc_meshes_info]
+
+        with Sdf.ChangeBlock():
+            for ifc_mesh_info, (usd_mesh, usd_mesh_instance) in zip(ifc_meshes_info, usd_meshes):
+                guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info = ifc_mesh_info
+
+                if usd_mesh_instance is None:
+                    self.set_usd_mesh(usd_mesh, faces, verts, matrix, uvs, normals, uvs_face_varying=bool(ifc_texture_info))
+                    continue
 
-                            self.manage_mesh_material(ifc_type, materials, materials_ids, usd_mesh, ifc_texture_info)
-                            mesh_reused_counter += 1
-                        else:
-                            usd_mesh = self.usd_manager.create_usd_mesh_(guid)
-                            self.set_usd_mesh(usd_mesh, faces, verts, matrix, uvs, normals)
+                if usd_mesh is not None:
+                    # first occurrence, the prototype has to be filled (the collider is shared by the instances)
+                    self.set_usd_mesh(usd_mesh, faces, verts, None, uvs, normals, uvs_face_varying=bool(ifc_texture_info))
+
+                self.usd_manager.assign_transform_matrix(usd_mesh_instance, matrix)
+
+        for ifc_mesh_info, (usd_mesh, usd_mesh_instance) in zip(ifc_meshes_info, usd_meshes):
+            guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info = ifc_mesh_info
+
+            if usd_mesh is not None:
+                self.manage_mesh_material(ifc_type, materials, materials_ids, usd_mesh, ifc_texture_info)
+
+    def define_ifc_mesh_prims(self, ifc_mesh_info):
+        """
+        define the prims needed by an ifc mesh and return (usd_mesh, usd_mesh_instance):\n
+        usd_mesh is the mesh to fill (None if an already created prototype is reused),
+        usd_mesh_instance is the instanceable Xform referencing the prototype (None without reuse geometry).
+        """
+        guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info = ifc_mesh_info
+
+        if (self.reuse_geometry is False):
+            return (self.usd_manager.create_usd_mesh_(guid), None)
+
+        # every unique mesh is written once under the prototypes scope,
+        # each occurrence is an instanceable prim referencing it
+        mesh_hash = self.get_mesh_hash(ifc_type, faces, verts, materials, materials_ids, uvs, normals, ifc_texture_info)
+        prototype_mesh, prototype_path = self.get_prototype_mesh(mesh_hash)
+
+        usd_mesh_instance = self.usd_manager.reuse_usd_mesh(guid, prototype_path)
+        if self.lod_variants_manager is not None:
+            self.meshes_lods_prototypes_paths[guid] = [prototype_path]
+
+        return (prototype_mesh, usd_mesh_instance)
+
+    def get_prototype_mesh(self, mesh_hash):
+        """
+        return (prototype_mesh, prototype_path) of a mesh hash:\n
+        prototype_mesh is the prototype to fill, None if already created.
+        """
+        prototype_path = self.mesh_hashes_and_prototype_paths.get(mesh_hash)
+        if prototype_path is None:
+            # e.g. written in the base layer of an incremental conversion
+            prototype_path = self.usd_manager.get_usd_prototype_mesh_path_if_created(mesh_hash)
+            if prototype_path is not None:
+                self.mesh_hashes_and_prototype_paths[mesh_hash] = prototype_path
+
+        prototype_mesh = None
+        if prototype_path is None:
+            # the mesh is a child of the referenced prototype Xform
+            prototype_mesh = self.usd_manager.create_usd_prototype_mesh(mesh_hash)
+            prototype_path = str(prototype_mesh.GetPath().GetParentPath())
+            self.mesh_hashes_and_prototype_paths[mesh_hash] = prototype_path
+        else:
+            self.mesh_reused_counter += 1
 
-                            self.manage_mesh_material(ifc_type, materials, materials_ids, usd_mesh, ifc_texture_info)
+        return (prototype_mesh, prototype_path)
 
-                            self.verts_and_relative_usd_mesh_path[verts] = str(usd_mesh.GetPath())
-                    else:
-                        usd_mesh = self.usd_manager.create_usd_mesh_(guid)
-                        self.set_usd_mesh(usd_mesh, faces, verts, matrix, uvs, normals)
-                        self.manage_mesh_material(ifc_type, materials, materials_ids, usd_mesh, ifc_texture_info)
+    def set_usd_mesh(self, usd_mesh, faces, verts, matrix, uvs, normals, generate_collider=True, uvs_face_varying=False):
+        """
+        write points, faces, normals and uvs of the mesh.
 
-                    if not ifc_geometry_iterator.next():
-                        break
+        normals and uvs of the geometry iterator are per point, uvs of IFC textures (uvs_face_varying) per face corner.
+        """
+        #usd_mesh = self.usd_manager.create_usd_mesh_(name)
 
-                print("Potential mesh to reuse ", mesh_reused_counter)
-            except Exception as e:
-                traceback.print_exc()
-                print(e)
+        if self.weld:
+            # per point normals and uvs are welded with the points
+            points_count = len(verts) // 3
+            verts, faces, normals, welded_uvs = geomery_helper.weld_mesh(
+                verts, faces, self.weld_tolerance, normals, uvs if self.generate_uvs and uvs_face_varying is False else None
+            )
+            if welded_uvs is not None:
+                uvs = welded_uvs
+            self.welded_points_counts[0] += points_count
+            self.welded_points_counts[1] += len(verts) // 3
 
-    def set_usd_mesh(self, usd_mesh, faces, verts, matrix, uvs, normals):
-        #usd_mesh = self.usd_manager.create_usd_mesh_(name)
+        points_count = len(verts) // 3
+        indexed = self.primvars_encoding == "indexed"
 
         self.usd_manager.generate_mesh_vertices(usd_mesh, verts)
         self.usd_manager.generate_mesh_indices(usd_mesh, faces)
-        self.usd_manager.generate_mesh_normals(usd_mesh, normals)
-        self.usd_manager.assign_transform_matrix(usd_mesh, matrix)  # use prim instead of mesh?
+        extent = geomery_helper.get_extent(verts)
+        if extent is not None:
+            self.usd_manager.generate_mesh_extent(usd_mesh, extent)
+        if self.omit_flat_normals and geomery_helper.are_normals_computable(verts, faces, normals):
+            # the renderer computes the same normals
+            self.omitted_normals_counter += 1
+            self.usd_manager.set_subdivision_scheme(usd_mesh, UsdGeom.Tokens.bilinear)
+        else:
+            normals, normals_indices, normals_interpolation = geomery_helper.get_primvar_encoding(
+                normals, faces, points_count, 3, len(normals) // 3 != points_count, indexed
+            )
+            self.usd_manager.generate_mesh_normals(usd_mesh, normals, normals_interpolation, normals_indices)
+        if matrix is not None:
+            self.usd_manager.assign_transform_matrix(usd_mesh, matrix)  # use prim instead of mesh?
         if (self.generate_uvs):
-            self.usd_manager.generate_uvs(usd_mesh, uvs)
-        if (self.generate_colliders):
+            uvs, uvs_indices, uvs_interpolation = geomery_helper.get_primvar_encoding(
+                uvs, faces, points_count, 2, uvs_face_varying, indexed
+            )
+            self.usd_manager.generate_uvs(usd_mesh, uvs, uvs_interpolation, uvs_indices)
+        if (self.generate_colliders and generate_collider):
             self.usd_manager.generate_collider(usd_mesh.GetPrim())  # use prim instead of mesh?
 
 
     def manage_mesh_material(self, ifc_type, materials, materials_ids, usd_mesh, ifc_texture_info):
-        if ifc_type == "IfcOpeningElement" or ifc_type == "IfcSpace":
-            self.usd_manager.assign_mesh_material(usd_mesh, "transparent", [0.0, 0.0, 0.0], 0.0, None)
-        else:
-            if len(materials) == 1:
-                material = materials[0]
-                material_name = material.original_name()
-                if (material_name == "" or material_name is None):
-                    material_name = "undefined"
-
-                material_name = self.ifc_manager.ifc_file_name + "_" + material_name
-                material_color = material.diffuse
-                material_transparency = 1.0
-                #print(dir(material))
-
-                if material.has_transparency:
-                    material_transparency = 1 - material.transparency
-
-                # TODO: better management for texture
-                if self.take_texture_from_ifc:
-                    texture_url = ifc_texture_info.texture_url
-                    texture_complete_path = self.get_relative_texture_if_available(texture_url)
-                    self.copy_texture_usd_output(texture_complete_path, texture_url)
-
-                self.usd_manager.assign_mesh_material(usd_mesh, material_name, material_color, material_transparency,ifc_texture_info)
+        for (material_name, material_color, material_transparency, texture_info), faces_indices in self.get_mesh_materials(ifc_type, materials, materials_ids, ifc_texture_info):
+            if self.take_texture_from_ifc:
+                self.emit_texture(texture_info)
 
+            if faces_indices is None:
+                self.usd_manager.assign_mesh_material(usd_mesh, material_name, material_color, material_transparency, texture_info)
             else:
-                materials_ids_and_counts = self.get_materials_ids_and_relative_counts(materials_ids)
-
-                material_start_index_faces_indices = 0
-                for material_id_and_count in materials_ids_and_counts:
-                    material_id = material_id_and_count[0]
-                    material_count = material_id_and_count[1]
-                    material = materials[material_id]
-                    material_transparency = 1.0
+                self.usd_manager.assign_mesh_subset_material(usd_mesh, material_name, material_color, texture_info, material_transparency, faces_indices)
 
-                    if material.has_transparency:
-                        material_transparency = 1 - material.transparency
-
-
-                    # TODO: better management for texture
-                    if self.take_texture_from_ifc:
-                        texture_url = ifc_texture_info.texture_url
-                        texture_complete_path = self.get_relative_texture_if_available(texture_url)
-                        self.copy_texture_usd_output(texture_complete_path, texture_url)
-
-                    self.usd_manager.assign_mesh_subset_material(usd_mesh, material.original_name(), material.diffuse, ifc_texture_info, material_transparency, material_start_index_faces_indices, material_count )
-
-                    material_start_index_faces_indices += material_count
+    def get_mesh_materials(self, ifc_type, materials, materials_ids, ifc_texture_info):
+        """
+        return [((material name, color, transparency, texture info), faces indices)] of a mesh,
+        faces indices are None when the material is assigned to the whole mesh.
+        """
+        if ifc_type == "IfcOpeningElement" or ifc_type == "IfcSpace":
+            return [(("transparent", [0.0, 0.0, 0.0], 0.0, None), None)]
+
+        if len(materials) == 1:
+            material = materials[0]
+            material_name = material.name
+            if (material_name == "" or material_name is None):
+                material_name = "undefined"
+
+            material_name = self.ifc_manager.ifc_file_name + "_" + material_name
+            material_transparency = 1.0
+            if material.has_transparency:
+                material_transparency = 1 - material.transparency
+
+            return [((material_name, material.diffuse, material_transparency, ifc_texture_info), None)]
+
+        # one subset per material name, authored once with all its faces
+        mesh_materials = []
+        for material, faces_indices in self.get_materials_faces_indices(materials, materials_ids):
+            material_transparency = 1.0
+            if material.has_transparency:
+                material_transparency = 1 - material.transparency
+
+            mesh_materials.append(((material.name, material.diffuse, material_transparency, ifc_texture_info), faces_indices))
+        return mesh_materials
+
+    def emit_texture(self, ifc_texture_info):
+        """
+        copy the texture of a mesh next to the usd output, once per texture file.
+        """
+        if not ifc_texture_info or ifc_texture_info.texture_url is None:
+            return
+
+        texture_url = ifc_texture_info.texture_url
+        texture_complete_path = self.get_relative_texture_if_available(texture_url)
+        if texture_complete_path is None:
+            return
+        if texture_complete_path in self.emitted_textures:
+            return
+
+        self.copy_texture_usd_output(texture_complete_path, texture_url)
+        self.emitted_textures.add(texture_complete_path)
 
     def copy_texture_usd_output(self, texture_complete_path,  texture_name):
         usd_output_directory = os.path.dirname(self.usd_output_path)
 
         usd_output_directory = f"{usd_output_directory}/{os.path.dirname(texture_name)}" #os.path.join(usd_output_directory, os.path.dirname(texture_name))
-        print("USD OUT: " , usd_output_directory)
-
         os.makedirs(f"{usd_output_directory}", exist_ok=True)
-        shutil.copy(texture_complete_path, f"{usd_output_directory}/{os.path.basename(texture_name)}")
-        
+        usd_texture_path = f"{usd_output_directory}/{os.path.basename(texture_name)}"
+        if os.path.isfile(usd_texture_path) and os.path.samefile(texture_complete_path, usd_texture_path):
+            return
+
+        # a hard link when possible (same volume), a copy otherwise
+        if os.path.exists(usd_texture_path):
+            os.remove(usd_texture_path)
+        try:
+            os.link(texture_complete_path, usd_texture_path)
+        except OSError:
+            shutil.copy(texture_complete_path, usd_texture_path)
+
     def create_ifc_hierarchy_in_usd(self, model_prim, usd_stage):
         ifc_projects = self.ifc_manager.get_ifc_projects()
         
         for ifc_project in ifc_projects:
             self.ifc_manager.ifc_project = ifc_project
             self.ifc_types_and_counters = dict()
+            if self.incremental:
+                # added elements are named after the ones of the base layer, no name is reused
+                self.ifc_types_and_counters = self.get_ifc_types_and_counters_from_elements(self.previous_elements)
             self._create_ifc_hierarchy_in_usd(
                 ifc_project,
                 model_prim,
                 usd_stage
             )
 
-    # TODO: simplify the function
     def _create_ifc_hierarchy_in_usd(self, ifc_element, parent_prim, stage):
-        ifc_element_info = ifc_element.get_info()
-        guid = ifc_element.GlobalId
-        ifc_entity = ifc_element.is_a()
+        """
+        create the prims of the element and of all its descendants,
+        following the relationships index (iteratively, depth first, in the order of the inverse attributes).
+        """
+        relationships_index = self.ifc_manager.get_relationships_index()
+
+        elements_and_parent_prims = [(ifc_element, parent_prim)]
+        while len(elements_and_parent_prims) > 0:
+            ifc_element, parent_prim = elements_and_parent_prims.pop()
+
+            # ignored elements are skipped with their children, elements not in the types to include are kept
+            # (without geometry) so their parts in the types to include are still created, e.g. the members of a curtain wall
+            if self.ifc_manager.filter_ifc_types and self.ifc_manager.is_ifc_type_ignored(ifc_element):
+                continue
+
+            ifc_element_info = ifc_element.get_info()
+            guid = ifc_element.GlobalId
+            ifc_entity = ifc_element.is_a()
+
+            if self.incremental:
+                prim = self.create_incremental_prim(ifc_element, ifc_element_info, guid, ifc_entity, parent_prim)
+            else:
+                prim = self.usd_manager.create_prim(parent_prim, guid, self.get_prim_name(ifc_entity))
+                self.ManageElementProperties(ifc_element, ifc_element_info, guid, ifc_entity, prim)
+
+            #-----------------------HIERARCHY CONSTRUCTION -----------------------
+            # follow Spatial relation, Aggregation relation, openings and coverings
+
+            if relationships_index.get_entity_type(ifc_element) == (False, False, False):
+                print(ifc_entity)
+
+            # reversed, so the first child is the next element created
+            children = relationships_index.get_children(ifc_element)
+            for child in reversed(children):
+                elements_and_parent_prims.append((child, prim))
 
-        # define the name to use for the element
+            #HasAssociations #HasAssignments
+
+    def get_prim_name(self, ifc_entity):
+        """
+        define the name to use for the element
+        """
         ifc_type_counter = self.ifc_types_and_counters.get(ifc_entity)
         if ifc_type_counter is None:
             self.ifc_types_and_counters[ifc_entity] = 0
@@ -207,53 +977,50 @@ class Ifc2UsdManager():
             self.ifc_types_and_counters[ifc_entity] = ifc_type_counter + 1
 
         counter_for_type = str(self.ifc_types_and_counters[ifc_entity])
-        prim_name = f"{ifc_entity}_{counter_for_type}"
+        return f"{ifc_entity}_{counter_for_type}"
+
+    def get_ifc_types_and_counters_from_elements(self, elements):
+        """
+        return the last counter used for every ifc type in the prim names of the elements
+        """
+        ifc_types_and_counters = dict()
+        for element in elements.values():
+            ifc_entity, _, counter_for_type = Sdf.Path(element["path"]).name.rpartition("_")
+            if counter_for_type.isdigit():
+                ifc_types_and_counters[ifc_entity] = max(ifc_types_and_counters.get(ifc_entity, 0), int(counter_for_type))
+        return ifc_types_and_counters
+
+    def create_incremental_prim(self, ifc_element, ifc_element_info, guid, ifc_entity, parent_prim):
+        """
+        compare the element with the manifest: an unchanged element keeps the prim of the base layer,
+        a modified one is written again at the same path, an added one (or moved under another parent) gets a new prim.
+        """
+        fingerprint = self.ifc_manager.get_element_fingerprint(ifc_element, self.settings_signature)
+        previous_element = self.previous_elements.get(guid)
+
+        if previous_element is not None and Sdf.Path(previous_element["path"]).GetParentPath() == parent_prim.GetPath():
+            if previous_element["fingerprint"] == fingerprint:
+                prim = self.usd_manager.register_prim(guid, previous_element["path"])
+                self.current_elements[guid] = {"path": previous_element["path"], "fingerprint": fingerprint}
+                return prim
+
+            prim_name = Sdf.Path(previous_element["path"]).name
+            self.modified_guids.add(guid)
+        else:
+            prim_name = self.get_prim_name(ifc_entity)
+            self.added_guids.add(guid)
+
+        if self.metadata_store is not None and self.is_delta_conversion:
+            # the rows copied from the base conversion are replaced
+            self.metadata_store.remove_elements([guid])
 
         prim = self.usd_manager.create_prim(parent_prim, guid, prim_name)
         self.ManageElementProperties(ifc_element, ifc_element_info, guid, ifc_entity, prim)
 
-        #-----------------------HIERARCHY CONSTRUCTION -----------------------
-        # follow Spatial relation
-
-        if(ifc_element.is_a('IfcSpatialStructureElement') is False and ifc_element.is_a('IfcObjectDefinition') is False and ifc_element.is_a('IfcElement') is False):
-            print(ifc_element.is_a())
-
-        if (ifc_element.is_a('IfcSpatialStructureElement')):
-            # print(ifc_element.is_a(), " IfcSpatialStructureElement:")
-            for rel in ifc_element.ContainsElements:
-                relatedElements = rel.RelatedElements
-                if relatedElements is None:
-                    continue
-                for child in relatedElements:
-                    prim_as_parent = prim
-                    self._create_ifc_hierarchy_in_usd(child,  prim, stage)        
-        # follow Aggregation Relation
-        if (ifc_element.is_a('IfcObjectDefinition')):
-            for rel in ifc_element.IsDecomposedBy:
-                relatedObjects = rel.RelatedObjects
-                if relatedObjects:
-                    for child in relatedObjects:
-                        self._create_ifc_hierarchy_in_usd(child,  prim, stage)
-                
-        # check for openings
-        if (ifc_element.is_a('IfcElement')):
-            #print(dir(ifc_element))
-            if len(ifc_element.HasOpenings) > 0:
-                for openingRelation in ifc_element.HasOpenings:
-                    opening = openingRelation.RelatedOpeningElement
-                    self._create_ifc_hierarchy_in_usd(opening,  prim, stage)
-            if len(ifc_element.HasCoverings) > 0:
-                
-                for coveringRelation in ifc_element.HasCoverings:
-                    for covering in coveringRelation.RelatedCoverings:
-                        #covering = coveringRelation.RelatedCoverings
-                        self._create_ifc_hierarchy_in_usd(covering,  prim, stage)
-
-            #HasAssociations #HasAssignments
+        self.current_elements[guid] = {"path": str(prim.GetPath()), "fingerprint": fingerprint}
+        return prim
 
     def ManageElementProperties(self, ifc_element, ifc_element_info, guid, ifc_entity, prim):
-        property_sets_instance = PropertySets()
-        quantity_sets_instance = QuantitySets()
         object_info = ObjectInfo()
 
         object_info.GUID = guid
@@ -265,65 +1032,49 @@ class Ifc2UsdManager():
         object_info.ObjectType = ifc_element_info.get("ObjectType") or ""
         object_info.ObjectType = ifc_element_info.get("Tag") or ""
 
+        # ids of the IfcPropertySet/IfcElementQuantity of the element,
+        # each one is parsed and serialized once, the first time it is found
+        property_sets_ids = []
+        quantity_sets_ids = []
+
         # --------------------MANAGE PROPERTIES -----------------------#
-        for definition in ifc_element.IsDefinedBy:
-            if definition.is_a('IfcRelDefinesByProperties'):
-                related_data = definition.RelatingPropertyDefinition
+        for definition in self.ifc_manager.get_relationships_index().get_defining_relationships(ifc_element):
+            # relationships and property definitions used here have no subtypes, the class name is enough
+            definition_type = definition.is_a()
 
-                if related_data.is_a('IfcPropertySet'):
-                    property_set_name = related_data.Name
-                    property_set_guid = related_data.GlobalId
-                    properties = self.ifc_manager.get_element_properties(
-                        related_data,
-                    )
+            if definition_type == 'IfcRelDefinesByProperties':
+                related_data = definition.RelatingPropertyDefinition
+                related_data_type = related_data.is_a()
 
-                    if properties is None or len(properties) == 0:
+                if related_data_type == 'IfcPropertySet':
+                    if self.get_property_set(related_data) is None:
                         continue
+                    property_sets_ids.append(related_data.id())
 
-                    property_set = PropertySet(property_set_guid, property_set_name)
-                    property_set.Properties = properties
-                    property_sets_instance.property_sets.append(property_set)
-
-                elif related_data.is_a('IfcElementQuantity'):
-                    quantitySet = self.ifc_manager.get_element_quantities(
-                        related_data,
-                    )
+                elif related_data_type == 'IfcElementQuantity':
+                    self.get_quantity_set(related_data)
+                    quantity_sets_ids.append(related_data.id())
 
-                    quantity_sets_instance.quantity_sets.append(quantitySet)
+            if definition_type == 'IfcRelDefinesByType':
+                element_type_info, type_property_sets_ids = self.get_element_type_info(definition.RelatingType)
 
-            if definition.is_a('IfcRelDefinesByType'):
-                definition_type_info = definition.RelatingType.get_info()
-
-                object_info.ConstructionType = definition_type_info.get("ConstructionType") or ""
-                object_info.OperationType = definition_type_info.get("OperationType") or ""
-                object_info.PredefinedType = definition_type_info.get("PredefinedType") or ""
-                object_info.ElementType = definition_type_info.get("ElementType") or ""
+                object_info.ConstructionType = element_type_info["ConstructionType"]
+                object_info.OperationType = element_type_info["OperationType"]
+                object_info.PredefinedType = element_type_info["PredefinedType"]
+                object_info.ElementType = element_type_info["ElementType"]
 
                 #ifcObjectType = ObjectInfo(guid, ifc_entity, definition_type, definition_name, definition_tag, definition_element_type, definition_predefined_type, definition_construction_type, definition_operation_type)
 
-                if (definition.RelatingType.HasPropertySets is not None):
-                    for property_set in definition.RelatingType.HasPropertySets:
-                        pset_name = property_set.Name
-                        pset_guid = property_set.GlobalId
-                        properties = self.ifc_manager.get_element_properties(
-                            property_set,
-                        )
-
-                        if properties is None or len(properties) == 0:
-                            continue
-
-                        property_set_instance = PropertySet(pset_guid, pset_name)
-                        property_set_instance.properties = properties
-                        property_sets_instance.property_sets.append(property_set_instance)
+                property_sets_ids.extend(type_property_sets_ids)
 
-            if definition.is_a('IfcRelDefinesByTemplate'):
+            if definition_type == 'IfcRelDefinesByTemplate':
                 print("IfcRelDefinesByTemplate")
 
-            if definition.is_a('IfcRelDefinesByObject'):
+            if definition_type == 'IfcRelDefinesByObject':
                 print("IfcRelDefinesByObject")
 
-            if (definition.is_a('IfcRelDefinesByObject') or definition.is_a('IfcRelDefinesByTemplate') or definition.is_a('IfcRelDefinesByType') or definition.is_a('IfcRelDefinesByProperties')) is False:
-                print(definition.is_a())
+            if definition_type not in ('IfcRelDefinesByObject', 'IfcRelDefinesByTemplate', 'IfcRelDefinesByType', 'IfcRelDefinesByProperties'):
+                print(definition_type)
 
         # Setting all the psets as a prim attribute
         # if we use namespaces to define also the single property set level
@@ -332,10 +1083,26 @@ class Ifc2UsdManager():
                 
         self.usd_manager.create_prim_string_attribute(prim,"guid",guid,self.base_namespace)
         self.usd_manager.create_prim_string_attribute(prim,"ifcType",ifc_entity,self.base_namespace)
-        self.usd_manager.create_prim_string_attribute(prim, "propertySets", property_sets_instance.toJSON(), self.base_namespace )
-        self.usd_manager.create_prim_string_attribute(prim, "quantitySets", quantity_sets_instance.toJSON(), self.base_namespace )
+
+        if self.shared_property_sets:
+            # each set is a prim under /PropertySets or /QuantitySets, the element targets them (if any)
+            property_sets_paths = [self.get_shared_set_prim_path("PropertySets", self.property_sets_json[property_set_id]) for property_set_id in property_sets_ids]
+            quantity_sets_paths = [self.get_shared_set_prim_path("QuantitySets", self.quantity_sets_json[quantity_set_id]) for quantity_set_id in quantity_sets_ids]
+            if len(property_sets_paths) > 0:
+                self.usd_manager.create_prim_relationship(prim, "propertySets", property_sets_paths, self.base_namespace)
+            if len(quantity_sets_paths) > 0:
+                self.usd_manager.create_prim_relationship(prim, "quantitySets", quantity_sets_paths, self.base_namespace)
+        else:
+            property_sets_json = join_json_array([self.property_sets_json[property_set_id] for property_set_id in property_sets_ids])
+            quantity_sets_json = join_json_array([self.quantity_sets_json[quantity_set_id] for quantity_set_id in quantity_sets_ids])
+            self.usd_manager.create_prim_string_attribute(prim, "propertySets", property_sets_json, self.base_namespace )
+            self.usd_manager.create_prim_string_attribute(prim, "quantitySets", quantity_sets_json, self.base_namespace )
+
         self.usd_manager.create_prim_string_attribute(prim, "ifcObjectInfo", object_info.toJSON(), self.base_namespace )
 
+        if self.metadata_store is not None:
+            self.metadata_store.add_element(self.ifc_manager.ifc_file_path, guid, ifc_entity, object_info.Name, str(prim.GetPath()), property_sets_ids, quantity_sets_ids)
+
         #attributes = {
         #    "guid": guid,
         #    "ifcType": ifc_entity,
@@ -346,34 +1113,147 @@ class Ifc2UsdManager():
 
         #self.usd_manager.create_prim_string_attribute(prim,"IFC", json.dumps(attributes), self.base_namespace)
 
-    def get_materials_ids_and_relative_counts(self, materials_ids):
-        vectorWithMatIdsAndRelativeIndicesCount = []
-        lastMaterialId = -1
-        indicesSizeFoundWithLastMaterialId = 0
-
-        m_i = 0
-
-        while m_i < len(materials_ids):
-            materialId = materials_ids[m_i]
-
-            # if is the first iteration, last material ID is material is actual material ID  
-            if (m_i == 0):
-                lastMaterialId = materialId
-
-            # if material ID is equals to last material ID, the count for this ID is increased by 1
-            if (materialId == lastMaterialId):
-                indicesSizeFoundWithLastMaterialId += 1
-
-            # if material ID is different then last material ID |OR| material ID INDEX the last of the list
-            # add the id with the relative indices count
-            if (materialId != lastMaterialId or m_i == len(materials_ids) - 1):
-                vectorWithMatIdsAndRelativeIndicesCount.append((lastMaterialId, indicesSizeFoundWithLastMaterialId))
-                lastMaterialId = materialId
-                indicesSizeFoundWithLastMaterialId = 1
-
-            m_i += 1
-
-        return vectorWithMatIdsAndRelativeIndicesCount
+    def clear_property_sets(self):
+        """
+        clear the parsed property sets, quantity sets and types, they are keyed by entity id (valid in one IFC file)
+        """
+        self.property_sets = dict()
+        self.property_sets_json = dict()
+        self.quantity_sets = dict()
+        self.quantity_sets_json = dict()
+        self.element_types_info = dict()
+
+    def get_property_set(self, ifc_property_set):
+        """
+        return the PropertySet of an IfcPropertySet (None if without properties), parsed once per entity id
+        """
+        property_set_id = ifc_property_set.id()
+        if property_set_id in self.property_sets:
+            return self.property_sets[property_set_id]
+
+        property_set = None
+        properties = self.ifc_manager.get_element_properties(
+            ifc_property_set,
+        )
+        if properties is not None and len(properties) > 0:
+            property_set = PropertySet(ifc_property_set.GlobalId, ifc_property_set.Name)
+            property_set.Properties = properties
+            self.property_sets_json[property_set_id] = property_set.toJSON()
+            if self.metadata_store is not None:
+                self.metadata_store.add_property_set(self.ifc_manager.ifc_file_path, property_set_id, property_set)
+
+        self.property_sets[property_set_id] = property_set
+        return property_set
+
+    def get_quantity_set(self, ifc_quantity_set):
+        """
+        return the QuantitySet of an IfcElementQuantity, parsed once per entity id
+        """
+        quantity_set_id = ifc_quantity_set.id()
+        quantity_set = self.quantity_sets.get(quantity_set_id)
+        if quantity_set is None:
+            quantity_set = self.ifc_manager.get_element_quantities(
+                ifc_quantity_set,
+            )
+            self.quantity_sets[quantity_set_id] = quantity_set
+            self.quantity_sets_json[quantity_set_id] = quantity_set.toJSON()
+            if self.metadata_store is not None:
+                self.metadata_store.add_quantity_set(self.ifc_manager.ifc_file_path, quantity_set_id, quantity_set)
+        return quantity_set
+
+    def get_element_type_info(self, ifc_element_type):
+        """
+        return the info of an element type used by the object info,
+        and the ids of its property sets with properties, computed once per type
+        """
+        element_type_id = ifc_element_type.id()
+        element_type_info = self.element_types_info.get(element_type_id)
+        if element_type_info is not None:
+            return element_type_info
+
+        definition_type_info = ifc_element_type.get_info()
+        type_info = {
+            "ConstructionType": definition_type_info.get("ConstructionType") or "",
+            "OperationType": definition_type_info.get("OperationType") or "",
+            "PredefinedType": definition_type_info.get("PredefinedType") or "",
+            "ElementType": definition_type_info.get("ElementType") or ""
+        }
+
+        type_property_sets_ids = []
+        if (ifc_element_type.HasPropertySets is not None):
+            for property_set in ifc_element_type.HasPropertySets:
+                if self.get_property_set(property_set) is None:
+                    continue
+                type_property_sets_ids.append(property_set.id())
+
+        element_type_info = (type_info, type_property_sets_ids)
+        self.element_types_info[element_type_id] = element_type_info
+        return element_type_info
+
+    def get_shared_set_prim_path(self, scope_name, set_json):
+        """
+        return the path of the prim holding a property or quantity set, created the first time its content is found
+        """
+        set_prim_path = self.shared_sets_prim_paths.get(set_json)
+        if set_prim_path is None:
+            set_hash = hashlib.blake2b(set_json.encode(), digest_size=8).hexdigest()
+            set_prim_path = self.usd_manager.create_shared_string_prim(scope_name, f"Set_{set_hash}", "json", set_json, self.base_namespace)
+            self.shared_sets_prim_paths[set_json] = set_prim_path
+        return set_prim_path
+
+    def get_materials_faces_indices(self, materials, materials_ids):
+        """
+        return [(material, faces indices)], the faces of every material name in one array,
+        in order of first appearance of the name.\n
+        Materials with the same name share the subset, the material of its last face is used.
+        """
+        materials_ids = np.asarray(materials_ids)
+        if len(materials_ids) == 0:
+            return []
+
+        # every material id is mapped to the first material id with the same name
+        names_and_first_ids = dict()
+        materials_groups = np.array([names_and_first_ids.setdefault(material.name, material_id) for material_id, material in enumerate(materials)])
+        faces_groups = materials_groups[materials_ids]
+
+        # faces sorted by group (stable, so ascending inside a group) and split in one array per group
+        groups, groups_first_faces, groups_faces_counts = np.unique(faces_groups, return_index=True, return_counts=True)
+        sorted_faces_indices = np.argsort(faces_groups, kind="stable").astype(np.int32)
+        groups_faces_indices = np.split(sorted_faces_indices, np.cumsum(groups_faces_counts)[:-1])
+
+        materials_faces_indices = []
+        for group_index in np.argsort(groups_first_faces):
+            faces_indices = groups_faces_indices[group_index]
+            material = materials[materials_ids[faces_indices[-1]]]
+            materials_faces_indices.append((material, faces_indices))
+
+        return materials_faces_indices
+
+    def get_mesh_hash(self, ifc_type, faces, verts, materials, materials_ids, uvs, normals, ifc_texture_info):
+        """
+        return a hash of everything that ends up in a prototype mesh:\n
+        geometry buffers, materials and texture.
+        """
+        mesh_hash = hashlib.blake2b(digest_size=16)
+
+        for buffer in (verts, faces, normals, uvs, materials_ids):
+            if buffer is None:
+                mesh_hash.update(b"|")
+                continue
+            mesh_hash.update(np.ascontiguousarray(buffer).tobytes())
+            mesh_hash.update(b"|")
+
+        # openings and spaces always get the transparent material
+        mesh_hash.update(str(ifc_type == "IfcOpeningElement" or ifc_type == "IfcSpace").encode())
+
+        for material in materials:
+            material_transparency = material.transparency if material.has_transparency else None
+            mesh_hash.update(f"{material.name}{material.diffuse}{material_transparency}".encode())
+
+        if ifc_texture_info:
+            mesh_hash.update(str(ifc_texture_info.texture_url).encode())
+
+        return mesh_hash.hexdigest()
 
     def fix_matrix(self, matrix):
         # matrix obtained by IFC are 3x4, we need 4x4 matrix
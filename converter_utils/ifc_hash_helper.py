@@ -0,0 +1,133 @@
+import hashlib
+
+import ifcopenshell
+
+
+class IfcEntityHasher():
+    """
+    Hash IFC entities by content: attributes and referenced entities (recursively),
+    without using the entity ids, which change between exports of the same model.\n
+    Owner histories are skipped, their timestamps change at every export.
+    """
+    def __init__(self, ifc_file):
+        self.ifc_file = ifc_file
+        # entity id -> hash, every subgraph is hashed once
+        self.entities_hashes = dict()
+
+    def get_entity_hash(self, entity):
+        """
+        return the hash of the entity and of all the entities it references,\n
+        styles and texture maps of representation items are included (they are inverse references).
+        """
+        if entity is None or entity.is_a("IfcOwnerHistory"):
+            return "$"
+
+        entity_hash = self.entities_hashes.get(entity.id())
+        if entity_hash is not None:
+            return entity_hash
+
+        hash_builder = hashlib.blake2b(digest_size=16)
+        self.update_hash_with_entity(hash_builder, entity, None)
+
+        if entity.is_a("IfcRepresentationItem"):
+            for inverse_entity in self.ifc_file.get_inverse(entity):
+                if inverse_entity.is_a("IfcStyledItem") or inverse_entity.is_a("IfcTextureCoordinate"):
+                    # the reference back to this item is skipped, or the hash would never end
+                    self.update_hash_with_entity(hash_builder, inverse_entity, entity)
+
+        entity_hash = hash_builder.hexdigest()
+        self.entities_hashes[entity.id()] = entity_hash
+        return entity_hash
+
+    def get_material_hash(self, material):
+        """
+        return the hash of a material definition (a material, a list, a layer, profile or constituent set or their usages)
+        and of the styles of its materials: the IfcMaterialDefinitionRepresentation giving their colour and transparency
+        is an inverse reference (HasRepresentation), not found by get_entity_hash.
+        """
+        if material is None:
+            return "$"
+
+        hash_builder = hashlib.blake2b(digest_size=16)
+        hash_builder.update(self.get_entity_hash(material).encode())
+        for ifc_material in self.get_materials(material):
+            for material_representation in getattr(ifc_material, "HasRepresentation", None) or []:
+                hash_builder.update(self.get_entity_hash(material_representation).encode())
+        return hash_builder.hexdigest()
+
+    def get_materials(self, material):
+        """
+        return the IfcMaterial entities of a material definition, in order
+        """
+        if material.is_a("IfcMaterial"):
+            return [material]
+        if material.is_a("IfcMaterialLayerSetUsage"):
+            return self.get_materials(material.ForLayerSet)
+        if material.is_a("IfcMaterialProfileSetUsage"):
+            return self.get_materials(material.ForProfileSet)
+        if material.is_a("IfcMaterialLayerSet"):
+            materials = [layer.Material for layer in material.MaterialLayers]
+        elif material.is_a("IfcMaterialProfileSet"):
+            materials = [profile.Material for profile in material.MaterialProfiles]
+        elif material.is_a("IfcMaterialConstituentSet"):
+            materials = [constituent.Material for constituent in material.MaterialConstituents or []]
+        elif material.is_a("IfcMaterialList"):
+            materials = list(material.Materials)
+        elif material.is_a("IfcMaterialLayer") or material.is_a("IfcMaterialProfile") or material.is_a("IfcMaterialConstituent"):
+            materials = [material.Material]
+        else:
+            return []
+        return [ifc_material for ifc_material in materials if ifc_material is not None]
+
+    def get_entity_attributes_hash(self, entity):
+        """
+        return the hash of the direct attributes of the entity only,
+        referenced entities count just as present or not.
+        """
+        hash_builder = hashlib.blake2b(digest_size=16)
+        hash_builder.update(entity.is_a().encode())
+        for value in entity:
+            if isinstance(value, ifcopenshell.entity_instance) and value.id() != 0:
+                hash_builder.update(b"#")
+            else:
+                self.update_hash_with_value(hash_builder, value, None)
+            hash_builder.update(b",")
+        return hash_builder.hexdigest()
+
+    def get_entities_hash(self, entities):
+        """
+        return a single hash for a list of entities, independent from their order.
+        """
+        hash_builder = hashlib.blake2b(digest_size=16)
+        for entity_hash in sorted(self.get_entity_hash(entity) for entity in entities):
+            hash_builder.update(entity_hash.encode())
+        return hash_builder.hexdigest()
+
+    def update_hash_with_entity(self, hash_builder, entity, back_reference):
+        hash_builder.update(entity.is_a().encode())
+        hash_builder.update(b"(")
+        for value in entity:
+            self.update_hash_with_value(hash_builder, value, back_reference)
+            hash_builder.update(b",")
+        hash_builder.update(b")")
+
+    def update_hash_with_value(self, hash_builder, value, back_reference):
+        if isinstance(value, ifcopenshell.entity_instance):
+            if value.id() == 0:
+                # typed value, e.g. IfcLabel('name')
+                hash_builder.update(value.is_a().encode())
+                self.update_hash_with_value(hash_builder, value.wrappedValue, back_reference)
+            elif back_reference is not None and value.id() == back_reference.id():
+                hash_builder.update(b"^")
+            else:
+                hash_builder.update(self.get_entity_hash(value).encode())
+        elif isinstance(value, (tuple, list)):
+            hash_builder.update(b"(")
+            for item in value:
+                self.update_hash_with_value(hash_builder, item, back_reference)
+                hash_builder.update(b",")
+            hash_builder.update(b")")
+        elif value is None:
+            hash_builder.update(b"$")
+        else:
+            hash_builder.update(repr(value).encode())
@@ -7,18 +7,76 @@ import ifcopenshell.util.shape
 
 import multiprocessing
 import os
-import mathutils
+import hashlib
 import numpy as np
 
 
 from converter_utils.quantity_sets_class import QuantitySet, QuantityProperty
 from converter_utils.property_sets_class import Property
 from converter_utils import texture_info_class
+from converter_utils import material_info_class
+from converter_utils import geomery_helper
+from converter_utils.geometry_cache import GeometryCache
+from converter_utils.ifc_hash_helper import IfcEntityHasher
+from converter_utils.ifc_relationships_index import IfcRelationshipsIndex
 
 from converter_utils.timer import Timer
 
+
+# max distance between a texture face set coordinate and the tessellated vertex it is mapped to
+TEXTURE_COORDINATES_TOLERANCE = 1e-5 ** 0.5
+
+# IFC measure type -> IfcUnitEnum of the project unit it is expressed in
+MEASURES_UNIT_TYPES = {
+    # Electrical measures
+    "IfcElectricCurrentMeasure": "ELECTRICCURRENTUNIT",
+    "IfcElectricResistanceMeasure": "ELECTRICRESISTANCEUNIT",
+    "IfcElectricVoltageMeasure": "ELECTRICVOLTAGEUNIT",
+    "IfcPowerMeasure": "POWERUNIT",
+
+    "IfcVolumeMeasure": "VOLUMEUNIT",
+    "IfcLengthMeasure": "LENGTHUNIT",
+    "IfcPositiveLengthMeasure": "LENGTHUNIT",
+    "IfcAreaMeasure": "AREAUNIT",
+    "IfcMassMeasure": "MASSUNIT",
+
+    "IfcPlaneAngleMeasure": "PLANEANGLEUNIT",
+    "IfcThermodynamicTemperatureMeasure": "THERMODYNAMICTEMPERATUREUNIT",
+    "IfcThermalTransmittanceMeasure": "THERMALTRANSMITTANCEUNIT",
+    "IfcVolumetricFlowRateMeasure": "VOLUMETRICFLOWRATEUNIT",
+}
+
+# IFC quantity type -> IfcUnitEnum of the project unit it is expressed in
+QUANTITIES_UNIT_TYPES = {
+    "IfcQuantityLength": "LENGTHUNIT",
+    "IfcQuantityArea": "AREAUNIT",
+    "IfcQuantityVolume": "VOLUMEUNIT",
+    "IfcQuantityWeight": "MASSUNIT",
+}
+
+# upper case name of common IfcConversionBasedUnit -> symbol, other names are used as they are
+CONVERSION_BASED_UNITS_SYMBOLS = {
+    "DEGREE": "°",
+    "INCH": "in",
+    "FOOT": "ft",
+    "YARD": "yd",
+    "MILE": "mi",
+    "SQUARE INCH": "in2",
+    "SQUARE FOOT": "ft2",
+    "SQUARE YARD": "yd2",
+    "ACRE": "ac",
+    "CUBIC INCH": "in3",
+    "CUBIC FOOT": "ft3",
+    "CUBIC YARD": "yd3",
+    "LITRE": "l",
+    "GALLON UK": "gal",
+    "GALLON US": "gal",
+    "POUND": "lb",
+    "OUNCE": "oz",
+}
+
 class IfcManager():
-    def __init__(self, ifc_file_path, ifc_types_to_ignore, angular_tolerance, deflection_tolerance, generate_uvs, take_textures):
+    def __init__(self, ifc_file_path, ifc_types_to_ignore, angular_tolerance, deflection_tolerance, generate_uvs, take_textures, geometry_cache_path=None, ifc_types_to_include=None):
 
         print(ifcopenshell.version)
         self.generate_uvs = generate_uvs
@@ -27,46 +85,198 @@ class IfcManager():
         self.ifc_file_path = ifc_file_path
         self.ifc_file = self.open_ifc_file(ifc_file_path)
         self.ifc_file_name = os.path.basename(ifc_file_path)
+        # unit type / measure type -> symbol, built when the ifc_project is set
+        self.units_symbols = dict()
+        self.measures_symbols = dict()
         self.ifc_project = None
 
         self.use_boolean = len(self.ifc_file.by_type("IfcBooleanResult")) > 0
 
-        self.ifc_types_to_ignore = ifc_types_to_ignore
-        self.ignore_ifc_types = len(self.ifc_types_to_ignore) > 0
+        # types filters, with subtypes: ignored types are skipped with their children,
+        # types to include (if any) select the elements tessellated, the other elements are kept as containers
+        self.ifc_types_to_ignore = set(ifc_types_to_ignore or [])
+        self.ifc_types_to_include = set(ifc_types_to_include or [])
+        self.filter_ifc_types = len(self.ifc_types_to_ignore) > 0 or len(self.ifc_types_to_include) > 0
+        # entity class -> included by the types filters, ignored by the types to ignore
+        self.ifc_classes_included = dict()
+        self.ifc_classes_ignored = dict()
         self.take_textures = take_textures
+        self.angular_tolerance = angular_tolerance
+        self.deflection_tolerance = deflection_tolerance
+        self.geometry_cache_path = geometry_cache_path
 
         self.geometry_settings = self.set_ifc_geometry_settings(
             angular_tolerance,
             deflection_tolerance
         )
 
-        self.geometry_iterator = self.set_ifc_geometry_iterator(
-            self.geometry_settings,
-            self.ifc_file
-        )
+        # set by prepare_geometry_iterator, the hierarchy does not need it
+        self.products_to_include = None
+        self.geometry_cache = None
+        self.products_cache_keys = dict()
+        self.cached_products_and_keys = []
+        self.geometry_iterator = None
+
+        self.geometry_guids_iterated = dict()
+        self.geometry_ids = dict()
+        # IfcBlobTexture id -> file name of its image
+        self.blob_textures_urls = dict()
+
+        self.ifc_entity_hasher = IfcEntityHasher(self.ifc_file)
+        self.relationships_index = None
+
+    def prepare_geometry_iterator(self, products_ids_to_include=None):
+        """
+        prepare the geometry iterator, and the geometry cache if used.\n
+        if products_ids_to_include is defined only these products are tessellated (e.g. a shard of the file),
+        with an empty list there is nothing to iterate and the iterator stays None.
+        """
+        self.products_to_include = None
+        if products_ids_to_include is not None:
+            self.products_to_include = [self.ifc_file.by_id(product_id) for product_id in products_ids_to_include]
+
+        # filtered out products are not given to the iterator, so they are never tessellated
+        if self.filter_ifc_types:
+            products = self.products_to_include
+            if products is None:
+                products = [product for product in self.ifc_file.by_type("IfcProduct") if product.Representation is not None]
+            self.products_to_include = [product for product in products if self.is_ifc_type_included(product)]
+
+        # products found in the geometry cache are excluded from the iterator
+        self.products_cache_keys = dict()
+        self.cached_products_and_keys = []
+        if self.geometry_cache_path is not None:
+            self.geometry_cache = GeometryCache(self.geometry_cache_path)
+            self.set_geometry_cache_keys(self.angular_tolerance, self.deflection_tolerance)
+
+        self.geometry_iterator = None
+        if self.products_to_include is None or len(self.products_to_include) > 0:
+            self.geometry_iterator = self.set_ifc_geometry_iterator(
+                self.geometry_settings,
+                self.ifc_file,
+                self.products_to_include
+            )
+
+        return self.geometry_iterator
+
+    def get_products_to_tessellate(self):
+        """
+        return the products given to the geometry iterator (except the cached ones)
+        """
+        if self.products_to_include is not None:
+            return self.products_to_include
+        return [product for product in self.ifc_file.by_type("IfcProduct") if product.Representation is not None]
+
+    def get_product_mesh_info(self, product_id, geometry_fallback="full"):
+        """
+        tessellate a single product, with the geometry settings ('full') or a fallback:\n
+        'no_openings' without subtraction of the openings and boolean results,
+        'bounding_box' the same settings applied to the 'Box' representation of the product (None if it has not).
+        """
+        product = self.ifc_file.by_id(product_id)
+        if geometry_fallback == "full":
+            shape = ifcopenshell.geom.create_shape(self.geometry_settings, product)
+            return self.get_shape_mesh_info(shape, product.is_a())
+
+        settings = self.set_ifc_geometry_settings(self.angular_tolerance, self.deflection_tolerance)
+        settings.set(settings.DISABLE_OPENING_SUBTRACTIONS, True)
+        settings.set(settings.DISABLE_BOOLEAN_RESULT, True)
+
+        if geometry_fallback == "bounding_box":
+            box_representations = [
+                representation for representation in product.Representation.Representations
+                if representation.RepresentationIdentifier == "Box"
+            ]
+            if len(box_representations) == 0:
+                return None
+            shape = ifcopenshell.geom.create_shape(settings, product, box_representations[0])
+        else:
+            shape = ifcopenshell.geom.create_shape(settings, product)
+
+        return self.get_shape_mesh_info(shape, product.is_a())
+
+    def cache_ifc_mesh_info(self, product_id, ifc_mesh_info):
+        """
+        store the mesh info of a product in the geometry cache, if used and the product is to tessellate
+        """
+        if self.geometry_cache is not None and product_id in self.products_cache_keys:
+            self.geometry_cache.put(self.products_cache_keys[product_id], ifc_mesh_info)
 
+    def set_geometry_tolerances(self, angular_tolerance, deflection_tolerance):
+        """
+        change the tolerances used by the next prepared geometry iterator (e.g. for a coarser level of detail),
+        the meshes iterated with the previous tolerances are forgotten.
+        """
+        self.angular_tolerance = angular_tolerance
+        self.deflection_tolerance = deflection_tolerance
+        self.geometry_settings = self.set_ifc_geometry_settings(angular_tolerance, deflection_tolerance)
         self.geometry_guids_iterated = dict()
         self.geometry_ids = dict()
 
 
+    def is_ifc_type_included(self, ifc_element):
+        """
+        return False if the element is (a subtype of) an ignored type or, when there are types to include,
+        if it is an IfcElement not (a subtype of) one of them. Computed once per entity class.
+        """
+        ifc_class = ifc_element.is_a()
+        is_included = self.ifc_classes_included.get(ifc_class)
+        if is_included is None:
+            is_included = not self.is_ifc_type_ignored(ifc_element)
+            if is_included and len(self.ifc_types_to_include) > 0 and ifc_element.is_a("IfcElement"):
+                is_included = any(ifc_element.is_a(ifc_type) for ifc_type in self.ifc_types_to_include)
+            self.ifc_classes_included[ifc_class] = is_included
+        return is_included
+
+    def is_ifc_type_ignored(self, ifc_element):
+        """
+        return True if the element is (a subtype of) an ignored type. Computed once per entity class.
+        """
+        ifc_class = ifc_element.is_a()
+        is_ignored = self.ifc_classes_ignored.get(ifc_class)
+        if is_ignored is None:
+            is_ignored = any(ifc_element.is_a(ifc_type) for ifc_type in self.ifc_types_to_ignore)
+            self.ifc_classes_ignored[ifc_class] = is_ignored
+        return is_ignored
+
+    def get_relationships_index(self):
+        """
+        return the relationships index of the IFC file, built on first use
+        """
+        if self.relationships_index is None:
+            self.relationships_index = IfcRelationshipsIndex(self.ifc_file)
+        return self.relationships_index
+
+    @property
+    def ifc_project(self):
+        return self._ifc_project
+
+    @ifc_project.setter
+    def ifc_project(self, ifc_project):
+        """
+        set the IfcProject whose units are used by properties and quantities, and build their symbols once
+        """
+        self._ifc_project = ifc_project
+        self.units_symbols = dict()
+        self.measures_symbols = dict()
+        if ifc_project is None or ifc_project.UnitsInContext is None:
+            return
+
+        for unit in self.get_ifc_project_units_assignments(ifc_project):
+            # IfcMonetaryUnit has no UnitType
+            unit_type = getattr(unit, "UnitType", None)
+            if unit_type is not None and unit_type not in self.units_symbols:
+                self.units_symbols[unit_type] = self.get_unit_symbol(unit)
+
+        for measure_type, unit_type in MEASURES_UNIT_TYPES.items():
+            self.measures_symbols[measure_type] = self.units_symbols.get(unit_type, "")
+
     def get_ifc_projects(self):
         return self.ifc_file.by_type('IfcProject')
 
     def get_ifc_project_units_assignments(self, ifc_project):
         return ifc_project.UnitsInContext.Units
 
-    def get_ifc_project_unit_type_assignment(self, unit_type):
-        """
-        Given a IfcUnit returns just the unit used by the IfcProject
-        """
-        for unit in self.ifc_project.UnitsInContext.Units:
-            # print(unit.UnitType)
-            try:
-                if unit.UnitType == unit_type: #LENGTHUNIT, MASSUNIT etc...
-                    return unit
-            except:
-                pass
-
     def open_ifc_file(self, path):
         return ifcopenshell.open(path)
 
@@ -114,10 +324,19 @@ class IfcManager():
 
         return settings
 
-    def set_ifc_geometry_iterator(self, settings, ifc_file):
+    def set_ifc_geometry_iterator(self, settings, ifc_file, products_to_include=None):
         """
         Prepare the geometry iterator for the relative IFC file with relative settings.
         """
+        if products_to_include is not None:
+            iterator = ifcopenshell.geom.iterator(
+                settings,
+                ifc_file,
+                multiprocessing.cpu_count(),
+                include=products_to_include
+            )
+            return iterator
+
         iterator = ifcopenshell.geom.iterator(
             settings,
             ifc_file,
@@ -126,6 +345,89 @@ class IfcManager():
         
         return iterator
 
+    def set_geometry_cache_keys(self, angular_tolerance, deflection_tolerance):
+        """
+        compute the geometry cache key of every product to tessellate:\n
+        a hash of its representation, placement, openings and material subgraphs (with the material styles) plus the geometry settings.\n
+        Products already in the cache are removed from the products to tessellate.
+        """
+        settings_signature = f"{ifcopenshell.version}|{angular_tolerance}|{deflection_tolerance}|{self.generate_uvs}|{self.use_boolean}|{self.take_textures}"
+
+        products = self.products_to_include
+        if products is None:
+            products = [product for product in self.ifc_file.by_type("IfcProduct") if product.Representation is not None]
+
+        ifc_entity_hasher = self.ifc_entity_hasher
+        products_to_tessellate = []
+
+        for product in products:
+            # openings are subtracted by the geometry kernel, they change the product geometry
+            openings = []
+            if product.is_a("IfcElement"):
+                openings = [opening_relation.RelatedOpeningElement for opening_relation in product.HasOpenings]
+
+            material = ifcopenshell.util.element.get_material(product)
+
+            key_builder = hashlib.blake2b(digest_size=20)
+            key_builder.update(settings_signature.encode())
+            key_builder.update(product.is_a().encode())
+            key_builder.update(ifc_entity_hasher.get_entity_hash(product.Representation).encode())
+            key_builder.update(ifc_entity_hasher.get_entity_hash(product.ObjectPlacement).encode())
+            key_builder.update(ifc_entity_hasher.get_entities_hash([opening.Representation for opening in openings]).encode())
+            key_builder.update(ifc_entity_hasher.get_entities_hash([opening.ObjectPlacement for opening in openings]).encode())
+            key_builder.update(ifc_entity_hasher.get_material_hash(material).encode())
+            key = key_builder.hexdigest()
+
+            if self.geometry_cache.contains(key):
+                self.cached_products_and_keys.append((product, key))
+            else:
+                self.products_cache_keys[product.id()] = key
+                products_to_tessellate.append(product)
+
+        print(f"Geometry cache: {self.geometry_cache.hits} products cached, {self.geometry_cache.misses} to tessellate")
+
+        if len(self.cached_products_and_keys) > 0:
+            self.products_to_include = products_to_tessellate
+
+    def get_element_fingerprint(self, ifc_element, settings_signature):
+        """
+        return a hash of what the conversion of an element depends on:\n
+        its attributes, property sets and type, placement, representation, openings and material (with the material styles), plus the settings signature.
+        """
+        ifc_entity_hasher = self.ifc_entity_hasher
+
+        definitions = []
+        for definition in getattr(ifc_element, "IsDefinedBy", None) or []:
+            if definition.is_a('IfcRelDefinesByProperties'):
+                definitions.append(definition.RelatingPropertyDefinition)
+            elif definition.is_a('IfcRelDefinesByType'):
+                definitions.append(definition.RelatingType)
+        for definition in getattr(ifc_element, "IsTypedBy", None) or []:
+            definitions.append(definition.RelatingType)
+
+        openings = []
+        if ifc_element.is_a("IfcElement"):
+            openings = [opening_relation.RelatedOpeningElement for opening_relation in ifc_element.HasOpenings]
+
+        fingerprint_builder = hashlib.blake2b(digest_size=16)
+        fingerprint_builder.update(settings_signature.encode())
+        fingerprint_builder.update(ifc_entity_hasher.get_entity_attributes_hash(ifc_element).encode())
+        fingerprint_builder.update(ifc_entity_hasher.get_entities_hash(definitions).encode())
+        fingerprint_builder.update(ifc_entity_hasher.get_entity_hash(getattr(ifc_element, "ObjectPlacement", None)).encode())
+        fingerprint_builder.update(ifc_entity_hasher.get_entity_hash(getattr(ifc_element, "Representation", None)).encode())
+        fingerprint_builder.update(ifc_entity_hasher.get_entities_hash([opening.Representation for opening in openings]).encode())
+        fingerprint_builder.update(ifc_entity_hasher.get_entities_hash([opening.ObjectPlacement for opening in openings]).encode())
+        fingerprint_builder.update(ifc_entity_hasher.get_material_hash(ifcopenshell.util.element.get_material(ifc_element)).encode())
+
+        return fingerprint_builder.hexdigest()
+
+    def get_cached_ifc_mesh_infos(self):
+        """
+        yield the mesh info of the products found in the geometry cache (not given by the geometry iterator).
+        """
+        for product, key in self.cached_products_and_keys:
+            yield self.geometry_cache.get(key, product.GlobalId)
+
     def get_ifc_mesh_info(self):
         """
         Get the necessary mesh information as follows:\n
@@ -134,9 +436,14 @@ class IfcManager():
 
         # Get ifc object
         shape = self.geometry_iterator.get()
+        return self.get_shape_mesh_info(shape, shape.product.is_a())
+
+    def get_shape_mesh_info(self, shape, ifc_type):
+        """
+        Get the mesh information of a shape of the geometry kernel, as get_ifc_mesh_info
+        """
         # Get GUID of ifc object
         guid = shape.guid
-        ifc_type = shape.product.is_a()
 
         
 
@@ -144,14 +451,12 @@ class IfcManager():
 
         matrix = list(shape.transformation.matrix.data)
 
-        materials = shape.geometry.materials
-        materials_ids = shape.geometry.material_ids
-
-        #TODO: create a bool when ifc_manager get initialized instead of check for every mesh if there are types to ignore
-        if self.ignore_ifc_types:
-            ifc_type = self.ifc_file.by_guid(shape.guid).is_a()
-            if (self.ifc_types_to_ignore.count(ifc_type) > 0):
-                return
+        # plain copies, the mesh info can outlive the iterator position (e.g. pipelined geometry)
+        materials = [
+            material_info_class.Material_Info(material.original_name(), tuple(material.diffuse), material.has_transparency, material.transparency)
+            for material in shape.geometry.materials
+        ]
+        materials_ids = np.asarray(shape.geometry.material_ids)
 
         verts = None
         normals = None
@@ -194,17 +499,7 @@ class IfcManager():
                 for texture in ifc_triangulated_face_set.HasTextures:
                     texture_url = None
                     if (texture.Maps[0].is_a("IfcBlobTexture")):
-                        blobImage = int(texture.Maps[0].RasterCode, 2).to_bytes(len(texture.Maps[0].RasterCode), 'little')
-                        
-                        # TODO: manage multiple blob textures in one IFC file
-                        texture_url = self.ifc_file_path + '/blob_texture.png'
-                        f = open(texture_url, 'wb')
-
-                        texture_url = os.path.basename(texture_url)
-
-                        blobImage = blobImage.rstrip(b'\x00')
-                        f.write(blobImage[::-1])
-                        f.close()
+                        texture_url = self.get_blob_texture_url(texture.Maps[0])
 
                     elif (texture.Maps[0].is_a("IfcImageTexture")):
                         texture_url = texture.Maps[0].URLReference
@@ -230,22 +525,12 @@ class IfcManager():
 
                     #to manage texture, I have to weld the mesh
                     # I figured this out by exporting a usd file from blender and checking differencies with my usd file
-                    # verts, faces = geomery_helper.weld_mesh(verts, faces)
-
-                    coordinates_remap = []
+                    # verts, faces, normals, uvs = geomery_helper.weld_mesh(verts, faces, 0.0, normals, uvs)
 
-                    for co in texture.MappedTo.Coordinates.CoordList:
-                        co = mathutils.Vector(co)
-                        equals_verts = []
-                        counter = 0
-                        for i in range(0, len(verts), 3):
-                            recreated_co = mathutils.Vector((verts[i], verts[i + 1], verts[i + 2]))  # Assuming the verts are 2D
-                            if (recreated_co - co).length_squared < 1e-5:
-                                equals_verts.append(counter)
-                            counter += 1
-
-                        index = next(iter(equals_verts))
-                        coordinates_remap.append(index)
+                    # index of the tessellated vertex at every coordinate of the texture face set
+                    coordinates_remap = geomery_helper.get_nearest_vertices_indices(
+                        verts, texture.MappedTo.Coordinates.CoordList, TEXTURE_COORDINATES_TOLERANCE
+                    ).tolist()
 
                     faces_remap = None
                     texture_map = None
@@ -261,24 +546,56 @@ class IfcManager():
                         ]
                         texture_map = texture.TexCoordIndex
 
-                    texcoords_indices = []
-                    for i in range(0, len(faces), 3):
-                        face = [faces[i], faces[i + 1], faces[i + 2]]
-                        # find the corresponding TexCoordIndex by matching ifc faceset with blender face
-                        # remap TexCoordIndex as the loop start may different from blender face
+                    # find the corresponding TexCoordIndex by matching ifc faceset with the tessellated face
+                    texture_faces_indices = geomery_helper.get_containing_polygons_indices(faces, faces_remap)
+                    if np.any(texture_faces_indices < 0):
+                        print(f"Texture coordinates not matching the tessellated faces of {guid}, texture ignored")
+                        ifc_texture_info = {}
+                        break
+
+                    # remap TexCoordIndex as the loop start may different from the tessellated face
+                    texcoords_indices = [
+                        [texture_map[texture_face_index][faces_remap[texture_face_index].index(i)] for i in face]
+                        for face, texture_face_index in zip(np.asarray(faces).reshape(-1, 3).tolist(), texture_faces_indices.tolist())
+                    ]
 
-                        texCoordIndex = next(
-                            [tex_coord_index[face_remap.index(i)] for i in face]
-                            for tex_coord_index, face_remap in zip(texture_map, faces_remap)
-                            if all(i in face_remap for i in face)
-                        )
+                    tex_coords = np.asarray(texture.TexCoords.TexCoordsList, dtype=np.float64)
+                    uvs = tex_coords[np.asarray(texcoords_indices, dtype=np.int64).reshape(-1) - 1].reshape(-1).tolist()
 
-                        texcoords_indices.append(texCoordIndex)
+        ifc_mesh_info = (guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info)
 
-                    uv_coordinates = [texture.TexCoords.TexCoordsList[i - 1] for face_indices in texcoords_indices for i in face_indices]
-                    uvs = [i for uv in uv_coordinates for i in uv]
+        self.cache_ifc_mesh_info(shape.id, ifc_mesh_info)
 
-        return (guid, ifc_type, faces, verts, matrix, materials, materials_ids, uvs, normals, ifc_texture_info)
+        return ifc_mesh_info
+
+    def get_blob_texture_url(self, blob_texture):
+        """
+        write the image of an IfcBlobTexture next to the IFC file, named after its content,
+        and return its file name. Every texture entity is decoded once.
+        """
+        texture_url = self.blob_textures_urls.get(blob_texture.id())
+        if texture_url is None:
+            blob_image = self.get_raster_code_bytes(blob_texture.RasterCode)
+            image_hash = hashlib.blake2b(blob_image, digest_size=16).hexdigest()
+            texture_url = f"blob_texture_{image_hash}.{(blob_texture.RasterFormat or 'png').lower()}"
+
+            # the same image (e.g. of another IFC file) is written once
+            texture_path = os.path.join(os.path.dirname(self.ifc_file_path), texture_url)
+            if os.path.isfile(texture_path) is False:
+                with open(texture_path, "wb") as texture_file:
+                    texture_file.write(blob_image)
+
+            self.blob_textures_urls[blob_texture.id()] = texture_url
+        return texture_url
+
+    def get_raster_code_bytes(self, raster_code):
+        """
+        given the RasterCode of an IfcBlobTexture (a string of bits) return its bytes,
+        the bits are aligned to the end as in the number they represent.
+        """
+        bits = np.frombuffer(raster_code.encode("ascii"), dtype=np.uint8) - ord("0")
+        padding_bits = np.zeros((-len(bits)) % 8, dtype=np.uint8)
+        return np.packbits(np.concatenate((padding_bits, bits))).tobytes().lstrip(b"\x00")
 
     def get_element_properties(self, ifc_property_set):
         """
@@ -404,31 +721,24 @@ class IfcManager():
         quantity_set_instance = QuantitySet(quantity_set.Name)
         
         for quantity in quantity_set.Quantities:
-            
-            if quantity.is_a('IfcQuantityLength'):
-                unit = self.get_ifc_project_unit_type_assignment("LENGTHUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
+            quantity_type = quantity.is_a()
+            unit_symbol = self.units_symbols.get(QUANTITIES_UNIT_TYPES.get(quantity_type), "")
 
-                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityLength", symbol, str(quantity.LengthValue))
+            if quantity_type == 'IfcQuantityLength':
+                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityLength", unit_symbol, str(quantity.LengthValue))
                 quantity_set_instance.Properties.append(quantity_property)
-            elif quantity.is_a('IfcQuantityArea'):
-                unit = self.get_ifc_project_unit_type_assignment("AREAUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityArea", symbol, str(quantity.AreaValue))
+            elif quantity_type == 'IfcQuantityArea':
+                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityArea", unit_symbol, str(quantity.AreaValue))
                 quantity_set_instance.Properties.append(quantity_property)
-            elif quantity.is_a('IfcQuantityVolume'):
-                unit = self.get_ifc_project_unit_type_assignment("VOLUMEUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityVolume", symbol, str(quantity.VolumeValue))
+            elif quantity_type == 'IfcQuantityVolume':
+                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityVolume", unit_symbol, str(quantity.VolumeValue))
                 quantity_set_instance.Properties.append(quantity_property)
-            elif quantity.is_a('IfcQuantityCount'):
+            elif quantity_type == 'IfcQuantityCount':
                 quantity_property = QuantityProperty(quantity.Name, "IfcQuantityCount", "", str(quantity.CountValue))
                 quantity_set_instance.Properties.append(quantity_property)
-            elif quantity.is_a('IfcQuantityWeight'):
-                unit = self.get_ifc_project_unit_type_assignment("MASSUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
+            elif quantity_type == 'IfcQuantityWeight':
                 # element_quantities[quantity.Name] = str(quantity.WeightValue) + " " + symbol
-                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityWeight", symbol, str(quantity.WeightValue))
+                quantity_property = QuantityProperty(quantity.Name, "IfcQuantityWeight", unit_symbol, str(quantity.WeightValue))
                 quantity_set_instance.Properties.append(quantity_property)
 
             else:
@@ -539,61 +849,49 @@ class IfcManager():
                 return "°"
             case "GRAM":
                 return "g"
+            case "KELVIN":
+                return "K"
+            case "JOULE":
+                return "J"
+            case "OHM":
+                return "Ω"
             case _:
                 print("Unmanaged symbol for unit name: ", unit_name)
                 return ""
 
+    def get_unit_symbol(self, unit):
+        """
+        given a project unit returns its symbol (e.g. kW), derived units are composed by their elements (e.g. W/m2K).
+        """
+        if unit is None:
+            return ""
+        if unit.is_a("IfcDerivedUnit"):
+            numerator = ""
+            denominator = ""
+            for element in unit.Elements:
+                element_symbol = self.get_unit_symbol(element.Unit)
+                exponent = abs(element.Exponent)
+                if exponent != 1:
+                    element_symbol += str(exponent)
+                if element.Exponent > 0:
+                    numerator += element_symbol
+                else:
+                    denominator += element_symbol
+            if len(denominator) == 0:
+                return numerator
+            return f"{numerator or '1'}/{denominator}"
+        if unit.is_a("IfcConversionBasedUnit"):
+            return CONVERSION_BASED_UNITS_SYMBOLS.get(unit.Name.upper(), unit.Name)
+        return self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
+
     def from_measure_to_unit(self, measure_type):
         """
         given an IFC measure type return the relative symbol/unit (e.g. if the measure is 'IfcPowerMeasure' based on IfcProject this could return KW (kilowatt)).
         """
-        unit = ""
-        symbol = ""
-        match measure_type:
-            # Electrical measures
-            case "IfcElectricCurrentMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("ELECTRICCURRENTUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcElectricResistanceMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("ELECTRICRESISTANCEUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcElectricVoltageMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("ELECTRICVOLTAGEUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcPowerMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("POWERUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-
-             
-            case "IfcVolumeMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("VOLUMEUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcLengthMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("LENGHTUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcAreaMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("AREAUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcMassMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("MASSUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-
-            case "IfcPlaneAngleMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("PLANEANGLEUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcThermodynamicTemperatureMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("THERMODYNAMICTEMPERATUREUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcThermalTransmittanceMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("THERMALTRANSMITTANCEUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcVolumetricFlowRateMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("VOLUMETRICFLOWRATEUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case "IfcPositiveLengthMeasure":
-                unit = self.get_ifc_project_unit_type_assignment("POSITIVELENGTHUNIT")
-                symbol = self.get_unit_prefix_symbol(unit) + self.get_unit_name_symbol(unit)
-            case _:
-                print("Unmanaged measure: ", measure_type)
-
-        return symbol
\ No newline at end of file
+        symbol = self.measures_symbols.get(measure_type)
+        if symbol is None:
+            print("Unmanaged measure: ", measure_type)
+            # printed once
+            symbol = ""
+            self.measures_symbols[measure_type] = symbol
+        return symbol
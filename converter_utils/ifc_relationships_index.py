@@ -0,0 +1,87 @@
+class IfcRelationshipsIndex():
+    """
+    Relationships of an IFC file indexed by entity id, built with a single pass over the IfcRel* entities.\n
+    The children of an element are in the same order given by its inverse attributes
+    (ContainsElements, IsDecomposedBy, HasOpenings, HasCoverings), the definitions in the order of IsDefinedBy.
+    """
+    def __init__(self, ifc_file):
+        self.ifc_file = ifc_file
+        is_ifc2x3 = ifc_file.schema == "IFC2X3"
+
+        # entity id -> list of related entities
+        self.spatial_children = dict()
+        self.decomposition_children = dict()
+        self.openings = dict()
+        self.coverings = dict()
+        # entity id -> list of IfcRelDefines* (as IsDefinedBy)
+        self.defining_relationships = dict()
+
+        # entity class -> (is spatial structure element, is object definition, is element)
+        self.entity_types = dict()
+
+        for rel in self.get_relationships("IfcRelContainedInSpatialStructure"):
+            if rel.RelatedElements is not None:
+                self.spatial_children.setdefault(rel.RelatingStructure.id(), []).extend(rel.RelatedElements)
+
+        # in IFC2X3 nesting is a decomposition too
+        for rel in self.get_relationships("IfcRelDecomposes" if is_ifc2x3 else "IfcRelAggregates"):
+            if rel.RelatedObjects:
+                self.decomposition_children.setdefault(rel.RelatingObject.id(), []).extend(rel.RelatedObjects)
+
+        for rel in self.get_relationships("IfcRelVoidsElement"):
+            self.openings.setdefault(rel.RelatingBuildingElement.id(), []).append(rel.RelatedOpeningElement)
+
+        for rel in self.get_relationships("IfcRelCoversBldgElements"):
+            self.coverings.setdefault(rel.RelatingBuildingElement.id(), []).extend(rel.RelatedCoverings)
+
+        # in IFC2X3 also the type is given by IsDefinedBy, from IFC4 it is given by IsTypedBy
+        for rel in self.get_relationships("IfcRelDefines" if is_ifc2x3 else "IfcRelDefinesByProperties"):
+            for related_object in rel.RelatedObjects:
+                self.defining_relationships.setdefault(related_object.id(), []).append(rel)
+
+    def get_relationships(self, rel_type):
+        """
+        return the relationships of the given type (and subtypes) sorted by id,
+        as inverse attributes are. An empty list if the type is not in the file schema.
+        """
+        try:
+            relationships = self.ifc_file.by_type(rel_type)
+        except RuntimeError:
+            return []
+        return sorted(relationships, key=lambda rel: rel.id())
+
+    def get_entity_type(self, ifc_element):
+        """
+        return (is spatial structure element, is object definition, is element), computed once per entity class
+        """
+        ifc_entity = ifc_element.is_a()
+        entity_type = self.entity_types.get(ifc_entity)
+        if entity_type is None:
+            entity_type = (
+                ifc_element.is_a('IfcSpatialStructureElement'),
+                ifc_element.is_a('IfcObjectDefinition'),
+                ifc_element.is_a('IfcElement')
+            )
+            self.entity_types[ifc_entity] = entity_type
+        return entity_type
+
+    def get_children(self, ifc_element):
+        """
+        return the children of the element in the hierarchy:
+        contained elements, decomposition, openings and coverings
+        """
+        is_spatial_structure_element, is_object_definition, is_element = self.get_entity_type(ifc_element)
+        element_id = ifc_element.id()
+
+        children = []
+        if is_spatial_structure_element:
+            children.extend(self.spatial_children.get(element_id, []))
+        if is_object_definition:
+            children.extend(self.decomposition_children.get(element_id, []))
+        if is_element:
+            children.extend(self.openings.get(element_id, []))
+            children.extend(self.coverings.get(element_id, []))
+        return children
+
+    def get_defining_relationships(self, ifc_element):
+        return self.defining_relationships.get(ifc_element.id(), [])
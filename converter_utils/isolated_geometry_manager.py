@@ -0,0 +1,209 @@
+from converter_utils.ifc_manager import IfcManager
+
+import collections
+import multiprocessing
+import multiprocessing.connection
+import time
+import traceback
+
+
+# geometry of a product, tried in order when the previous one runs out of time (or crashes the worker)
+GEOMETRY_FALLBACKS = ("full", "no_openings", "bounding_box")
+
+
+def tessellate_products(ifc_file_path, angular_tolerance, deflection_tolerance, generate_uvs, take_textures, connection):
+    """
+    worker process entry point, tessellate the products received on the connection one at a time.\n
+    It sends None when the IFC file is open, then (mesh info, elapsed time, error) for every (product id, geometry fallback).
+    """
+    ifc_manager = IfcManager(ifc_file_path, [], angular_tolerance, deflection_tolerance, generate_uvs, take_textures)
+    connection.send(None)
+
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+
+        product_id, geometry_fallback = task
+        start_time = time.perf_counter()
+        try:
+            ifc_mesh_info = ifc_manager.get_product_mesh_info(product_id, geometry_fallback)
+            if ifc_mesh_info is not None and ifc_mesh_info[9]:
+                # the texture transform is an IFC entity, it can not be sent (not used by the usd writer)
+                ifc_mesh_info[9].texture_transform = None
+            connection.send((ifc_mesh_info, time.perf_counter() - start_time, None))
+        except Exception:
+            connection.send((None, time.perf_counter() - start_time, traceback.format_exc()))
+
+
+class GeometryWorker():
+    def __init__(self, ifc_manager):
+        parent_connection, child_connection = multiprocessing.Pipe()
+        self.connection = parent_connection
+        self.process = multiprocessing.Process(
+            target=tessellate_products,
+            args=(ifc_manager.ifc_file_path, ifc_manager.angular_tolerance, ifc_manager.deflection_tolerance, ifc_manager.generate_uvs, ifc_manager.take_textures, child_connection),
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+
+        self.is_ready = False
+        # (product id, geometry fallback index) being tessellated, with its start time
+        self.task = None
+        self.task_start_time = 0.0
+
+    def send_task(self, task):
+        product_id, fallback_index = task
+        self.task = task
+        self.task_start_time = time.perf_counter()
+        self.connection.send((product_id, GEOMETRY_FALLBACKS[fallback_index]))
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+            self.process.join(1.0)
+        except (OSError, ValueError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class IsolatedGeometryManager():
+    def __init__(self, element_time_budget, workers_count=1):
+        """
+        the products are tessellated one at a time by worker processes,
+        a product taking more than element_time_budget seconds is given up (the worker is killed and replaced)
+        and tried again with the next geometry fallback, the product is skipped after the last one.\n
+        Every worker opens its own copy of the IFC file, the memory used grows with workers_count.
+        """
+        self.element_time_budget = element_time_budget
+        self.workers_count = max(workers_count, 1)
+        # product id -> timing of the product, in the last tessellated IFC file
+        self.products_timings = dict()
+
+    def get_ifc_mesh_infos(self, ifc_manager):
+        """
+        yield the mesh info of the products to tessellate of the IFC manager, in order of completion
+        """
+        self.products_timings = dict()
+        pending_tasks = collections.deque((product.id(), 0) for product in ifc_manager.get_products_to_tessellate())
+        if len(pending_tasks) == 0:
+            return
+
+        workers = [GeometryWorker(ifc_manager) for _ in range(min(self.workers_count, len(pending_tasks)))]
+        try:
+            while len(pending_tasks) > 0 or any(worker.task is not None for worker in workers):
+                for worker in workers:
+                    if worker.is_ready and worker.task is None and len(pending_tasks) > 0:
+                        worker.send_task(pending_tasks.popleft())
+
+                # wait for a message, or for the first task to run out of time
+                timeout = None
+                tasks_start_times = [worker.task_start_time for worker in workers if worker.task is not None]
+                if len(tasks_start_times) > 0:
+                    timeout = max(0.0, min(tasks_start_times) + self.element_time_budget - time.perf_counter())
+                waiting_workers = [worker for worker in workers if worker.is_ready is False or worker.task is not None]
+                ready_connections = multiprocessing.connection.wait([worker.connection for worker in waiting_workers], timeout)
+
+                for worker_index, worker in enumerate(workers):
+                    if worker not in waiting_workers:
+                        continue
+
+                    if worker.connection in ready_connections:
+                        try:
+                            message = worker.connection.recv()
+                        except EOFError:
+                            if worker.is_ready is False:
+                                raise RuntimeError(f"Geometry worker could not open {ifc_manager.ifc_file_path}")
+                            # e.g. crashed by the geometry kernel
+                            workers[worker_index] = self.give_up_task(ifc_manager, worker, pending_tasks, "crashed")
+                            continue
+
+                        if worker.is_ready is False:
+                            worker.is_ready = True
+                            continue
+
+                        ifc_mesh_info, elapsed_time, error = message
+                        product_id, fallback_index = worker.task
+                        worker.task = None
+                        result = GEOMETRY_FALLBACKS[fallback_index]
+                        if error is not None:
+                            result = "error"
+                        elif ifc_mesh_info is None:
+                            result = "skipped"
+                        self.add_product_timing(ifc_manager, product_id, fallback_index, elapsed_time, result)
+
+                        if ifc_mesh_info is not None:
+                            if fallback_index == 0:
+                                ifc_manager.cache_ifc_mesh_info(product_id, ifc_mesh_info)
+                            yield ifc_mesh_info
+
+                    elif worker.task is not None and time.perf_counter() - worker.task_start_time >= self.element_time_budget:
+                        if worker.connection.poll():
+                            # done while the mesh infos were authored, read in the next round
+                            continue
+                        workers[worker_index] = self.give_up_task(ifc_manager, worker, pending_tasks, "timeout")
+        finally:
+            for worker in workers:
+                worker.stop()
+
+    def give_up_task(self, ifc_manager, worker, pending_tasks, reason):
+        """
+        kill the worker, queue the product with the next geometry fallback (if any) and return a new worker
+        """
+        product_id, fallback_index = worker.task
+        elapsed_time = time.perf_counter() - worker.task_start_time
+        worker.kill()
+
+        result = reason
+        if fallback_index + 1 < len(GEOMETRY_FALLBACKS):
+            pending_tasks.append((product_id, fallback_index + 1))
+        else:
+            result = "skipped"
+        self.add_product_timing(ifc_manager, product_id, fallback_index, elapsed_time, result)
+
+        return GeometryWorker(ifc_manager)
+
+    def add_product_timing(self, ifc_manager, product_id, fallback_index, elapsed_time, result):
+        product_timing = self.products_timings.get(product_id)
+        if product_timing is None:
+            product = ifc_manager.ifc_file.by_id(product_id)
+            product_timing = {
+                "guid": product.GlobalId,
+                "ifc_type": product.is_a(),
+                "name": product.Name or "",
+                "time": 0.0,
+                "attempts": dict(),
+                "result": None
+            }
+            self.products_timings[product_id] = product_timing
+
+        product_timing["time"] += elapsed_time
+        product_timing["attempts"][GEOMETRY_FALLBACKS[fallback_index]] = round(elapsed_time, 4)
+        product_timing["result"] = result
+
+    def get_slow_products_report(self, size):
+        """
+        return the timings of the slowest products (at most size), and of every product which did not get its full geometry,
+        from the slowest one
+        """
+        products_timings = sorted(self.products_timings.values(), key=lambda product_timing: product_timing["time"], reverse=True)
+        return [
+            dict(product_timing, time=round(product_timing["time"], 4))
+            for product_index, product_timing in enumerate(products_timings)
+            if product_index < size or product_timing["result"] not in (GEOMETRY_FALLBACKS[0], "error")
+        ]
+
+    def print_products_timings(self, slow_products_count=10):
+        results_counts = collections.Counter(product_timing["result"] for product_timing in self.products_timings.values())
+        print(f"Element time budget ({self.element_time_budget} seconds): {len(self.products_timings)} products tessellated in isolation, results {dict(results_counts)}")
+        for product_timing in self.get_slow_products_report(slow_products_count)[:slow_products_count]:
+            print(f"    {product_timing['time']:0.4f} seconds  {product_timing['guid']}  {product_timing['ifc_type']}  {product_timing['result']}")
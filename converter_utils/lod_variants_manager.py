@@ -0,0 +1,41 @@
+from pxr import Sdf
+
+
+class LodVariantsManager():
+    def __init__(self, lods_count, variant_set_name="LOD"):
+        """
+        the variants are named 'LOD0' (the finest tessellation) to 'LOD<lods_count - 1>' (the coarsest one)
+        """
+        self.lods_count = lods_count
+        self.variant_set_name = variant_set_name
+
+    def get_variant_name(self, lod):
+        return f"{self.variant_set_name}{lod}"
+
+    def create_lod_variants(self, layer, meshes_paths_and_prototypes_paths):
+        """
+        move the Mesh_ prim of every element in the 'LOD0' variant of a LOD variant set on the element prim,
+        the other variants get a copy of it referencing the prototype of their level of detail.\n
+        meshes_paths_and_prototypes_paths maps the path of the instanceable Mesh_ prims to the prototypes paths of every LOD.
+        """
+        with Sdf.ChangeBlock():
+            for mesh_path, prototypes_paths in meshes_paths_and_prototypes_paths.items():
+                mesh_path = Sdf.Path(mesh_path)
+                element_prim_spec = layer.GetPrimAtPath(mesh_path.GetParentPath())
+                if element_prim_spec is None or layer.GetPrimAtPath(mesh_path) is None:
+                    continue
+
+                variant_set_spec = Sdf.VariantSetSpec(element_prim_spec, self.variant_set_name)
+                for lod, prototype_path in enumerate(prototypes_paths):
+                    variant_name = self.get_variant_name(lod)
+                    Sdf.VariantSpec(variant_set_spec, variant_name)
+                    variant_mesh_path = mesh_path.GetParentPath().AppendVariantSelection(self.variant_set_name, variant_name).AppendChild(mesh_path.name)
+                    Sdf.CopySpec(layer, mesh_path, layer, variant_mesh_path)
+                    layer.GetPrimAtPath(variant_mesh_path).referenceList.explicitItems = [Sdf.Reference(primPath=prototype_path)]
+
+                del element_prim_spec.nameChildren[mesh_path.name]
+
+                element_prim_spec.variantSetNameList.prependedItems = [self.variant_set_name]
+                element_prim_spec.variantSelections[self.variant_set_name] = self.get_variant_name(0)
+
+        print(f"LOD variants: {self.lods_count} levels of detail on {len(meshes_paths_and_prototypes_paths)} elements")
@@ -0,0 +1,6 @@
+class Material_Info():
+    def __init__(self, name, diffuse, has_transparency, transparency):
+        self.name = name
+        self.diffuse = diffuse
+        self.has_transparency = has_transparency
+        self.transparency = transparency
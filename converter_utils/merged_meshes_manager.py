@@ -0,0 +1,132 @@
+import numpy as np
+
+from converter_utils import geomery_helper
+
+
+class MergedMesh():
+    def __init__(self, material, uvs_face_varying):
+        """
+        the parts (in world space) of the element meshes with the same material in a group,
+        and the GlobalId of every element, in order of first part.
+        """
+        self.material = material
+        self.uvs_face_varying = uvs_face_varying
+        self.elements_guids = []
+        self.elements_ids = dict()
+        self.parts_points = []
+        self.parts_faces = []
+        self.parts_normals = []
+        self.parts_uvs = []
+        self.parts_elements_ids = []
+
+    def add_part(self, guid, points, faces, normals, uvs):
+        element_id = self.elements_ids.get(guid)
+        if element_id is None:
+            element_id = len(self.elements_guids)
+            self.elements_ids[guid] = element_id
+            self.elements_guids.append(guid)
+
+        self.parts_points.append(points)
+        self.parts_faces.append(faces)
+        self.parts_normals.append(normals)
+        self.parts_uvs.append(uvs)
+        self.parts_elements_ids.append(element_id)
+
+    def get_buffers(self):
+        """
+        return the flat points, faces, normals and uvs (None without uvs) of the merged mesh,
+        and the element id of every face.\n
+        The faces indices of every part are offset by the points of the parts before it.
+        """
+        points_counts = np.array([len(points) for points in self.parts_points], dtype=np.int64)
+        faces_counts = np.array([len(faces) for faces in self.parts_faces], dtype=np.int64)
+        points_offsets = np.cumsum(points_counts) - points_counts
+
+        faces = np.concatenate(self.parts_faces) + np.repeat(points_offsets, faces_counts)
+        elements_ids = np.repeat(np.array(self.parts_elements_ids, dtype=np.int32), faces_counts // 3)
+
+        uvs = None
+        if self.parts_uvs[0] is not None:
+            uvs = np.concatenate(self.parts_uvs).reshape(-1)
+
+        return (
+            np.concatenate(self.parts_points).reshape(-1),
+            faces,
+            np.concatenate(self.parts_normals).reshape(-1),
+            uvs,
+            elements_ids
+        )
+
+
+class MergedMeshesManager():
+    def __init__(self):
+        """
+        the element meshes are collected in world space, per group (e.g. building storey) and material,
+        to be written as one mesh per group and material.
+        """
+        self.clear_meshes()
+
+    def clear_meshes(self):
+        # (group path, material key, face varying uvs) -> MergedMesh
+        self.merged_meshes = dict()
+        self.meshes_count = 0
+
+    def get_material_key(self, material):
+        """
+        material is (name, color, transparency, texture info), None for meshes without materials
+        """
+        if material is None:
+            return None
+        material_name, material_color, material_transparency, texture_info = material
+        texture_url = texture_info.texture_url if texture_info else None
+        return (material_name, tuple(material_color), material_transparency, texture_url)
+
+    def add_mesh(self, group_path, guid, faces, verts, matrix, normals, uvs, uvs_face_varying, materials_and_faces_indices):
+        """
+        add a mesh placed by the matrix to the merged meshes of its group,
+        materials_and_faces_indices is [(material, faces indices)], faces indices are None for all the faces.\n
+        uvs are None if not generated, per point or per face corner (uvs_face_varying).
+        """
+        points = geomery_helper.get_transformed_points(verts, matrix)
+        mesh_faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        if normals is not None and len(normals) == len(verts):
+            normals = geomery_helper.get_transformed_normals(normals, matrix)
+        else:
+            normals = geomery_helper.get_vertices_normals(points.reshape(-1), mesh_faces.reshape(-1)).reshape(-1, 3)
+
+        if uvs is not None:
+            uvs_count = len(mesh_faces) * 3 if uvs_face_varying else len(points)
+            uvs = np.asarray(uvs, dtype=np.float64).reshape(-1, 2)
+            if len(uvs) != uvs_count:
+                uvs = np.zeros((uvs_count, 2))
+
+        for material, faces_indices in materials_and_faces_indices:
+            merged_mesh_key = (group_path, self.get_material_key(material), uvs_face_varying)
+            merged_mesh = self.merged_meshes.get(merged_mesh_key)
+            if merged_mesh is None:
+                merged_mesh = MergedMesh(material, uvs_face_varying)
+                self.merged_meshes[merged_mesh_key] = merged_mesh
+
+            if faces_indices is None:
+                merged_mesh.add_part(guid, points, mesh_faces.reshape(-1), normals, uvs)
+                continue
+
+            # only the points used by the faces of the material
+            part_faces = mesh_faces[faces_indices].reshape(-1)
+            part_points_indices, part_faces = np.unique(part_faces, return_inverse=True)
+            part_uvs = None
+            if uvs is not None:
+                part_uvs = uvs.reshape(-1, 3, 2)[faces_indices].reshape(-1, 2) if uvs_face_varying else uvs[part_points_indices]
+            merged_mesh.add_part(guid, points[part_points_indices], part_faces.reshape(-1), normals[part_points_indices], part_uvs)
+
+        self.meshes_count += 1
+
+    def get_merged_meshes(self):
+        """
+        yield (group path, index of the merged mesh in the group, merged mesh)
+        """
+        groups_meshes_counts = dict()
+        for (group_path, _, _), merged_mesh in self.merged_meshes.items():
+            mesh_index = groups_meshes_counts.get(group_path, 0)
+            groups_meshes_counts[group_path] = mesh_index + 1
+            yield (group_path, mesh_index, merged_mesh)
@@ -1,5 +1,17 @@
 import json
 
+
+def join_json_array(items_json):
+    """
+    return the JSON array of items already serialized with indent=4,
+    the same string json.dumps(items, indent=4) gives.
+    """
+    if len(items_json) == 0:
+        return "[]"
+    items_json = ["    " + item_json.replace("\n", "\n    ") for item_json in items_json]
+    return "[\n" + ",\n".join(items_json) + "\n]"
+
+
 class PropertySets():
     
     def __init__(self):
@@ -17,6 +29,10 @@ class PropertySet():
         self.Name = name
         self.Properties = []
 
+    def toJSON(self):
+        return json.dumps(self, default=lambda o: o.__dict__,
+                          sort_keys=True, indent=4)
+
 
 class Property():
     def __init__(self, name, type, unit, value):
@@ -19,6 +19,12 @@ class QuantitySet():
         # self.properties = dict()
         self.Properties = []
 
+    def toJSON(self):
+        return json.dumps(self,
+                          default=lambda o: o.__dict__,
+                          sort_keys=True,
+                          indent=4)
+
 
 class QuantityProperty():
     def __init__(self, name, type, unit, value):
@@ -0,0 +1,238 @@
+from pxr import Usd, UsdGeom, Vt, Gf, Sdf
+
+import numpy as np
+
+from converter_utils.usd_manager import UsdManager, get_safe_identifier, get_ascii_string
+
+
+class SdfPrim():
+    """
+    handle of a prim spec authored by SdfUsdManager,
+    with the part of the Usd.Prim / UsdGeom.Mesh interface used by the converter.
+    """
+    def __init__(self, prim_spec):
+        self.prim_spec = prim_spec
+
+    def GetPath(self):
+        return self.prim_spec.path
+
+    def GetPrim(self):
+        return self
+
+
+class SdfUsdManager(UsdManager):
+    """
+    UsdManager backend writing prim specs, attribute specs and values straight into an in memory Sdf.Layer,
+    exported once by save_stage: there is no stage to notify and recompose at every write.\n
+    Material networks are authored with UsdShade on a separate in memory stage, and copied in the layer on save.
+    It does not compose other layers, so it is not used by incremental conversions.
+    """
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.layer = Sdf.Layer.CreateAnonymous(".usda")
+
+        # IFC use Z up
+        self.layer.pseudoRoot.SetInfo(UsdGeom.Tokens.upAxis, UsdGeom.Tokens.z)
+        self.layer.pseudoRoot.SetInfo(UsdGeom.Tokens.metersPerUnit, 1.0)
+
+        self.edit_layer = None
+        self.guids_prims_dict = dict()
+
+        self.world_prim = self.define_prim(self.get_safe_prim_name("World"), "")
+
+        # materials are defined in the layer here, so they follow the World prim
+        materials_prim_name = self.get_safe_prim_name("Materials")
+        self.define_prim(materials_prim_name, "Scope")
+        self.materials_layer = Sdf.Layer.CreateAnonymous(".usda")
+        self.stage = Usd.Stage.Open(self.materials_layer)
+        self.material_container_prim = self.stage.DefinePrim(materials_prim_name, "Scope")
+
+        self.prototypes_container_prim = None
+
+        self.init_materials_registry()
+
+    def define_prim(self, prim_path, type_name):
+        """
+        define (or define again) the prim spec at the given path, its parent must exist
+        """
+        prim_spec = Sdf.CreatePrimInLayer(self.layer, prim_path)
+        prim_spec.specifier = Sdf.SpecifierDef
+        if type_name:
+            prim_spec.typeName = type_name
+        elif prim_spec.HasInfo("typeName"):
+            prim_spec.ClearInfo("typeName")
+        return SdfPrim(prim_spec)
+
+    def create_attribute(self, prim, name, type_name, value=None, variability=Sdf.VariabilityVarying, custom=False):
+        prim_spec = prim.prim_spec
+        attribute_spec = prim_spec.attributes.get(name)
+        if attribute_spec is None:
+            attribute_spec = Sdf.AttributeSpec(prim_spec, name, type_name, variability, custom)
+        if value is not None:
+            attribute_spec.default = value
+        return attribute_spec
+
+    def create_relationship(self, prim, name, targets_paths, custom):
+        prim_spec = prim.prim_spec
+        relationship_spec = prim_spec.relationships.get(name)
+        if relationship_spec is None:
+            relationship_spec = Sdf.RelationshipSpec(prim_spec, name, custom)
+        relationship_spec.targetPathList.explicitItems = [Sdf.Path(target_path) for target_path in targets_paths]
+        return relationship_spec
+
+    def apply_api_schema(self, prim, schema_name):
+        prim_spec = prim.prim_spec
+        api_schemas = prim_spec.GetInfo("apiSchemas") if prim_spec.HasInfo("apiSchemas") else Sdf.TokenListOp()
+        if schema_name not in api_schemas.prependedItems:
+            api_schemas.prependedItems = list(api_schemas.prependedItems) + [schema_name]
+            prim_spec.SetInfo("apiSchemas", api_schemas)
+
+    def define_container_prim(self, name):
+        prim_path = str(self.world_prim.GetPath()) + self.get_safe_prim_name(name)
+        prim_spec = self.layer.GetPrimAtPath(prim_path)
+        if prim_spec is None:
+            return self.define_prim(prim_path, "Scope")
+        return SdfPrim(prim_spec)
+
+    def create_prim(self, parent_prim, guid, prim_name, type="Xform"):
+        prim = self.define_prim(str(parent_prim.GetPath()) + self.get_safe_prim_name(prim_name), type)
+        self.guids_prims_dict[guid] = prim
+        return prim
+
+    def override_prim(self, guid, prim_path):
+        prim = SdfPrim(Sdf.CreatePrimInLayer(self.layer, prim_path))
+        self.guids_prims_dict[guid] = prim
+        return prim
+
+    def reuse_usd_mesh(self, name, mesh_to_reuse_prim_path):
+        mesh_prim = self.define_prim(self.find_mesh_parent_prim_path(name) + "/Mesh_", "Xform")
+        mesh_prim.prim_spec.referenceList.explicitItems = [Sdf.Reference(primPath=mesh_to_reuse_prim_path)]
+        mesh_prim.prim_spec.instanceable = True
+        return mesh_prim
+
+    def get_usd_prototype_mesh_path_if_created(self, mesh_hash):
+        prototype_path = self.get_safe_prim_name("Prototypes") + self.get_safe_prim_name(f"Mesh_{mesh_hash}")
+        if self.layer.GetPrimAtPath(prototype_path) is not None:
+            return prototype_path
+        return None
+
+    def create_usd_prototype_mesh(self, mesh_hash):
+        if self.prototypes_container_prim is None:
+            # class prims are not traversed, so prototypes are not rendered at the origin
+            self.prototypes_container_prim = self.define_prim(self.get_safe_prim_name("Prototypes"), "")
+            self.prototypes_container_prim.prim_spec.specifier = Sdf.SpecifierClass
+
+        prototypes_path = str(self.prototypes_container_prim.GetPath())
+        prototype_path = prototypes_path + self.get_safe_prim_name(f"Mesh_{mesh_hash}")
+        self.define_prim(prototype_path, "Xform")
+        return self.define_prim(prototype_path + self.get_safe_prim_name("Mesh"), "Mesh")
+
+    def create_usd_mesh_(self, name):
+        return self.define_prim(self.find_mesh_parent_prim_path(name) + "/Mesh_", "Mesh")
+
+    def create_usd_merged_mesh(self, parent_prim_path, mesh_name):
+        scope_path = parent_prim_path + self.get_safe_prim_name("MergedMeshes")
+        if self.layer.GetPrimAtPath(scope_path) is None:
+            self.define_prim(scope_path, "Scope")
+
+        return self.define_prim(scope_path + self.get_safe_prim_name(mesh_name), "Mesh")
+
+    def generate_mesh_elements_ids(self, mesh, elements_ids, elements_guids, namespace):
+        self.create_primvar(mesh, "elementId", Sdf.ValueTypeNames.IntArray, self.to_vt_array(Vt.IntArray, elements_ids, np.int32), UsdGeom.Tokens.uniform, None)
+        self.create_attribute(mesh, f"{get_safe_identifier(namespace)}:elementGuids", Sdf.ValueTypeNames.StringArray, Vt.StringArray(elements_guids), Sdf.VariabilityUniform, custom=True)
+
+    def assign_transform_matrix(self, prim, matrix_4x4):
+        self.create_attribute(prim, "xformOp:transform", Sdf.ValueTypeNames.Matrix4d, Gf.Matrix4d(*matrix_4x4))
+        self.create_attribute(prim, UsdGeom.Tokens.xformOpOrder, Sdf.ValueTypeNames.TokenArray, Vt.TokenArray(["xformOp:transform"]), Sdf.VariabilityUniform)
+
+    def generate_uvs(self, mesh, uvs, interpolation=UsdGeom.Tokens.faceVarying, indices=None):
+        self.create_primvar(mesh, "st", Sdf.ValueTypeNames.TexCoord2fArray, self.to_vt_array(Vt.Vec2fArray, uvs, np.float32, 2), interpolation, indices)
+
+    def generate_collider(self, mesh_prim):
+        self.apply_api_schema(mesh_prim, "PhysicsCollisionAPI")
+        self.create_attribute(mesh_prim, "physics:collisionEnabled", Sdf.ValueTypeNames.Bool)
+
+    def generate_mesh_vertices(self, mesh, vertices):
+        self.create_attribute(mesh, UsdGeom.Tokens.points, Sdf.ValueTypeNames.Point3fArray, self.to_vt_array(Vt.Vec3fArray, vertices, np.float32, 3))
+
+    def generate_mesh_normals(self, mesh, normals, interpolation=UsdGeom.Tokens.faceVarying, indices=None):
+        self.create_primvar(mesh, "normals", Sdf.ValueTypeNames.Normal3fArray, self.to_vt_array(Vt.Vec3fArray, normals, np.float32, 3), interpolation, indices)
+        self.set_subdivision_scheme(mesh, UsdGeom.Tokens.bilinear)
+
+    def generate_mesh_extent(self, mesh, extent):
+        self.create_attribute(mesh, UsdGeom.Tokens.extent, Sdf.ValueTypeNames.Float3Array, self.to_vt_array(Vt.Vec3fArray, extent, np.float32, 3))
+
+    def set_extents_hint(self, prim, extents_hint):
+        self.apply_api_schema(prim, "GeomModelAPI")
+        self.create_attribute(prim, UsdGeom.Tokens.extentsHint, Sdf.ValueTypeNames.Float3Array, self.to_vt_array(Vt.Vec3fArray, extents_hint, np.float32, 3))
+
+    def set_subdivision_scheme(self, mesh, subdivision_scheme):
+        self.create_attribute(mesh, UsdGeom.Tokens.subdivisionScheme, Sdf.ValueTypeNames.Token, subdivision_scheme, Sdf.VariabilityUniform)
+
+    def create_primvar(self, mesh, name, type_name, values, interpolation, indices):
+        primvar_spec = self.create_attribute(mesh, f"primvars:{name}", type_name, values)
+        primvar_spec.SetInfo(UsdGeom.Tokens.interpolation, interpolation)
+        if indices is not None:
+            self.create_attribute(mesh, f"primvars:{name}:indices", Sdf.ValueTypeNames.IntArray, self.to_vt_array(Vt.IntArray, indices, np.int32))
+
+    def generate_mesh_indices(self, mesh, faces):
+        self.create_attribute(mesh, UsdGeom.Tokens.faceVertexIndices, Sdf.ValueTypeNames.IntArray, self.to_vt_array(Vt.IntArray, faces, np.int32))
+
+        # triangle mesh
+        face_vertex_counts = np.full(len(faces) // 3, 3, dtype=np.int32)
+        self.create_attribute(mesh, UsdGeom.Tokens.faceVertexCounts, Sdf.ValueTypeNames.IntArray, Vt.IntArray.FromNumpy(face_vertex_counts))
+
+    def bind_material(self, prim, material):
+        self.apply_api_schema(prim, "MaterialBindingAPI")
+        self.create_relationship(prim, "material:binding", [material.GetPath()], custom=False)
+
+    def assign_mesh_subset_material(self, usd_mesh, material_name, material_color, material_texture, alpha, faces_indices):
+        # TODO: manage the texture of subsets materials
+        material = self.get_material(material_name, material_color, alpha, None)
+
+        subset_path = str(usd_mesh.GetPath()) + self.get_safe_prim_name("Subset_" + material_name)
+        subset = self.define_prim(subset_path, "GeomSubset")
+        self.create_attribute(subset, UsdGeom.Tokens.indices, Sdf.ValueTypeNames.IntArray, self.to_vt_array(Vt.IntArray, faces_indices, np.int32))
+        self.create_attribute(subset, UsdGeom.Tokens.elementType, Sdf.ValueTypeNames.Token, UsdGeom.Tokens.face, Sdf.VariabilityUniform)
+        self.create_attribute(subset, UsdGeom.Tokens.familyName, Sdf.ValueTypeNames.Token, "materialBind", Sdf.VariabilityUniform)
+
+        self.bind_material(subset, material)
+
+    def create_prim_string_attribute(self, prim, key, value, namespace):
+        # make sure no spaces are passed in attribute name
+        attribute_name = f"{get_safe_identifier(namespace)}:{get_safe_identifier(key)}"
+        self.create_attribute(prim, attribute_name, Sdf.ValueTypeNames.String, get_ascii_string(value), Sdf.VariabilityUniform, custom=True)
+
+    def create_prim_relationship(self, prim, key, targets_paths, namespace):
+        # make sure no spaces are passed in relationship name
+        relationship_name = f"{get_safe_identifier(namespace)}:{get_safe_identifier(key)}"
+        self.create_relationship(prim, relationship_name, targets_paths, custom=True)
+
+    def create_shared_string_prim(self, scope_name, prim_name, key, value, namespace):
+        scope_path = self.get_safe_prim_name(scope_name)
+        if self.layer.GetPrimAtPath(scope_path) is None:
+            self.define_prim(scope_path, "Scope")
+
+        prim = self.define_prim(scope_path + self.get_safe_prim_name(prim_name), "")
+        self.create_prim_string_attribute(prim, key, value, namespace)
+        return str(prim.GetPath())
+
+    def add_sublayer(self, layer_path):
+        self.layer.subLayerPaths.append(layer_path)
+
+    def copy_materials(self):
+        # the material networks, in the order they were authored
+        materials_path = self.material_container_prim.GetPath()
+        for material_spec in self.materials_layer.GetPrimAtPath(materials_path).nameChildren:
+            Sdf.CopySpec(self.materials_layer, material_spec.path, self.layer, material_spec.path)
+
+    def get_authoring_layer(self):
+        self.copy_materials()
+        return self.layer
+
+    def authoring_block(self):
+        return Sdf.ChangeBlock()
+
+    def save_stage(self):
+        self.copy_materials()
+        self.layer.Export(self.output_path)
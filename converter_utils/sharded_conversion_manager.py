@@ -0,0 +1,185 @@
+from converter_utils.ifc2usd_manager import Ifc2UsdManager
+from converter_utils import usd_diff_helper
+from converter_utils.timer import Timer
+
+import os
+import math
+import heapq
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def convert_ifc_shard_to_usd_layer(ifc_file_path, usd_layer_path, converter_args, angular_tolerance, deflection_tolerance, products_ids, guids_and_prim_paths):
+    """
+    worker process entry point, tessellate a shard of the products of an IFC file and author them in their own usd layer.\n
+    return (usd_layer_path, elapsed_time, error, elements_extents)
+    """
+    start_time = time.perf_counter()
+    try:
+        ifc2usd_manager = Ifc2UsdManager(usd_layer_path, **converter_args)
+        ifc2usd_manager.convert_ifc_shard_to_usd(ifc_file_path, angular_tolerance, deflection_tolerance, products_ids, guids_and_prim_paths)
+        return (usd_layer_path, time.perf_counter() - start_time, None, ifc2usd_manager.elements_extents)
+    except Exception:
+        return (usd_layer_path, time.perf_counter() - start_time, traceback.format_exc(), dict())
+
+
+class ShardedConversionManager():
+    def __init__(self, usd_output_path, shards_count, shard_by, converter_args, verify_shards=False, metadata_db_path=None):
+        """
+        converter_args are the Ifc2UsdManager keyword arguments (except the usd output path).
+        The metadata database, if any, is written with the hierarchy.\n
+        shard_by can be "storey" (products grouped by building storey) or "id" (entity id ranges).
+        """
+        self.usd_output_path = usd_output_path
+        self.shards_count = shards_count
+        self.shard_by = shard_by
+        self.converter_args = converter_args
+        self.verify_shards = verify_shards
+        self.metadata_db_path = metadata_db_path
+
+        usd_output_directory = os.path.dirname(os.path.abspath(usd_output_path))
+        usd_output_name = os.path.basename(usd_output_path).split('.')[0]
+        self.shards_directory = os.path.join(usd_output_directory, f"{usd_output_name}_shards")
+
+    def convert_ifc_files(self, ifc_file_paths, angular_tolerance, deflection_tolerance):
+        """
+        for every IFC file, the hierarchy is created in the output stage, the products are split in shards
+        and each shard is tessellated and authored by its own process in its own .usdc layer,
+        finally the layers are sublayered by the output stage.
+        """
+        os.makedirs(self.shards_directory, exist_ok=True)
+        ifc2usd_manager = Ifc2UsdManager(self.usd_output_path, **self.converter_args, metadata_db_path=self.metadata_db_path)
+        usd_output_directory = os.path.dirname(os.path.abspath(self.usd_output_path))
+
+        for ifc_file_path in ifc_file_paths:
+            try:
+                filename = os.path.basename(ifc_file_path)
+                file_conversion_timer = Timer(f"{filename} Conversion")
+                file_conversion_timer.start()
+
+                ifc2usd_manager.convert_ifc_hierarchy_to_usd(ifc_file_path, angular_tolerance, deflection_tolerance)
+                guids_prims_dict = ifc2usd_manager.usd_manager.guids_prims_dict
+
+                shards = self.get_ifc_shards(ifc2usd_manager.ifc_manager, guids_prims_dict)
+                print(f"{filename} products split in {len(shards)} shards: {[len(shard) for shard in shards]}")
+
+                filename_without_extension = filename.split('.')[0]
+                futures = []
+                # without products to tessellate there is no shard, the file has only its hierarchy
+                if len(shards) > 0:
+                    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                        for shard_index, products in enumerate(shards):
+                            usd_layer_path = os.path.join(self.shards_directory, f"{filename_without_extension}_{shard_index}.usdc")
+                            guids_and_prim_paths = {product.GlobalId: str(guids_prims_dict[product.GlobalId].GetPath()) for product in products}
+                            futures.append(executor.submit(
+                                convert_ifc_shard_to_usd_layer,
+                                ifc_file_path,
+                                usd_layer_path,
+                                self.converter_args,
+                                angular_tolerance,
+                                deflection_tolerance,
+                                [product.id() for product in products],
+                                guids_and_prim_paths
+                            ))
+
+                        for future in as_completed(futures):
+                            usd_layer_path, elapsed_time, error, elements_extents = future.result()
+                            if error is not None:
+                                print(f"Error -> {error}  --> shard: {usd_layer_path}")
+                            else:
+                                print(f"""{os.path.basename(usd_layer_path)} Shard
+              elapsed time: {elapsed_time:0.4f} seconds""")
+
+                # sublayers keep the shards order, whatever the completion order was
+                for future in futures:
+                    usd_layer_path, elapsed_time, error, elements_extents = future.result()
+                    if error is None:
+                        ifc2usd_manager.usd_manager.add_sublayer(os.path.relpath(usd_layer_path, usd_output_directory).replace("\\", "/"))
+                        # every product is in a single shard
+                        ifc2usd_manager.elements_extents.update(elements_extents)
+                ifc2usd_manager.create_extents_hints()
+
+                file_conversion_timer.stop()
+            except Exception as error:
+                print(f"Error -> {error}  --> input ifc file: {ifc_file_path}")
+                traceback.print_exc()
+
+        ifc2usd_manager.usd_manager.save_stage()
+
+        if self.verify_shards:
+            self.verify_against_serial_conversion(ifc_file_paths, angular_tolerance, deflection_tolerance)
+
+    def get_ifc_shards(self, ifc_manager, guids_prims_dict):
+        """
+        split the products to tessellate (with a representation, a prim in the hierarchy and included by the types filters)
+        in shards,\n
+        return a list of lists of products.
+        """
+        products = [
+            product for product in ifc_manager.ifc_file.by_type("IfcProduct")
+            if product.Representation is not None and product.GlobalId in guids_prims_dict and ifc_manager.is_ifc_type_included(product)
+        ]
+        products.sort(key=lambda product: product.id())
+
+        if len(products) == 0:
+            return []
+
+        max_shard_size = math.ceil(len(products) / self.shards_count)
+
+        if self.shard_by == "id":
+            return [products[i:i + max_shard_size] for i in range(0, len(products), max_shard_size)]
+
+        # group the products by building storey (or by parent, if not in a storey)
+        storeys_and_products = dict()
+        for product in products:
+            storey_path = self.get_storey_prim_path(guids_prims_dict[product.GlobalId].GetPath())
+            storeys_and_products.setdefault(storey_path, []).append(product)
+
+        # storeys bigger than a shard are split by id range, so they don't leave the other processes idle
+        groups = []
+        for storey_products in storeys_and_products.values():
+            for i in range(0, len(storey_products), max_shard_size):
+                groups.append(storey_products[i:i + max_shard_size])
+
+        # biggest groups first, each one in the currently smallest shard
+        groups.sort(key=len, reverse=True)
+        shards = [[] for _ in range(min(self.shards_count, len(groups)))]
+        shards_sizes = [(0, shard_index) for shard_index in range(len(shards))]
+        for group in groups:
+            shard_size, shard_index = heapq.heappop(shards_sizes)
+            shards[shard_index].extend(group)
+            heapq.heappush(shards_sizes, (shard_size + len(group), shard_index))
+
+        return shards
+
+    def get_storey_prim_path(self, prim_path):
+        """
+        return the path of the closest building storey prim containing the given prim path,
+        or its parent path if there is none.
+        """
+        for prefix in reversed(prim_path.GetPrefixes()):
+            if prefix.name.startswith("IfcBuildingStorey_"):
+                return str(prefix)
+
+        return str(prim_path.GetParentPath())
+
+    def verify_against_serial_conversion(self, ifc_file_paths, angular_tolerance, deflection_tolerance):
+        """
+        convert the same files with the serial path and print the prim/attribute differences with the sharded output.
+        """
+        usd_output_name, usd_output_extension = os.path.splitext(self.usd_output_path)
+        serial_usd_output_path = f"{usd_output_name}_serial{usd_output_extension}"
+
+        ifc2usd_manager = Ifc2UsdManager(serial_usd_output_path, **self.converter_args)
+        for ifc_file_path in ifc_file_paths:
+            ifc2usd_manager.convert_ifc_to_usd(ifc_file_path, angular_tolerance, deflection_tolerance)
+
+        differences = usd_diff_helper.diff_usd_stages(self.usd_output_path, serial_usd_output_path)
+
+        if len(differences) == 0:
+            print(f"Sharded output identical to serial output: {serial_usd_output_path}")
+        else:
+            print(f"Sharded output differs from serial output ({len(differences)} differences):")
+            for difference in differences[:50]:
+                print(f"    {difference}")
@@ -0,0 +1,152 @@
+from pxr import UsdGeom, Sdf
+
+import os
+
+
+class StoreyPayloadsManager():
+    def __init__(self, usd_output_path):
+        """
+        the payload layers are written in the '<output name>_payloads' folder.
+        """
+        self.usd_output_directory = os.path.dirname(os.path.abspath(usd_output_path))
+        usd_output_name = os.path.basename(usd_output_path).split('.')[0]
+        self.payloads_directory = os.path.join(self.usd_output_directory, f"{usd_output_name}_payloads")
+
+    def create_storey_payloads(self, layer, storeys_paths, payloads_name):
+        """
+        move the children of every storey prim of the layer in its own .usdc layer, loaded as payload by the storey prim.\n
+        The storey prim keeps its properties (and the extentsHint of its content),
+        the payload layer gets a copy of the materials, prototypes and shared sets targeted by the content.
+        """
+        os.makedirs(self.payloads_directory, exist_ok=True)
+
+        with Sdf.ChangeBlock():
+            for storey_path in storeys_paths:
+                storey_path = Sdf.Path(storey_path)
+                payload_layer_path = os.path.join(self.payloads_directory, f"{payloads_name}_{storey_path.name}.usdc")
+                self.write_payload_layer(layer, storey_path, payload_layer_path)
+
+                storey_prim_spec = layer.GetPrimAtPath(storey_path)
+                for child_prim_name in list(storey_prim_spec.nameChildren.keys()):
+                    del storey_prim_spec.nameChildren[child_prim_name]
+
+                payload_asset_path = os.path.relpath(payload_layer_path, self.usd_output_directory).replace("\\", "/")
+                storey_prim_spec.payloadList.explicitItems = [Sdf.Payload(payload_asset_path)]
+
+        print(f"Storey payloads: {len(storeys_paths)} written in {self.payloads_directory}")
+
+    def write_payload_layer(self, layer, storey_path, payload_layer_path):
+        """
+        write the storey content in a layer, under a default prim named as the storey
+        """
+        payload_layer = Sdf.Layer.CreateAnonymous(".usdc")
+        for info_key in (UsdGeom.Tokens.upAxis, UsdGeom.Tokens.metersPerUnit):
+            if layer.pseudoRoot.HasInfo(info_key):
+                payload_layer.pseudoRoot.SetInfo(info_key, layer.pseudoRoot.GetInfo(info_key))
+
+        payload_prim_path = Sdf.Path.absoluteRootPath.AppendChild(storey_path.name)
+        Sdf.CopySpec(layer, storey_path, payload_layer, payload_prim_path)
+        payload_layer.defaultPrim = storey_path.name
+
+        # the storey properties stay in the output layer
+        payload_prim_spec = payload_layer.GetPrimAtPath(payload_prim_path)
+        for property_spec in list(payload_prim_spec.properties):
+            payload_prim_spec.RemoveProperty(property_spec)
+        for info_key in ("apiSchemas", "payload"):
+            if payload_prim_spec.HasInfo(info_key):
+                payload_prim_spec.ClearInfo(info_key)
+
+        # paths inside the storey are already moved by CopySpec, the targeted root prims
+        # (e.g. /Materials/Material_0) are copied under the payload prim, e.g. /IfcBuildingStorey_0/Materials/Material_0
+        world_path = storey_path.GetPrefixes()[0]
+        copied_paths = set()
+        prims_paths_to_visit = [payload_prim_path]
+
+        def move_path(path):
+            path = Sdf.Path(path)
+            if path.HasPrefix(payload_prim_path) or path.HasPrefix(world_path) or path.IsAbsoluteRootPath():
+                return path
+            copied_path = path.GetPrefixes()[min(1, path.pathElementCount - 1)]
+            if copied_path not in copied_paths:
+                copied_paths.add(copied_path)
+                prims_paths_to_visit.append(self.copy_prim_spec(layer, copied_path, payload_layer, payload_prim_path))
+            return path.ReplacePrefix(Sdf.Path.absoluteRootPath, payload_prim_path)
+
+        while len(prims_paths_to_visit) > 0:
+            prim_path = prims_paths_to_visit.pop()
+            prim_specs = []
+            payload_layer.Traverse(prim_path, lambda path: prim_specs.append(payload_layer.GetPrimAtPath(path)) if path.IsPrimPath() else None)
+            for prim_spec in prim_specs:
+                self.move_prim_spec_paths(prim_spec, move_path)
+
+        payload_layer.Export(payload_layer_path)
+
+    def copy_prim_spec(self, layer, prim_path, payload_layer, payload_prim_path):
+        """
+        copy a prim (with its ancestors specifiers and types) under the payload prim, return its path in the payload layer
+        """
+        copied_prim_path = prim_path.ReplacePrefix(Sdf.Path.absoluteRootPath, payload_prim_path)
+        for ancestor_path in prim_path.GetParentPath().GetPrefixes():
+            ancestor_prim_spec = layer.GetPrimAtPath(ancestor_path)
+            copied_ancestor_prim_spec = Sdf.CreatePrimInLayer(payload_layer, ancestor_path.ReplacePrefix(Sdf.Path.absoluteRootPath, payload_prim_path))
+            copied_ancestor_prim_spec.specifier = ancestor_prim_spec.specifier
+            if ancestor_prim_spec.typeName:
+                copied_ancestor_prim_spec.typeName = ancestor_prim_spec.typeName
+
+        Sdf.CopySpec(layer, prim_path, payload_layer, copied_prim_path)
+        return copied_prim_path
+
+    def move_prim_spec_paths(self, prim_spec, move_path):
+        """
+        replace the paths targeted by relationships, connections and internal references of the prim spec,
+        relative asset paths are anchored again to the payloads folder.
+        """
+        self.move_list_op_items(prim_spec.referenceList, lambda reference: reference if reference.assetPath else Sdf.Reference(
+            primPath=move_path(reference.primPath), layerOffset=reference.layerOffset, customData=reference.customData
+        ))
+
+        for relationship_spec in prim_spec.relationships:
+            self.move_list_op_items(relationship_spec.targetPathList, move_path)
+
+        for attribute_spec in prim_spec.attributes:
+            self.move_list_op_items(attribute_spec.connectionPathList, move_path)
+
+            if attribute_spec.typeName == Sdf.ValueTypeNames.Asset and attribute_spec.HasDefaultValue():
+                asset_path = attribute_spec.default.path
+                if asset_path and not os.path.isabs(asset_path):
+                    asset_path = os.path.relpath(os.path.join(self.usd_output_directory, asset_path), self.payloads_directory)
+                    attribute_spec.default = Sdf.AssetPath(asset_path.replace("\\", "/"))
+
+    def move_list_op_items(self, list_editor, move_item):
+        for items_name in ("explicitItems", "prependedItems", "appendedItems"):
+            items = list(getattr(list_editor, items_name))
+            if len(items) > 0:
+                setattr(list_editor, items_name, [move_item(item) for item in items])
+
+    def remove_unreferenced_prims(self, layer, scope_path):
+        """
+        remove the children of the scope (e.g. the prototypes moved in the payloads) no more referenced in the layer,
+        and the scope if left empty. Return True if the scope was removed.
+        """
+        scope_prim_spec = layer.GetPrimAtPath(scope_path)
+        if scope_prim_spec is None:
+            return False
+
+        referenced_paths = set()
+
+        def add_referenced_paths(path):
+            if path.IsPrimPath():
+                prim_spec = layer.GetPrimAtPath(path)
+                for items_name in ("explicitItems", "prependedItems", "appendedItems"):
+                    referenced_paths.update(reference.primPath for reference in getattr(prim_spec.referenceList, items_name) if not reference.assetPath)
+
+        layer.Traverse(Sdf.Path.absoluteRootPath, add_referenced_paths)
+
+        for child_prim_spec in list(scope_prim_spec.nameChildren):
+            if child_prim_spec.path not in referenced_paths:
+                del scope_prim_spec.nameChildren[child_prim_spec.name]
+
+        if len(scope_prim_spec.nameChildren) == 0:
+            del layer.pseudoRoot.nameChildren[scope_prim_spec.name]
+            return True
+        return False
@@ -0,0 +1,61 @@
+from pxr import Usd
+
+
+def diff_usd_stages(usd_path_a, usd_path_b):
+    """
+    Given two usd files return the list of differences (as strings) between the composed stages:\n
+    prims, prim types, instanceable flags, attribute values and relationship targets.
+    """
+    stage_a = Usd.Stage.Open(usd_path_a)
+    stage_b = Usd.Stage.Open(usd_path_b)
+
+    prims_a = get_prims_by_path(stage_a)
+    prims_b = get_prims_by_path(stage_b)
+
+    differences = []
+
+    for prim_path in sorted(prims_a.keys() - prims_b.keys()):
+        differences.append(f"{prim_path}: prim only in {usd_path_a}")
+    for prim_path in sorted(prims_b.keys() - prims_a.keys()):
+        differences.append(f"{prim_path}: prim only in {usd_path_b}")
+
+    for prim_path in sorted(prims_a.keys() & prims_b.keys()):
+        differences.extend(diff_prims(prims_a[prim_path], prims_b[prim_path]))
+
+    return differences
+
+
+def get_prims_by_path(stage):
+    # class prims (e.g. prototypes) and instance proxies included
+    predicate = Usd.TraverseInstanceProxies(Usd.PrimAllPrimsPredicate)
+    return {str(prim.GetPath()): prim for prim in Usd.PrimRange.Stage(stage, predicate)}
+
+
+def diff_prims(prim_a, prim_b):
+    differences = []
+    prim_path = str(prim_a.GetPath())
+
+    if prim_a.GetTypeName() != prim_b.GetTypeName():
+        differences.append(f"{prim_path}: type {prim_a.GetTypeName()} != {prim_b.GetTypeName()}")
+    if prim_a.IsInstanceable() != prim_b.IsInstanceable():
+        differences.append(f"{prim_path}: instanceable {prim_a.IsInstanceable()} != {prim_b.IsInstanceable()}")
+
+    attributes_a = {attribute.GetName(): attribute for attribute in prim_a.GetAttributes()}
+    attributes_b = {attribute.GetName(): attribute for attribute in prim_b.GetAttributes()}
+
+    for name in sorted(attributes_a.keys() ^ attributes_b.keys()):
+        differences.append(f"{prim_path}.{name}: attribute only in one stage")
+    for name in sorted(attributes_a.keys() & attributes_b.keys()):
+        if attributes_a[name].Get() != attributes_b[name].Get():
+            differences.append(f"{prim_path}.{name}: different values")
+
+    relationships_a = {relationship.GetName(): relationship for relationship in prim_a.GetRelationships()}
+    relationships_b = {relationship.GetName(): relationship for relationship in prim_b.GetRelationships()}
+
+    for name in sorted(relationships_a.keys() ^ relationships_b.keys()):
+        differences.append(f"{prim_path}.{name}: relationship only in one stage")
+    for name in sorted(relationships_a.keys() & relationships_b.keys()):
+        if relationships_a[name].GetTargets() != relationships_b[name].GetTargets():
+            differences.append(f"{prim_path}.{name}: different targets")
+
+    return differences
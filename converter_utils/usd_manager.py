@@ -1,11 +1,47 @@
 from pxr import Usd, UsdGeom, Vt, Gf, Sdf, UsdShade, UsdPhysics
 import re
+import hashlib
+import contextlib
+from functools import lru_cache
+
+import numpy as np
 
 from unidecode import unidecode
 
 
+NOT_ALPHANUMERIC_PATTERN = re.compile("[^a-zA-Z0-9]")
+
+
+def get_ascii_string(value):
+    """
+    transliterate the string to ASCII, mostly already ASCII so unidecode is skipped
+    """
+    if value.isascii():
+        return value
+    return unidecode(value)
+
+
+@lru_cache(maxsize=65536)
+def get_safe_identifier(name):
+    """
+    return the name transliterated to ASCII with every non alphanumeric character replaced by '_',
+    names (types, namespaces, property keys) repeat a lot so they are cached
+    """
+    return NOT_ALPHANUMERIC_PATTERN.sub("_", get_ascii_string(name))
+
+
+@lru_cache(maxsize=65536)
+def get_safe_prim_name(name):
+    name = get_ascii_string(name)
+    if (len(name) == 0):
+        name = "undefined"
+    if name[0].isdigit():
+        name = "m" + name
+    return "/" + NOT_ALPHANUMERIC_PATTERN.sub("_", name)
+
+
 class UsdManager():
-    def __init__(self, output_path):
+    def __init__(self, output_path, sublayers_paths=None, edit_layer_path=None):
         self.stage = Usd.Stage.CreateNew(output_path)
 
         # IFC use Z up, TODO: use parameter for output up axis?
@@ -13,6 +49,15 @@ class UsdManager():
         meter_per_unit = 1  # 1 unit equals 1 meters
         UsdGeom.SetStageMetersPerUnit(self.stage, meter_per_unit)
 
+        # with an edit layer, the output root layer only composes the sublayers,
+        # and everything is authored in the edit layer (one of the sublayers)
+        self.edit_layer = None
+        if edit_layer_path is not None:
+            self.edit_layer = Sdf.Layer.CreateNew(edit_layer_path)
+            for sublayer_path in sublayers_paths:
+                self.add_sublayer(sublayer_path)
+            self.stage.SetEditTarget(Usd.EditTarget(self.edit_layer))
+
         # Dict used to map the prim created with the guid
         # Because we will need to add meshes to the stage, which have guid
         # of a node in the hierarchy created before geometry iteration
@@ -30,6 +75,19 @@ class UsdManager():
         )
         self.material_container_prim = self.stage.DefinePrim(materials_prim_name, "Scope")
 
+        # Folder for the meshes shared by instanceable prims, created only when needed
+        self.prototypes_container_prim = None
+
+        self.init_materials_registry()
+
+    def init_materials_registry(self):
+        # Materials registry: material key -> material
+        # every material network is authored once, then the material is only bound
+        self.materials_by_key = dict()
+        self.materials_hits = 0
+        self.materials_misses = 0
+        self.materials_authored = 0
+
     # create a prim/node container inside world prim
     def define_container_prim(self, name):
         """
@@ -42,7 +100,7 @@ class UsdManager():
 
         prim = self.get_prim_if_created(prim_path)
 
-        if prim is None:
+        if prim.IsValid() is False:
             container_prim = self.stage.DefinePrim(prim_path, "Scope")
             return container_prim
         else:
@@ -71,17 +129,104 @@ class UsdManager():
         self.guids_prims_dict[guid] = prim
         return prim
 
+    def override_prim(self, guid, prim_path):
+        """
+        create an 'over' prim (and ancestors) for a prim defined in another layer, and store its reference using the guid as key
+        """
+        prim = self.stage.OverridePrim(prim_path)
+        self.guids_prims_dict[guid] = prim
+        return prim
+
+    def register_prim(self, guid, prim_path):
+        """
+        store the reference of a prim already in the stage (e.g. defined in a sublayer) using the guid as key
+        """
+        prim = self.stage.GetPrimAtPath(prim_path)
+        self.guids_prims_dict[guid] = prim
+        return prim
+
+    def deactivate_prim(self, prim_path):
+        """
+        deactivate a prim defined in a weaker layer, it is removed from the composed stage with all its children
+        """
+        prim = self.stage.GetPrimAtPath(prim_path)
+        if prim.IsValid():
+            prim.SetActive(False)
+
+    def block_opinions_not_in_edit_layer(self, prim_path):
+        """
+        hide what the weaker layers say about a prim and its descendants, when not authored again in the edit layer:\n
+        attributes are blocked, relationships and references cleared, children deactivated.
+        """
+        prim = self.stage.GetPrimAtPath(prim_path)
+        if prim.IsValid() is False:
+            return
+
+        prim_spec = self.edit_layer.GetPrimAtPath(prim_path)
+        if prim_spec is None:
+            prim.SetActive(False)
+            return
+
+        # only the opinions of the layer stack, what comes from references (e.g. prototypes) is kept
+        weaker_layers = [layer for layer in self.stage.GetLayerStack(includeSessionLayers=False) if layer not in (self.stage.GetRootLayer(), self.edit_layer)]
+        for layer in weaker_layers:
+            weaker_prim_spec = layer.GetPrimAtPath(prim_path)
+            if weaker_prim_spec is None:
+                continue
+
+            if weaker_prim_spec.HasInfo("references") and prim_spec.HasInfo("references") is False:
+                prim.GetReferences().SetReferences([])
+            if weaker_prim_spec.HasInfo("instanceable") and prim_spec.HasInfo("instanceable") is False:
+                prim.SetInstanceable(False)
+
+            for property_spec in weaker_prim_spec.properties:
+                if prim_spec.properties.get(property_spec.name) is not None:
+                    continue
+                if isinstance(property_spec, Sdf.AttributeSpec):
+                    prim.GetAttribute(property_spec.name).Block()
+                else:
+                    prim.GetRelationship(property_spec.name).SetTargets([])
+
+            for child_prim_name in weaker_prim_spec.nameChildren.keys():
+                self.block_opinions_not_in_edit_layer(prim.GetPath().AppendChild(child_prim_name))
+
     def reuse_usd_mesh(self, name, mesh_to_reuse_prim_path):
         """
-        reference an identical mesh (with same geometry) already created in USD for another object.
+        reference an identical mesh (with same geometry) already created in USD for another object.\n
+        The prim is an instanceable Xform placing the prototype, so all the occurrences share its mesh.
         """
         mesh_reference_path = self.find_mesh_parent_prim_path(name)
-        mesh_prim = UsdGeom.Mesh.Define(self.stage, mesh_reference_path + "/Mesh_")
-        mesh_prim.GetPrim().GetReferences().AddInternalReference(mesh_to_reuse_prim_path)
-        return  UsdGeom.Mesh(mesh_prim)
+        mesh_prim = self.stage.DefinePrim(mesh_reference_path + "/Mesh_", "Xform")
+        # set instead of add, the same guid could be found more than once by the geometry iterator
+        mesh_prim.GetReferences().SetReferences([Sdf.Reference(primPath=mesh_to_reuse_prim_path)])
+        mesh_prim.SetInstanceable(True)
+        return mesh_prim
 
+    def get_usd_prototype_mesh_path_if_created(self, mesh_hash):
+        """
+        return the path of the prototype mesh with the given hash if already in the stage (e.g. in a sublayer), else None
+        """
+        prototype_path = self.get_safe_prim_name("Prototypes") + self.get_safe_prim_name(f"Mesh_{mesh_hash}")
+        if self.stage.GetPrimAtPath(prototype_path).IsValid():
+            return prototype_path
+        return None
+
+    def create_usd_prototype_mesh(self, mesh_hash):
+        """
+        create a usd mesh in a prototype Xform under the prototypes scope, the Xform is referenced by instanceable prims
+        (USD instances share the descendants of the referenced prim, not the prim itself).
+        """
+        if self.prototypes_container_prim is None:
+            # class prims are not traversed, so prototypes are not rendered at the origin
+            prototypes_prim_name = self.get_safe_prim_name("Prototypes")
+            self.prototypes_container_prim = self.stage.CreateClassPrim(prototypes_prim_name)
 
+        prototypes_path = str(self.prototypes_container_prim.GetPath())
+        prototype_path = prototypes_path + self.get_safe_prim_name(f"Mesh_{mesh_hash}")
+        UsdGeom.Xform.Define(self.stage, prototype_path)
+        mesh = UsdGeom.Mesh.Define(self.stage, prototype_path + self.get_safe_prim_name("Mesh"))
 
+        return mesh
 
     def set_usd_mesh(self, mesh, faces, vertices, matrix_4x4, uvs):
         """
@@ -111,6 +256,34 @@ class UsdManager():
 
         return mesh
 
+    def create_usd_merged_mesh(self, parent_prim_path, mesh_name):
+        """
+        create a usd mesh under the 'MergedMeshes' scope of the given prim (e.g. a building storey).
+        """
+        scope_path = parent_prim_path + self.get_safe_prim_name("MergedMeshes")
+        if self.stage.GetPrimAtPath(scope_path).IsValid() is False:
+            self.stage.DefinePrim(scope_path, "Scope")
+
+        return UsdGeom.Mesh.Define(self.stage, scope_path + self.get_safe_prim_name(mesh_name))
+
+    def generate_mesh_elements_ids(self, mesh, elements_ids, elements_guids, namespace):
+        """
+        set the index of the element of every face in the 'elementId' primvar,
+        and the GlobalId of every index in the '<namespace>:elementGuids' attribute.
+        """
+        elements_ids_primvar = UsdGeom.PrimvarsAPI(mesh).CreatePrimvar("elementId",
+                                   Sdf.ValueTypeNames.IntArray,
+                                   UsdGeom.Tokens.uniform)
+        elements_ids_primvar.Set(self.to_vt_array(Vt.IntArray, elements_ids, np.int32))
+
+        elements_guids_attribute = mesh.GetPrim().CreateAttribute(
+            f"{get_safe_identifier(namespace)}:elementGuids",
+            Sdf.ValueTypeNames.StringArray,
+            custom=True,
+            variability=Sdf.VariabilityUniform
+        )
+        elements_guids_attribute.Set(Vt.StringArray(elements_guids))
+
     def assign_transform_matrix(self, prim, matrix_4x4):
         """
         Assign the 4x4 matrix to the given prim
@@ -126,23 +299,17 @@ class UsdManager():
         xformable = UsdGeom.Xformable(prim)
         xformable.MakeMatrixXform().Set(xform_matrix)
 
-    def generate_uvs(self, mesh, uvs):
+    def generate_uvs(self, mesh, uvs, interpolation=UsdGeom.Tokens.faceVarying, indices=None):
         """
-        elaborate the UVS and set on top of the relative given mesh.
+        elaborate the UVS and set on top of the relative given mesh, indexed if indices are given.
         """
-
-        #uvs_tuple = tuple(
-            #uvs[e:e + 2] for e, k in enumerate(uvs) if e % 2 == 0)
-        
-        uvs_tuples = uvs.reshape(-1, 2)
-        # Convert NumPy array of tuples to a list of tuples
-        vertices_list = [tuple(row) for row in uvs_tuples] 
-
         texCoords = UsdGeom.PrimvarsAPI(mesh).CreatePrimvar("st",
                                                             Sdf.ValueTypeNames.TexCoord2fArray,
-                                                            UsdGeom.Tokens.faceVarying)
+                                                            interpolation)
         
-        texCoords.Set(vertices_list)
+        texCoords.Set(self.to_vt_array(Vt.Vec2fArray, uvs, np.float32, 2))
+        if indices is not None:
+            texCoords.SetIndices(self.to_vt_array(Vt.IntArray, indices, np.int32))
 
     def generate_collider(self, mesh_prim):
         # Set the type of collider (in this case, we use 'box')
@@ -150,146 +317,145 @@ class UsdManager():
         physics.CreateCollisionEnabledAttr()
 
     def generate_mesh_vertices(self, mesh, vertices):
-        # from list vertices to tuples of 3 elements
-        #vertices_tuple = tuple(
-        #    vertices[e:e + 3] for e, k in enumerate(vertices) if e % 3 == 0)
-
-        vertices_tuples = vertices.reshape(-1, 3)
-        # Convert NumPy array of tuples to a list of tuples
-        vertices_list = [tuple(row) for row in vertices_tuples] 
-        
-        mesh.CreatePointsAttr().Set(Vt.Vec3fArray(vertices_list))
+        mesh.CreatePointsAttr().Set(self.to_vt_array(Vt.Vec3fArray, vertices, np.float32, 3))
 
-    def generate_mesh_normals(self, mesh, normals):
-        # from list vertices to tuples of 3 elements
-        #vertices_tuple = [tuple(normals[e:e + 3]) for e, k in enumerate(normals) if e % 3 == 0]
-        #normals_primvar = UsdGeom.PrimvarsAPI(mesh).CreatePrimvar("normals",
-        #                           Sdf.ValueTypeNames.Normal3fArray,
-        #                           UsdGeom.Tokens.faceVarying)
-
-        normals_tuple = normals.reshape(-1, 3)
+    def generate_mesh_normals(self, mesh, normals, interpolation=UsdGeom.Tokens.faceVarying, indices=None):
         normals_primvar = UsdGeom.PrimvarsAPI(mesh).CreatePrimvar("normals",
                                    Sdf.ValueTypeNames.Normal3fArray,
-                                   UsdGeom.Tokens.faceVarying)
-        
-        normals_list = [tuple(row) for row in normals_tuple] 
-        
+                                   interpolation)
 
-        UsdGeom.Mesh.CreateSubdivisionSchemeAttr(mesh, "bilinear")
+        self.set_subdivision_scheme(mesh, UsdGeom.Tokens.bilinear)
         
-        normals_primvar.Set(Vt.Vec3fArray(normals_list))# vertices_tuple))
+        normals_primvar.Set(self.to_vt_array(Vt.Vec3fArray, normals, np.float32, 3))
+        if indices is not None:
+            normals_primvar.SetIndices(self.to_vt_array(Vt.IntArray, indices, np.int32))
+
+    def generate_mesh_extent(self, mesh, extent):
+        UsdGeom.Mesh(mesh).CreateExtentAttr().Set(self.to_vt_array(Vt.Vec3fArray, extent, np.float32, 3))
+
+    def set_extents_hint(self, prim, extents_hint):
+        """
+        set the bounds of the prim content (in its space) as extentsHint, to be used instead of computing them
+        """
+        UsdGeom.ModelAPI.Apply(prim).SetExtentsHint(self.to_vt_array(Vt.Vec3fArray, extents_hint, np.float32, 3))
+
+    def set_subdivision_scheme(self, mesh, subdivision_scheme):
+        UsdGeom.Mesh(mesh).CreateSubdivisionSchemeAttr(subdivision_scheme)
 
     def generate_mesh_indices(self, mesh, faces):
         # Set the face indices
-        #mesh.CreateFaceVertexIndicesAttr().Set(Vt.IntArray(faces))
-        mesh.CreateFaceVertexIndicesAttr().Set(Vt.IntArray(faces.tolist())) # using numpy
+        mesh.CreateFaceVertexIndicesAttr().Set(self.to_vt_array(Vt.IntArray, faces, np.int32))
 
         # Set the number of vertices per face (assuming it's a triangle mesh)
-        faces_count = len(faces) / 3
+        faces_count = len(faces) // 3
 
-        face_vertex_counts = [3] * int(faces_count)
-        mesh.CreateFaceVertexCountsAttr().Set(face_vertex_counts)
+        face_vertex_counts = np.full(faces_count, 3, dtype=np.int32)
+        mesh.CreateFaceVertexCountsAttr().Set(Vt.IntArray.FromNumpy(face_vertex_counts))
 
+    def to_vt_array(self, vt_array_type, values, dtype, tuple_size=None):
+        """
+        convert a flat buffer (numpy array or list) in the given Vt array type,\n
+        through the buffer protocol, with a single cast to dtype (no copy if already of dtype).
+        """
+        values = np.ascontiguousarray(values, dtype=dtype)
+        if tuple_size is not None:
+            values = values.reshape(-1, tuple_size)
+        return vt_array_type.FromNumpy(values)
 
-    def assign_mesh_material(self, usd_mesh, material_name, material_color, alpha, texture_info):
-        # Create a transparent material for the mesh
 
-        material_container_path = str(self.material_container_prim.GetPath())
-        
+    def get_material(self, material_name, material_color, alpha, texture_info):
+        """
+        return the material with the given name, color, opacity and texture,
+        its network is authored only the first time (then the material is just bound).\n
+        The material path is the name with a short hash of the values, so it depends only on the material content
+        (the same in every layer of a sharded or parallel conversion, and for materials with the same name but different values).
+        """
         safe_material_name = self.get_safe_prim_name(material_name)
-        material_path = material_container_path + safe_material_name
+        material_key = (
+            safe_material_name,
+            tuple(Gf.Vec3f(material_color)),
+            float(np.float32(alpha)),
+            self.get_texture_key(texture_info)
+        )
+
+        material = self.materials_by_key.get(material_key)
+        if material is not None:
+            self.materials_hits += 1
+            return material
+        self.materials_misses += 1
+
+        material_hash = hashlib.blake2b(repr(material_key).encode(), digest_size=4).hexdigest()
+        material_path = f"{self.material_container_prim.GetPath()}{safe_material_name}_{material_hash}"
+
+        # e.g. authored in the base layer of an incremental conversion
+        existing_material_prim = self.stage.GetPrimAtPath(material_path)
+        if existing_material_prim.IsValid():
+            material = UsdShade.Material(existing_material_prim)
+            self.materials_by_key[material_key] = material
+            return material
+
         material = UsdShade.Material.Define(self.stage,  material_path)
 
         # Create a surface shader
-        shader_path = f"{material_path}/PBR_Shader"
-        surfaceShader = UsdShade.Shader.Define(self.stage, shader_path)
+        surfaceShader = UsdShade.Shader.Define(self.stage, f"{material_path}/PBR_Shader")
         surfaceShader.CreateIdAttr("UsdPreviewSurface")
         surfaceShader.CreateInput("diffuseColor", Sdf.ValueTypeNames.Color3f).Set(Gf.Vec3f(material_color))
         surfaceShader.CreateInput("opacity", Sdf.ValueTypeNames.Float).Set(alpha)  # Set the opacity value for transparency
+        # TODO: Manage roughness and metallic 
 
         if material_name == "transparent":
             surfaceShader.CreateInput("opacityThreshold", Sdf.ValueTypeNames.Float).Set(0.1)  # Set the opacity Threshold value 
 
         # Connect the surface shader to the material's surface output
-        # Assign the material to the mesh
         material.CreateSurfaceOutput().ConnectToSource(surfaceShader.ConnectableAPI(), "surface")
-        UsdShade.MaterialBindingAPI(usd_mesh).Bind(material)
 
-        
-        if (texture_info is not None and len(texture_info) > 0):
-            self.set_texture(usd_mesh, material_path, material, surfaceShader, texture_info)
+        if texture_info:
+            self.set_texture(material_path, material, surfaceShader, texture_info)
 
-    def assign_mesh_subset_material(self, usd_mesh, material_name, material_color, material_texture, alpha, material_start_index_face_indices, material_indices_count):
-        # Define the material TODO: check if already exist
-        material_container_path = str(self.material_container_prim.GetPath())
-        material_prim_name = self.get_safe_prim_name(material_name)
-        material_path = material_container_path + material_prim_name
+        self.materials_by_key[material_key] = material
+        self.materials_authored += 1
+        return material
 
-        #materialPrim = self.stage.GetPrimAtPath(material_path)
+    def get_texture_key(self, texture_info):
+        if not texture_info:
+            return None
+        return (
+            texture_info.texture_url,
+            "clamp" if texture_info.texture_repeat_S is None else "repeat",
+            "clamp" if texture_info.texture_repeat_T is None else "repeat"
+        )
 
-        material = UsdShade.Material.Define(self.stage,  material_path)
-        # Create a new pbr shader for each material
-        network = UsdShade.Shader.Define(self.stage, f"{material_path}/PBR_Shader")
-        network.CreateIdAttr("UsdPreviewSurface")
+    def bind_material(self, prim, material):
+        UsdShade.MaterialBindingAPI.Apply(prim)
+        UsdShade.MaterialBindingAPI(prim).Bind(material)
 
-        usd_diffuse = network.CreateInput("diffuseColor", Sdf.ValueTypeNames.Color3f)
-        usd_diffuse.Set(material_color)
-        # TODO: Manage roughness and metallic 
+    def print_materials(self):
+        print(f"Materials registry: {self.materials_hits} hits, {self.materials_misses} misses, {self.materials_authored} material networks authored")
+
+    def assign_mesh_material(self, usd_mesh, material_name, material_color, alpha, texture_info):
+        material = self.get_material(material_name, material_color, alpha, texture_info)
+        self.bind_material(usd_mesh.GetPrim(), material)
 
-        usd_opacity = network.CreateInput("opacity", Sdf.ValueTypeNames.Float)
-        usd_opacity.Set(alpha)  # Set the opacity value for transparency
+    def assign_mesh_subset_material(self, usd_mesh, material_name, material_color, material_texture, alpha, faces_indices):
+        # TODO: manage the texture of subsets materials
+        material = self.get_material(material_name, material_color, alpha, None)
 
-        # Create a new subset for the material, if not already created
-        # we have to initialize it and define indices related to this subset
-        # and bind the material to it
-        # if already created we get it and extend the indices of that subset
-        # otherwise considering we create subste with material name
-        # the subset will be overwritten, causing a wrong material assignment
+        # the subset is named after the material and gets all the faces of the material at once,
+        # if already created (same mesh found again) its indices are replaced
         usd_mesh_path = str(usd_mesh.GetPath())
         subset_name = self.get_safe_prim_name("Subset_" + material_name)
         subset_path = usd_mesh_path + subset_name
-        subset = self.stage.GetPrimAtPath(subset_path)
-
-        if (subset.IsValid()):
-            subset_indices = list(UsdGeom.Subset(subset).GetIndicesAttr().Get())
-            subset_indices_to_merge = list(
-                range(
-                    material_start_index_face_indices,
-                    material_start_index_face_indices + material_indices_count
-                    )
-                )
-
-            subset_indices.extend(subset_indices_to_merge)
-            UsdGeom.Subset(subset).CreateIndicesAttr(subset_indices)
-        else:
-            subset = UsdGeom.Subset.Define(self.stage, subset_path)
-            subset_indices = list(
-                range(
-                    material_start_index_face_indices,
-                    material_start_index_face_indices + material_indices_count
-                )
-            )
-
-            
-
-            subset.CreateIndicesAttr(subset_indices)
-            subset.CreateElementTypeAttr(UsdGeom.Tokens.face)
-            subset.CreateFamilyNameAttr("materialBind")
-            
-            material.CreateSurfaceOutput().ConnectToSource(network.ConnectableAPI(), "surface")
-
-            subset.GetPrim().ApplyAPI(UsdShade.MaterialBindingAPI)
-            UsdShade.MaterialBindingAPI(subset.GetPrim()).Bind(material)
 
-        if (material_texture is not None):
-            pass
-            #self.set_texture(usd_mesh, material_texture, material_path, material, network)
+        subset = UsdGeom.Subset.Define(self.stage, subset_path)
+        subset.CreateIndicesAttr(self.to_vt_array(Vt.IntArray, faces_indices, np.int32))
+        subset.CreateElementTypeAttr(UsdGeom.Tokens.face)
+        subset.CreateFamilyNameAttr("materialBind")
 
+        self.bind_material(subset.GetPrim(), material)
 
-    def set_texture(self, usd_mesh, material_path, material, network, texture_info):
+    def set_texture(self, material_path, material, network, texture_info):
         """
-        Check if for a material created in USD has a 'stReader' in order to\n
-        be able to apply the texture to the mesh
+        create the texture network of a material, the texture is read with the 'st' primvar of the mesh
         """
 
         texture_path = texture_info.texture_url
@@ -301,40 +467,27 @@ class UsdManager():
         
         # TODO: Manage if texture is Diffuse, Normal, Metallic and so on...
         
-        texture_prim_path = f"{material_path}/stReader"
-        texture_prim = self.stage.GetPrimAtPath(texture_prim_path)
-
-        if texture_prim.IsValid():
-            usd_mesh.GetPrim().ApplyAPI(UsdShade.MaterialBindingAPI)
-            UsdShade.MaterialBindingAPI(usd_mesh.GetPrim()).Bind(material)
-        else:
-            stReader = UsdShade.Shader.Define(self.stage, f"{material_path}/stReader")
-            stReader.CreateIdAttr('UsdPrimvarReader_float2')
-
-            stReader.CreateImplementationSourceAttr()
+        stReader = UsdShade.Shader.Define(self.stage, f"{material_path}/stReader")
+        stReader.CreateIdAttr('UsdPrimvarReader_float2')
 
-            diffuse_texture = self.stage.GetPrimAtPath(f"{material_path}/diffuseTexture")
+        stReader.CreateImplementationSourceAttr()
 
-            if diffuse_texture.IsValid() is False:
-                diffuseTextureSampler = UsdShade.Shader.Define(self.stage, f"{material_path}/diffuseTexture")
-                diffuseTextureSampler.CreateIdAttr('UsdUVTexture')
-                diffuseTextureSampler.CreateInput('file', Sdf.ValueTypeNames.Asset).Set(texture_path)
-                diffuseTextureSampler.CreateInput("st", Sdf.ValueTypeNames.Float2).ConnectToSource(stReader.ConnectableAPI(), 'result')
-                diffuseTextureSampler.CreateOutput('rgb', Sdf.ValueTypeNames.Float3)
+        diffuseTextureSampler = UsdShade.Shader.Define(self.stage, f"{material_path}/diffuseTexture")
+        diffuseTextureSampler.CreateIdAttr('UsdUVTexture')
+        diffuseTextureSampler.CreateInput('file', Sdf.ValueTypeNames.Asset).Set(texture_path)
+        diffuseTextureSampler.CreateInput("st", Sdf.ValueTypeNames.Float2).ConnectToSource(stReader.ConnectableAPI(), 'result')
+        diffuseTextureSampler.CreateOutput('rgb', Sdf.ValueTypeNames.Float3)
 
-                # TODO: check all possible values for wrap
-                diffuseTextureSampler.CreateInput('wrapS', Sdf.ValueTypeNames.String).Set("clamp" if texture_repeat_S is None else "repeat" ) # .Set('repeat')
-                diffuseTextureSampler.CreateInput('wrapT', Sdf.ValueTypeNames.String).Set("clamp" if texture_repeat_T is None else "repeat") #.Set('repeat')
+        # TODO: check all possible values for wrap
+        diffuseTextureSampler.CreateInput('wrapS', Sdf.ValueTypeNames.String).Set("clamp" if texture_repeat_S is None else "repeat" ) # .Set('repeat')
+        diffuseTextureSampler.CreateInput('wrapT', Sdf.ValueTypeNames.String).Set("clamp" if texture_repeat_T is None else "repeat") #.Set('repeat')
 
-                network.CreateInput("diffuseColor", Sdf.ValueTypeNames.Color3f).ConnectToSource(diffuseTextureSampler.ConnectableAPI(), 'rgb')
+        network.CreateInput("diffuseColor", Sdf.ValueTypeNames.Color3f).ConnectToSource(diffuseTextureSampler.ConnectableAPI(), 'rgb')
 
-                stInput = material.CreateInput("frame:stPrimVarName", Sdf.ValueTypeNames.String)
-                stInput.Set('st')
+        stInput = material.CreateInput("frame:stPrimVarName", Sdf.ValueTypeNames.String)
+        stInput.Set('st')
 
-                stReader.CreateInput('varname', Sdf.ValueTypeNames.Token).ConnectToSource(stInput)
-
-                usd_mesh.GetPrim().ApplyAPI(UsdShade.MaterialBindingAPI)
-                UsdShade.MaterialBindingAPI(usd_mesh.GetPrim()).Bind(material)
+        stReader.CreateInput('varname', Sdf.ValueTypeNames.Token).ConnectToSource(stInput)
 
 
     def set_mesh_transform(mesh, transform_matrix):
@@ -342,33 +495,43 @@ class UsdManager():
         mesh_transform.AddTransformOp().Set(transform_matrix)
 
     def get_safe_prim_name(self, name):
-        name = unidecode(name)
-        if (len(name) == 0):
-            name = "undefined"
-        if name[0].isdigit():
-            name = "m" + name
-        name = "/" + re.sub("[^a-zA-Z0-9]", "_", name)
-
-        
-        #print("Safe name: ", name)
-        return name
+        return get_safe_prim_name(name)
 
     def create_prim_string_attribute(self, prim, key, value, namespace):
         # make sure no spaces are passed in attribute name
-        namespace = unidecode(namespace)
-        key = unidecode(key)
-        namespace = re.sub("[^a-zA-Z0-9]", "_", namespace)
-        key = re.sub("[^a-zA-Z0-9]", "_", key)
+        namespace = get_safe_identifier(namespace)
+        key = get_safe_identifier(key)
 
         dataAttribute = prim.CreateAttribute(
             f"{namespace}:{key}",
             # Sdf.ValueTypeNames.String
             Sdf.ValueTypeNames.String
         )
-        value = unidecode(value)
+        value = get_ascii_string(value)
         dataAttribute.Set(value)
         dataAttribute.SetVariability(Sdf.VariabilityUniform)
 
+    def create_prim_relationship(self, prim, key, targets_paths, namespace):
+        # make sure no spaces are passed in relationship name
+        namespace = get_safe_identifier(namespace)
+        key = get_safe_identifier(key)
+
+        relationship = prim.CreateRelationship(f"{namespace}:{key}")
+        relationship.SetTargets([Sdf.Path(target_path) for target_path in targets_paths])
+
+    def create_shared_string_prim(self, scope_name, prim_name, key, value, namespace):
+        """
+        create a prim with a string attribute under a root scope (created if needed), to be targeted by other prims.\n
+        return the prim path
+        """
+        scope_path = self.get_safe_prim_name(scope_name)
+        if self.stage.GetPrimAtPath(scope_path).IsValid() is False:
+            self.stage.DefinePrim(scope_path, "Scope")
+
+        prim = self.stage.DefinePrim(scope_path + self.get_safe_prim_name(prim_name))
+        self.create_prim_string_attribute(prim, key, value, namespace)
+        return str(prim.GetPath())
+
     def is_prim_already_created(self, parent_prim, prim_name):
         parent_path = str(parent_prim.GetPath())
         safe_prim_name = self.get_safe_prim_name(prim_name)
@@ -391,5 +554,27 @@ class UsdManager():
         prim = self.stage.GetPrimAtPath(prim_name)
         return prim
 
+    def add_sublayer(self, layer_path):
+        """
+        add a layer (e.g. the output of another conversion) as sublayer of the stage root layer.
+        """
+        self.stage.GetRootLayer().subLayerPaths.append(layer_path)
+
+    def get_authoring_layer(self):
+        """
+        return the layer in which prims are authored
+        """
+        if self.edit_layer is not None:
+            return self.edit_layer
+        return self.stage.GetRootLayer()
+
+    def authoring_block(self):
+        """
+        context in which a batch of prims is authored, the stage API can not define prims in a Sdf.ChangeBlock
+        """
+        return contextlib.nullcontext()
+
     def save_stage(self):
         self.stage.GetRootLayer().Save()
+        if self.edit_layer is not None:
+            self.edit_layer.Save()
@@ -1,35 +1,107 @@
 from converter_utils.ifc2usd_manager import Ifc2UsdManager
+from converter_utils.batch_conversion_manager import BatchConversionManager
+from converter_utils.sharded_conversion_manager import ShardedConversionManager
+from converter_utils.backends_benchmark_manager import BackendsBenchmarkManager
 from converter_utils.args_manager import ArgsManager
 from converter_utils.timer import Timer
 import os
 import traceback
 
-# ---------------- ARGS MANAGEMENT ------------------- #
+# the guard is needed by the --jobs worker processes, which import this module when spawned
+if __name__ == "__main__":
 
-args_manager = ArgsManager()
-input_ifc_files, output_usd_file, ignore_ifc_types, angular_tolerance, deflection_tolerance, generate_uvs,texture, generate_colliders, reuse_geometry = args_manager.manage_arguments()
+    # ---------------- ARGS MANAGEMENT ------------------- #
 
-# ---------------- CONVERSION ------------------- #
+    args_manager = ArgsManager()
+    arguments = args_manager.manage_arguments()
+    input_ifc_files = arguments["input_ifc_files"]
+    output_usd_file = arguments["output_usd_file"]
+    angular_tolerance = arguments["angular_tolerance"]
+    deflection_tolerance = arguments["deflection_tolerance"]
+    jobs = arguments["jobs"]
+    shards = arguments["shards"]
+    shard_by = arguments["shard_by"]
+    verify_shards = arguments["verify_shards"]
+    incremental = arguments["incremental"]
+    metadata_db = arguments["metadata_db"]
+    benchmark_backends = arguments["benchmark_backends"]
+    storey_payloads = arguments["storey_payloads"]
+    lods = arguments["lods"]
+    lod_factor = arguments["lod_factor"]
+    merge_meshes = arguments["merge_meshes"]
+    element_time_budget = arguments["element_time_budget"]
+    element_workers = arguments["element_workers"]
 
-ifc2usd_manager = Ifc2UsdManager(output_usd_file, generate_uvs, ignore_ifc_types, texture, generate_colliders, reuse_geometry)
+    # ---------------- CONVERSION ------------------- #
 
-conversion_timer = Timer("Conversion")
-conversion_timer.start()
+    conversion_timer = Timer("Conversion")
+    conversion_timer.start()
 
-for filepath in input_ifc_files:
-    try:
-        filename = os.path.basename(filepath)
-        file_conversion_timer = Timer(f"{filename} Conversion")
-        file_conversion_timer.start()
+    # Ifc2UsdManager keyword arguments shared by the serial, --jobs, --shards and --benchmark_backends conversions
+    converter_args = {
+        "generate_uvs": arguments["uvs"],
+        "ignore_ifc_types": arguments["ignore_ifc_types"],
+        "take_texture_from_ifc": arguments["texture"],
+        "generate_colliders": arguments["colliders"],
+        "reuse_geometry": arguments["reuse_geometry"],
+        "pipeline_geometry": arguments["pipeline"],
+        "pipeline_queue_size": arguments["queue_size"],
+        "geometry_cache_path": arguments["geometry_cache"],
+        "shared_property_sets": arguments["shared_property_sets"],
+        "include_ifc_types": arguments["include_ifc_types"],
+        "weld": arguments["weld"],
+        "weld_tolerance": arguments["weld_tolerance"],
+        "primvars_encoding": arguments["primvars_encoding"],
+        "omit_flat_normals": arguments["omit_flat_normals"],
+        "usd_backend": arguments["usd_backend"]
+    }
 
-        ifc2usd_manager.convert_ifc_to_usd(filepath,
-                                           angular_tolerance,
-                                           deflection_tolerance)
+    if incremental and (shards > 1 or jobs > 1):
+        print("--incremental works with the serial conversion, --shards and --jobs are ignored")
+        shards = 1
+        jobs = 1
 
-        file_conversion_timer.stop()
-    except Exception as error:
-        print(f"Error -> {error}  --> input ifc file: {filepath}")
-        traceback.print_exc()
+    if storey_payloads and (shards > 1 or jobs > 1 or benchmark_backends):
+        print("--storey_payloads works with the serial conversion, it is ignored")
 
-conversion_timer.stop()
-print(f"Conversion done! output path: {output_usd_file}")
+    if lods > 1 and (shards > 1 or jobs > 1 or benchmark_backends):
+        print("--lods works with the serial conversion, it is ignored")
+
+    if merge_meshes and (shards > 1 or jobs > 1 or benchmark_backends):
+        print("--merge_meshes works with the serial conversion, it is ignored")
+
+    if element_time_budget > 0 and (shards > 1 or jobs > 1 or benchmark_backends):
+        print("--element_time_budget works with the serial conversion, it is ignored")
+
+    if metadata_db is not None and jobs > 1 and shards <= 1:
+        print("--metadata_db is not written by the --jobs conversion, use the serial or --shards conversion")
+
+    if benchmark_backends:
+        backends_benchmark_manager = BackendsBenchmarkManager(output_usd_file, converter_args)
+        backends_benchmark_manager.convert_ifc_files(input_ifc_files, angular_tolerance, deflection_tolerance)
+    elif shards > 1:
+        sharded_conversion_manager = ShardedConversionManager(output_usd_file, shards, shard_by, converter_args, verify_shards, metadata_db)
+        sharded_conversion_manager.convert_ifc_files(input_ifc_files, angular_tolerance, deflection_tolerance)
+    elif jobs > 1:
+        batch_conversion_manager = BatchConversionManager(output_usd_file, jobs, converter_args)
+        batch_conversion_manager.convert_ifc_files(input_ifc_files, angular_tolerance, deflection_tolerance)
+    else:
+        ifc2usd_manager = Ifc2UsdManager(output_usd_file, **converter_args, incremental=incremental, metadata_db_path=metadata_db, storey_payloads=storey_payloads, lods=lods, lod_factor=lod_factor, merge_meshes=merge_meshes, element_time_budget=element_time_budget, element_workers=element_workers)
+
+        for filepath in input_ifc_files:
+            try:
+                filename = os.path.basename(filepath)
+                file_conversion_timer = Timer(f"{filename} Conversion")
+                file_conversion_timer.start()
+
+                ifc2usd_manager.convert_ifc_to_usd(filepath,
+                                                   angular_tolerance,
+                                                   deflection_tolerance)
+
+                file_conversion_timer.stop()
+            except Exception as error:
+                print(f"Error -> {error}  --> input ifc file: {filepath}")
+                traceback.print_exc()
+
+    conversion_timer.stop()
+    print(f"Conversion done! output path: {output_usd_file}")